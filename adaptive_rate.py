@@ -0,0 +1,185 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from config import BulkConfig
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Peso das novas amostras nas médias móveis da latência: a lenta é a referência e a
+# rápida detecta picos sustentados sem reagir a uma única resposta lenta da cauda
+LATENCY_EWMA_ALPHA = 0.05
+RECENT_LATENCY_EWMA_ALPHA = 0.3
+
+# Aumento mínimo (segundos) sobre a latência média para caracterizar um pico
+MIN_LATENCY_SPIKE = 0.05
+
+# Janela (segundos) da medição da vazão real de envios
+THROUGHPUT_WINDOW = 1.0
+
+# Fração da taxa que a vazão precisa atingir para a taxa continuar subindo
+THROUGHPUT_SATURATION = 0.8
+
+class AIMDController:
+    """
+    Taxa de envio adaptativa (AIMD) de uma instância
+
+    Enquanto a Evolution API responde bem, a taxa sobe de forma aditiva
+    (`increase` mensagens/segundo a cada segundo de envios saudáveis); um
+    429, um 5xx, um timeout ou um pico sustentado de latência (`latency_factor`
+    vezes a média) corta a taxa de forma multiplicativa (`decrease`). Os envios que
+    já estavam em andamento no corte refletem a taxa antiga, por isso há no
+    máximo um corte por janela de latência.
+    """
+
+    def __init__(self, rate: float, min_rate: float = BulkConfig.ADAPTIVE_MIN_RATE,
+                 max_rate: float = BulkConfig.ADAPTIVE_MAX_RATE,
+                 increase: float = BulkConfig.ADAPTIVE_INCREASE,
+                 decrease: float = BulkConfig.ADAPTIVE_DECREASE,
+                 latency_factor: float = BulkConfig.ADAPTIVE_LATENCY_FACTOR):
+        self.min_rate = min_rate
+        self.max_rate = max(min_rate, max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.rate = self._clamp(rate)
+        self.latency: Optional[float] = None
+        self.recent_latency: Optional[float] = None
+        self.throughput: Optional[float] = None
+        self.increases = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._window_started = time.monotonic()
+        self._window_count = 0
+
+    def _clamp(self, rate: float) -> float:
+        return min(self.max_rate, max(self.min_rate, rate))
+
+    def _measure_throughput(self, now: float):
+        self._window_count += 1
+        elapsed = now - self._window_started
+        if elapsed >= THROUGHPUT_WINDOW:
+            self.throughput = self._window_count / elapsed
+            self._window_started = now
+            self._window_count = 0
+
+    def observe(self, latency: float, outcome: str, http_status: Optional[int]) -> bool:
+        """
+        Registra o resultado de uma requisição de envio
+
+        Args:
+            latency: Duração da requisição em segundos
+            outcome: Resultado (success, http_error, timeout, transport_error...)
+            http_status: Status HTTP da resposta, se houver
+
+        Returns:
+            bool: True se a taxa mudou
+        """
+        now = time.monotonic()
+        spike = False
+        if outcome == "success":
+            self._measure_throughput(now)
+            if self.latency is None:
+                self.latency = self.recent_latency = latency
+            else:
+                self.recent_latency += RECENT_LATENCY_EWMA_ALPHA * (latency - self.recent_latency)
+                spike = (
+                    self.recent_latency > self.latency * self.latency_factor
+                    and self.recent_latency - self.latency > MIN_LATENCY_SPIKE
+                )
+                # A referência acompanha também os picos, para absorver mudanças permanentes de latência
+                self.latency += LATENCY_EWMA_ALPHA * (latency - self.latency)
+
+        congested = (
+            spike
+            or outcome in ("timeout", "transport_error")
+            or http_status == 429
+            or (http_status is not None and http_status >= 500)
+        )
+
+        if congested:
+            cooldown = max(self.latency or latency, 1 / self.rate)
+            if now - self._last_decrease < cooldown:
+                return False
+            self._last_decrease = now
+            previous, self.rate = self.rate, self._clamp(self.rate * self.decrease)
+            self.decreases += 1
+            logger.info(
+                f"Taxa adaptativa reduzida de {previous:.2f} para {self.rate:.2f} msg/s "
+                f"({outcome}, status {http_status}, latência {latency * 1000:.0f} ms)"
+            )
+            return self.rate != previous
+
+        if outcome != "success":
+            # Erros do cliente (ex: número inválido) não dizem nada sobre a capacidade
+            return False
+        if self.throughput is not None and self.throughput < self.rate * THROUGHPUT_SATURATION:
+            # A taxa não é o gargalo (concorrência ou latência limitam a vazão): não subir mais
+            return False
+
+        previous, self.rate = self.rate, self._clamp(self.rate + self.increase / self.rate)
+        if self.rate != previous:
+            self.increases += 1
+            return True
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rate_per_second": round(self.rate, 3),
+            "throughput_per_second": round(self.throughput, 3) if self.throughput is not None else None,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "increases": self.increases,
+            "decreases": self.decreases
+        }
+
+class AdaptiveRate:
+    """Controladores AIMD das instâncias de uma campanha"""
+
+    def __init__(self):
+        self.controllers: Dict[str, AIMDController] = {}
+        # Fila compartilhada: estado publicado pelos processos consumidores (processo -> instância -> estado)
+        self.remote: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Último estado publicado de cada instância, por qualquer processo
+        self.remote_instances: Dict[str, Dict[str, Any]] = {}
+
+    def controller(self, instance: str, rate: float, weight: float = 1.0) -> AIMDController:
+        """Retorna o controlador da instância, criando-o com a taxa inicial e limites proporcionais ao peso"""
+        controller = self.controllers.get(instance)
+        if controller is None:
+            controller = self.controllers[instance] = AIMDController(
+                rate,
+                min_rate=BulkConfig.ADAPTIVE_MIN_RATE * weight,
+                max_rate=BulkConfig.ADAPTIVE_MAX_RATE * weight,
+                increase=BulkConfig.ADAPTIVE_INCREASE * weight
+            )
+        return controller
+
+    def instances_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: controller.to_dict() for name, controller in self.controllers.items()}
+
+    def update_remote(self, consumer: str, instances: Dict[str, Dict[str, Any]]):
+        """Registra o estado dos controladores publicado por um processo consumidor da fila compartilhada"""
+        self.remote.setdefault(consumer, {}).update(instances)
+        self.remote_instances.update(instances)
+
+    def to_dict(self) -> Dict[str, Any]:
+        if not self.remote:
+            instances = self.instances_dict()
+            return {
+                "effective_rate": round(sum(i["rate_per_second"] for i in instances.values()), 3),
+                "instances": instances
+            }
+        # O bucket compartilhado de cada instância adota a taxa da última reserva:
+        # a taxa efetiva é a do estado publicado mais recentemente
+        return {
+            "effective_rate": round(sum(i["rate_per_second"] for i in self.remote_instances.values()), 3),
+            "instances": self.remote_instances,
+            "consumers": {
+                consumer: {
+                    "effective_rate": round(sum(i["rate_per_second"] for i in instances.values()), 3),
+                    "instances": instances
+                }
+                for consumer, instances in self.remote.items()
+            }
+        }
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga ponta a ponta
+Dispara envios contra /api/send-message e /api/send-bulk-messages e mede
+vazão, percentis de latência e memória do servidor.
+
+Com --spawn o próprio script sobe o simulador da Evolution API
+(mock_evolution.py) e a aplicação apontando para ele, sem nenhum servidor
+real. Exemplos:
+
+    python benchmark_carga.py --spawn
+    python benchmark_carga.py --spawn --scenario bulk --contacts 5000 --mock-latency-ms 300 --mock-rate-limit 50
+    python benchmark_carga.py --target http://localhost:8000 --pid 1234 --json resultado.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Intervalo (segundos) da amostragem de memória do servidor
+MEMORY_SAMPLE_INTERVAL = 0.2
+
+# Intervalo (segundos) da consulta de progresso dos jobs em segundo plano
+JOB_POLL_INTERVAL = 0.25
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p90/p99/máximo em milissegundos"""
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def at(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+
+    return {"p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": round(ordered[-1] * 1000, 1)}
+
+def read_memory(pid: int) -> Optional[Dict[str, float]]:
+    """RSS atual e pico (MB) de um processo, lidos de /proc (apenas Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+    except OSError:
+        return None
+    to_mb = lambda name: round(int(fields[name].split()[0]) / 1024, 1) if name in fields else None
+    return {"rss_mb": to_mb("VmRSS"), "peak_rss_mb": to_mb("VmHWM")}
+
+class MemorySampler:
+    """Acompanha o maior RSS do servidor durante um cenário"""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.before: Optional[Dict[str, float]] = None
+        self.max_rss_mb = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self):
+        while True:
+            memory = read_memory(self.pid)
+            if memory and memory["rss_mb"]:
+                self.max_rss_mb = max(self.max_rss_mb, memory["rss_mb"])
+            await asyncio.sleep(MEMORY_SAMPLE_INTERVAL)
+
+    def start(self):
+        if self.pid is not None:
+            self.before = read_memory(self.pid)
+            self._task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> Optional[Dict[str, Any]]:
+        if self._task is None:
+            return None
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        after = read_memory(self.pid) or {}
+        return {
+            "rss_before_mb": (self.before or {}).get("rss_mb"),
+            "rss_after_mb": after.get("rss_mb"),
+            "rss_max_sampled_mb": self.max_rss_mb or None,
+            "peak_rss_mb": after.get("peak_rss_mb")
+        }
+
+def contact(i: int) -> Dict[str, str]:
+    return {"name": f"Contato {i}", "phone": f"+55119{i % 100000000:08d}"}
+
+async def mock_stats(client: httpx.AsyncClient, mock_url: Optional[str], reset: bool = False) -> Optional[Dict[str, Any]]:
+    """Estatísticas do simulador (None quando o alvo usa uma Evolution API real)"""
+    if not mock_url:
+        return None
+    try:
+        if reset:
+            await client.post(f"{mock_url}/mock/reset")
+            return None
+        response = await client.get(f"{mock_url}/mock/stats")
+        data = response.json()
+        data.pop("settings", None)
+        return data
+    except httpx.HTTPError:
+        return None
+
+async def run_single(client: httpx.AsyncClient, target: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    """N envios individuais com `concurrency` requisições simultâneas"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            payload = {**contact(i), "message": f"Benchmark {i}"}
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{target}/api/send-message", json=payload)
+                key = str(response.status_code) if response.status_code != 200 else (
+                    "ok" if response.json().get("success") else "falha"
+                )
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(requests / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": percentiles(latencies),
+        "results": statuses
+    }
+
+async def run_bulk(client: httpx.AsyncClient, target: str, contacts: int, rate: Optional[float],
+                   concurrency: Optional[int], background: bool, adaptive: bool) -> Dict[str, Any]:
+    """Uma campanha em massa com `contacts` contatos (síncrona ou em segundo plano)"""
+    payload: Dict[str, Any] = {
+        "contacts": [contact(i) for i in range(contacts)],
+        "message": "Benchmark {{name}}",
+        "background": background,
+        "adaptive_rate": adaptive
+    }
+    if rate:
+        payload["rate_per_second"] = rate
+    else:
+        payload["delay"] = 0
+    if concurrency:
+        payload["concurrency"] = concurrency
+
+    started = time.perf_counter()
+    response = await client.post(f"{target}/api/send-bulk-messages", json=payload)
+    response.raise_for_status()
+    data = response.json()
+    accepted_in = time.perf_counter() - started
+
+    if background:
+        job_id = data["job_id"]
+        while True:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            data = (await client.get(f"{target}/api/jobs/{job_id}", params={"include_results": "false"})).json()
+            if data.get("status") in ("completed", "failed", "cancelled"):
+                break
+        successful, failed = data["successful_sends"], data["failed_sends"]
+    else:
+        successful, failed = data.get("successful_sends", 0), data.get("failed_sends", 0)
+
+    elapsed = time.perf_counter() - started
+    result = {
+        "contacts": contacts,
+        "background": background,
+        "rate_per_second": rate,
+        "elapsed_seconds": round(elapsed, 3),
+        "request_accepted_ms": round(accepted_in * 1000, 1),
+        "successful": successful,
+        "failed": failed,
+        "messages_per_second": round((successful + failed) / elapsed, 2) if elapsed > 0 else 0.0
+    }
+    if background and data.get("adaptive_rate"):
+        result["adaptive_rate"] = data["adaptive_rate"]
+    return result
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} não respondeu em {timeout:g}s")
+
+def spawn_servers(args: argparse.Namespace) -> List[subprocess.Popen]:
+    """Sobe o simulador e a aplicação apontando para ele; retorna [simulador, aplicação]"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    mock_port, app_port = free_port(), free_port()
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(here, "mock_evolution.py"), "--port", str(mock_port),
+        "--instances", args.mock_instances,
+        "--latency-ms", str(args.mock_latency_ms), "--latency-dist", args.mock_latency_dist,
+        "--error-rate", str(args.mock_error_rate), "--rate-limit", str(args.mock_rate_limit)
+    ], cwd=here, stdout=subprocess.DEVNULL)
+    env = {
+        **os.environ,
+        "EVOLUTION_SERVER_URL": f"http://127.0.0.1:{mock_port}",
+        "EVOLUTION_API_KEY": "mock-key",
+        "EVOLUTION_INSTANCE_ID": args.mock_instances.split(",")[0].split(":")[0],
+        "EVOLUTION_INSTANCE_POOL": ",".join(item.split(":")[0] for item in args.mock_instances.split(",")),
+        "LOG_LEVEL": "warning",
+        "DATABASE_URL": "",
+        "BULK_WORK_QUEUE": "local"
+    }
+    app = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+        "--log-level", "warning", "--no-access-log"
+    ], cwd=here, env=env)
+    args.target = f"http://127.0.0.1:{app_port}"
+    args.mock_url = f"http://127.0.0.1:{mock_port}"
+    args.pid = app.pid
+    return [mock, app]
+
+def print_report(report: Dict[str, Any]):
+    print("\n=== RESULTADO DO BENCHMARK ===")
+    for name, result in report["scenarios"].items():
+        print(f"\n📊 Cenário: {name}")
+        for key, value in result.items():
+            print(f"   {key}: {value}")
+    print()
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    await wait_until_up(f"{args.target}/api/health")
+    if args.mock_url:
+        await wait_until_up(f"{args.mock_url}/mock/stats")
+
+    report: Dict[str, Any] = {"target": args.target, "scenarios": {}}
+    limits = httpx.Limits(max_connections=max(args.concurrency, 10), max_keepalive_connections=max(args.concurrency, 10))
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        scenarios = ["single", "bulk"] if args.scenario == "all" else [args.scenario]
+        for scenario in scenarios:
+            await mock_stats(client, args.mock_url, reset=True)
+            sampler = MemorySampler(args.pid)
+            sampler.start()
+            if scenario == "single":
+                result = await run_single(client, args.target, args.requests, args.concurrency)
+            else:
+                result = await run_bulk(
+                    client, args.target, args.contacts, args.bulk_rate, args.bulk_concurrency,
+                    args.background, args.adaptive
+                )
+            memory = await sampler.stop()
+            if memory:
+                result["memory"] = memory
+            stats = await mock_stats(client, args.mock_url)
+            if stats:
+                result["mock"] = stats
+            report["scenarios"][scenario] = result
+    return report
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark de carga da API de mensagens")
+    parser.add_argument("--target", default="http://localhost:8000", help="URL da aplicação")
+    parser.add_argument("--mock-url", default=None, help="URL do simulador, para incluir suas estatísticas")
+    parser.add_argument("--pid", type=int, default=None, help="PID do servidor para medir a memória")
+    parser.add_argument("--spawn", action="store_true", help="Subir simulador e aplicação localmente")
+    parser.add_argument("--scenario", choices=("single", "bulk", "all"), default="all")
+    parser.add_argument("--requests", type=int, default=500, help="Envios individuais")
+    parser.add_argument("--concurrency", type=int, default=50, help="Envios individuais simultâneos")
+    parser.add_argument("--contacts", type=int, default=1000, help="Contatos da campanha em massa")
+    parser.add_argument("--bulk-rate", type=float, default=None, help="rate_per_second da campanha (padrão: sem limite)")
+    parser.add_argument("--bulk-concurrency", type=int, default=None, help="concurrency da campanha")
+    parser.add_argument("--background", action="store_true", help="Campanha em segundo plano (job)")
+    parser.add_argument("--adaptive", action="store_true", help="Campanha com adaptive_rate")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Timeout das requisições (segundos)")
+    parser.add_argument("--json", default=None, help="Gravar o relatório neste arquivo JSON")
+    parser.add_argument("--mock-instances", default="rodolfo")
+    parser.add_argument("--mock-latency-ms", type=float, default=100.0)
+    parser.add_argument("--mock-latency-dist", default="lognormal")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-rate-limit", type=float, default=0.0)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    processes = spawn_servers(args) if args.spawn else []
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+        print(f"💾 Relatório gravado em {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks do trabalho de CPU por contato
+Mede validação dos contatos, formatação das mensagens, montagem dos
+resultados do envio em massa e serialização JSON da resposta, em listas de
+1 mil, 100 mil e 1 milhão de contatos, sem rede (os envios são simulados).
+
+Uso:
+    python benchmark_micro.py                                # 1k e 100k
+    python benchmark_micro.py --sizes 1000,100000,1000000 --save baseline.json
+    python benchmark_micro.py --compare baseline.json        # marca regressões (código de saída 1)
+
+As baselines dependem da máquina: gere e compare no mesmo ambiente.
+"""
+
+import os
+
+# Sem verificação de status das instâncias: o envio em massa roda sem rede
+os.environ.setdefault("BULK_INSTANCE_HEALTH_INTERVAL", "0")
+
+import argparse
+import asyncio
+import gc
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from bulk_results import ResultStore, stream_json
+from message_templates import compile_template
+from models import BulkMessageRequest, ContactInfo, MessageResponse
+from phone_utils import dedupe_contacts, phone_normalizer
+from whatsapp_service import WhatsAppService
+
+# Tamanhos padrão das listas (1 milhão via --sizes)
+DEFAULT_SIZES = (1000, 100000)
+
+# Duração mínima (segundos) de cada medição: listas pequenas são executadas várias vezes
+MIN_MEASURE_SECONDS = 0.2
+
+# Aumento tolerado do tempo por contato antes de acusar regressão
+DEFAULT_THRESHOLD = 0.15
+
+MESSAGE = "Seu pedido {{pedido}} foi enviado para {{cidade|sua cidade}}. Obrigado pela preferência!"
+
+class OfflineWhatsAppService(WhatsAppService):
+    """Serviço cujo envio responde sucesso imediatamente, para medir só o custo local"""
+
+    async def send_message(self, phone: str, text: str, instance: Optional[str] = None, **kwargs) -> MessageResponse:
+        return MessageResponse(success=True, message_id="BENCHMARK", sent_to=phone)
+
+def contact_payloads(size: int) -> List[Dict[str, Any]]:
+    """Contatos como chegam no JSON da requisição, com formatos de telefone variados"""
+    formats = ("+55119{:08d}", "119{:08d}", "(11) 9{:04d}-{:04d}", "55119{:08d}")
+    payloads = []
+    for i in range(size):
+        kind = i % len(formats)
+        number = i % 100000000
+        phone = formats[kind].format(number // 10000, number % 10000) if kind == 2 else formats[kind].format(number)
+        payloads.append({"name": f"Contato {i}", "phone": phone, "variables": {"pedido": i, "cidade": "São Paulo"}})
+    return payloads
+
+def result_dicts(size: int) -> List[Dict[str, Any]]:
+    return [{
+        "name": f"Contato {i}",
+        "phone": f"+55119{i % 100000000:08d}",
+        "success": True,
+        "message_id": f"3EB0{i:016X}",
+        "error": None,
+        "instance": "rodolfo"
+    } for i in range(size)]
+
+# Cada benchmark recebe o tamanho e retorna a função medida (a preparação fica fora da medição)
+
+def bench_contact_validation(size: int) -> Callable[[], Any]:
+    """BulkMessageRequest com `size` contatos: pydantic + normalização dos telefones (cache frio)"""
+    body = {"contacts": contact_payloads(size), "message": MESSAGE}
+
+    def run():
+        phone_normalizer.cache_clear()
+        return BulkMessageRequest.model_validate(body)
+    return run
+
+def bench_contact_validation_warm(size: int) -> Callable[[], Any]:
+    """Mesma validação com os telefones já no cache (lista reenviada)"""
+    body = {"contacts": contact_payloads(size), "message": MESSAGE}
+    BulkMessageRequest.model_validate(body)
+    return lambda: BulkMessageRequest.model_validate(body)
+
+def bench_dedupe(size: int) -> Callable[[], Any]:
+    contacts = [ContactInfo.model_construct(**payload) for payload in contact_payloads(size)]
+    return lambda: dedupe_contacts(contacts)
+
+def bench_format_message(size: int) -> Callable[[], Any]:
+    """format_message por contato (caminho do envio individual, template em cache)"""
+    service = OfflineWhatsAppService()
+    contacts = [ContactInfo.model_construct(**payload) for payload in contact_payloads(size)]
+
+    def run():
+        for contact in contacts:
+            service.format_message(contact.name, MESSAGE, contact.phone, contact.variables)
+    return run
+
+def bench_template_render(size: int) -> Callable[[], Any]:
+    """Template compilado uma vez e renderizado por contato (caminho do envio em massa)"""
+    contacts = [ContactInfo.model_construct(**payload) for payload in contact_payloads(size)]
+    template = compile_template(MESSAGE, True)
+
+    def run():
+        for contact in contacts:
+            template.render(contact.name, contact.phone, contact.variables)
+    return run
+
+def bench_bulk_results(size: int) -> Callable[[], Any]:
+    """send_bulk_messages completo com envio simulado: fila, workers e dicts de resultado"""
+    service = OfflineWhatsAppService()
+    request = BulkMessageRequest.model_validate({"contacts": contact_payloads(size), "message": MESSAGE, "delay": 0})
+    return lambda: asyncio.run(service.send_bulk_messages(request))
+
+def bench_json_response(size: int) -> Callable[[], Any]:
+    """Resultados no armazenamento compacto e corpo da resposta síncrona do envio em massa gerado em streaming"""
+    summary = {"success": True, "total_contacts": size, "successful_sends": size, "failed_sends": 0, "duplicates_removed": 0}
+    rows = result_dicts(size)
+
+    def run():
+        store = ResultStore()
+        for row in rows:
+            store.append(row)
+        return b"".join(stream_json(summary, store))
+    return run
+
+BENCHMARKS: Dict[str, Callable[[int], Callable[[], Any]]] = {
+    "contact_validation": bench_contact_validation,
+    "contact_validation_warm": bench_contact_validation_warm,
+    "dedupe": bench_dedupe,
+    "format_message": bench_format_message,
+    "template_render": bench_template_render,
+    "bulk_results": bench_bulk_results,
+    "json_response": bench_json_response
+}
+
+def measure(run: Callable[[], Any], repeat: int) -> List[float]:
+    """Tempo de uma execução em cada repetição (média de quantas couberem em MIN_MEASURE_SECONDS)"""
+    started = time.perf_counter()
+    run()
+    number = max(1, math.ceil(MIN_MEASURE_SECONDS / max(time.perf_counter() - started, 1e-9)))
+
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        for _ in range(number):
+            run()
+        timings.append((time.perf_counter() - started) / number)
+    return timings
+
+def run_benchmarks(names: List[str], sizes: List[int], repeat: int) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, Any]] = {}
+    for name in names:
+        for size in sizes:
+            run = BENCHMARKS[name](size)
+            # Listas grandes: menos repetições para o suite continuar viável
+            timings = measure(run, repeat if size < 1000000 else max(1, repeat // 2))
+            best = min(timings)
+            results[f"{name}@{size}"] = {
+                "benchmark": name,
+                "size": size,
+                "best_seconds": round(best, 6),
+                "median_seconds": round(statistics.median(timings), 6),
+                "per_contact_us": round(best / size * 1e6, 3),
+                "repeat": len(timings)
+            }
+            print(f"  {name:<24} {size:>9,}  {best:>9.4f}s  {best / size * 1e6:>9.3f} µs/contato")
+            del run
+            gc.collect()
+    return {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Compara o tempo por contato com a baseline e retorna as regressões"""
+    if baseline.get("python") != current["python"] or baseline.get("platform") != current["platform"]:
+        print(f"⚠️  Baseline gerada em outro ambiente ({baseline.get('python')}, {baseline.get('platform')})")
+
+    regressions = []
+    print(f"\n{'benchmark':<34} {'baseline':>12} {'atual':>12} {'variação':>9}")
+    for key, result in current["results"].items():
+        reference = baseline.get("results", {}).get(key)
+        if reference is None:
+            print(f"{key:<34} {'-':>12} {result['per_contact_us']:>10.3f}µs {'novo':>9}")
+            continue
+        change = result["per_contact_us"] / reference["per_contact_us"] - 1 if reference["per_contact_us"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  ❌ regressão"
+            regressions.append(key)
+        elif change < -threshold:
+            flag = "  ✅ melhora"
+        print(f"{key:<34} {reference['per_contact_us']:>10.3f}µs {result['per_contact_us']:>10.3f}µs {change:>+8.1%}{flag}")
+    return regressions
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Microbenchmarks do processamento por contato")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Tamanhos das listas separados por vírgula (ex: 1000,100000,1000000)")
+    parser.add_argument("--only", default=None, help=f"Benchmarks separados por vírgula ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetições por medição (vale o melhor tempo)")
+    parser.add_argument("--save", default=None, help="Gravar os resultados como baseline neste arquivo")
+    parser.add_argument("--compare", default=None, help="Comparar com a baseline deste arquivo")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Aumento do tempo por contato considerado regressão (0.15 = 15%%)")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    names = [name.strip() for name in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Benchmark desconhecido: {', '.join(unknown)}")
+
+    print("=== MICROBENCHMARKS POR CONTATO ===\n")
+    current = run_benchmarks(names, sizes, max(1, args.repeat))
+
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(current, output, indent=2)
+        print(f"\n💾 Baseline gravada em {args.save}")
+
+    if args.compare:
+        with open(args.compare) as source:
+            baseline = json.load(source)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressão(ões) acima de {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\n✅ Nenhuma regressão acima de {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
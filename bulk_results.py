@@ -0,0 +1,209 @@
+import json
+import os
+import tempfile
+from array import array
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import BulkConfig
+
+# Um offset no arquivo a cada INDEX_EVERY resultados (para posicionar a paginação)
+INDEX_EVERY = 256
+
+# Bloco lido do arquivo e tamanho aproximado de cada pedaço do download em streaming
+READ_BLOCK_SIZE = 64 * 1024
+
+# Mensagens de erro e instâncias distintas compartilhadas entre os resultados
+MAX_INTERNED = 1000
+
+def _encode(row: Dict[str, Any]) -> bytes:
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class ResultStore:
+    """
+    Resultados de um envio em massa em formato compacto
+
+    Em memória os resultados ficam em colunas (sem um dict por contato), com
+    as mensagens de erro e as instâncias repetidas compartilhadas. Acima de
+    `memory_limit` resultados, eles passam para um arquivo temporário NDJSON
+    e a memória usada deixa de crescer com a lista. Os resultados só são
+    acrescentados, então a posição serve de cursor para a paginação.
+    """
+
+    def __init__(self, memory_limit: int = BulkConfig.RESULTS_MEMORY_LIMIT,
+                 directory: Optional[str] = BulkConfig.SPOOL_DIR):
+        self.memory_limit = memory_limit
+        self.directory = directory
+        self.count = 0
+        self._names: List[str] = []
+        self._phones: List[str] = []
+        self._success = bytearray()
+        self._message_ids: List[Optional[str]] = []
+        self._errors: List[Optional[str]] = []
+        self._instances: List[Optional[str]] = []
+        self._interned: Dict[str, str] = {}
+        # Arquivo temporário (sem nome: removido pelo sistema ao fechar) e offset de cada bloco de resultados
+        self._file = None
+        self._offsets = array("Q")
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def _intern(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        shared = self._interned.get(value)
+        if shared is not None:
+            return shared
+        if len(self._interned) < MAX_INTERNED:
+            self._interned[value] = value
+        return value
+
+    def append(self, result: Dict[str, Any]):
+        row = {
+            "name": result.get("name"),
+            "phone": result.get("phone"),
+            "success": bool(result.get("success")),
+            "message_id": result.get("message_id"),
+            "error": self._intern(result.get("error")),
+            "instance": self._intern(result.get("instance"))
+        }
+        if self._file is None and self.count >= self.memory_limit:
+            self._spill()
+        if self._file is not None:
+            self._write(row)
+        else:
+            self._names.append(row["name"])
+            self._phones.append(row["phone"])
+            self._success.append(row["success"])
+            self._message_ids.append(row["message_id"])
+            self._errors.append(row["error"])
+            self._instances.append(row["instance"])
+        self.count += 1
+
+    def _write(self, row: Dict[str, Any]):
+        if self.count % INDEX_EVERY == 0:
+            self._offsets.append(self._size)
+        line = _encode(row) + b"\n"
+        self._file.write(line)
+        self._size += len(line)
+
+    def _spill(self):
+        """Passa os resultados em memória para o arquivo temporário"""
+        self._file = tempfile.TemporaryFile(prefix="results-", suffix=".ndjson", dir=self.directory)
+        rows = [self._row(i) for i in range(self.count)]
+        self.count = 0
+        for row in rows:
+            self._write(row)
+            self.count += 1
+        self._names, self._phones, self._success = [], [], bytearray()
+        self._message_ids, self._errors, self._instances = [], [], []
+
+    def _row(self, index: int) -> Dict[str, Any]:
+        return {
+            "name": self._names[index],
+            "phone": self._phones[index],
+            "success": bool(self._success[index]),
+            "message_id": self._message_ids[index],
+            "error": self._errors[index],
+            "instance": self._instances[index]
+        }
+
+    def _disk_lines(self, start: int, stop: int) -> Iterator[bytes]:
+        """Linhas gravadas de `start` até `stop` (exclusivo), lidas sem mover a posição de escrita"""
+        if start >= stop:
+            return
+        self._file.flush()
+        fd = self._file.fileno()
+        offset = self._offsets[start // INDEX_EVERY]
+        index = start - start % INDEX_EVERY
+        end = self._size
+        pending = b""
+        while offset < end and index < stop:
+            block = os.pread(fd, min(READ_BLOCK_SIZE, end - offset), offset)
+            if not block:
+                break
+            offset += len(block)
+            lines = (pending + block).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if index >= start:
+                    yield line
+                index += 1
+                if index >= stop:
+                    return
+
+    def iter_rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Resultados a partir de `start` (até os já registrados quando a iteração começa)"""
+        stop = self.count if stop is None else min(stop, self.count)
+        if self._file is None:
+            for index in range(start, stop):
+                yield self._row(index)
+        else:
+            for line in self._disk_lines(start, stop):
+                yield json.loads(line)
+
+    def page(self, cursor: int = 0, limit: int = BulkConfig.RESULTS_PAGE_SIZE) -> Dict[str, Any]:
+        """Página de resultados com o cursor da próxima (None quando não há mais resultados registrados)"""
+        cursor = max(cursor, 0)
+        results = list(islice(self.iter_rows(cursor, cursor + limit), limit))
+        next_cursor = cursor + len(results)
+        return {"results": results, "next_cursor": next_cursor if next_cursor < self.count else None}
+
+    def iter_ndjson(self, start: int = 0) -> Iterator[bytes]:
+        """Resultados em NDJSON, em pedaços de ~64 KB (para respostas em streaming)"""
+        chunk: List[bytes] = []
+        size = 0
+        if self._file is None:
+            lines = (_encode(row) for row in self.iter_rows(start))
+        else:
+            lines = self._disk_lines(start, self.count)
+        for line in lines:
+            chunk.append(line)
+            size += len(line) + 1
+            if size >= READ_BLOCK_SIZE:
+                yield b"\n".join(chunk) + b"\n"
+                chunk, size = [], 0
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+
+    def close(self):
+        """Libera os resultados (remove o arquivo temporário)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._names, self._phones, self._success = [], [], bytearray()
+        self._message_ids, self._errors, self._instances = [], [], []
+        self._offsets = array("Q")
+        self.count = 0
+
+def stream_json(summary: Dict[str, Any], store: ResultStore) -> Iterator[bytes]:
+    """
+    Corpo JSON `{...summary, "results": [...]}` gerado aos pedaços
+
+    Evita montar a lista completa e a resposta inteira em memória. O store é
+    fechado ao final.
+    """
+    try:
+        yield _encode(summary)[:-1] + (b',"results":[' if summary else b'"results":[')
+        first = True
+        for chunk in store.iter_ndjson():
+            body = chunk[:-1].replace(b"\n", b",")
+            yield body if first else b"," + body
+            first = False
+        yield b"]}"
+    finally:
+        store.close()
+
+def stream_ndjson(summary: Dict[str, Any], store: ResultStore) -> Iterator[bytes]:
+    """Uma linha `{"summary": ...}` seguida de um resultado por linha; o store é fechado ao final"""
+    try:
+        yield _encode({"summary": summary}) + b"\n"
+        yield from store.iter_ndjson()
+    finally:
+        store.close()
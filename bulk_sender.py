@@ -0,0 +1,298 @@
+import asyncio
+import logging
+from typing import Dict, Any, AsyncIterable, AsyncIterator, Callable, Iterable, List, Optional, Tuple, Union
+
+from adaptive_rate import AdaptiveRate
+from config import BulkConfig, EvolutionAPIConfig
+from instance_pool import InstancePool
+from metrics import record_send
+from message_templates import compile_template
+from models import BulkMessageRequest, ContactInfo
+from rate_limiter import RateLimiterRegistry, SharedRateLimiterRegistry
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Sinaliza o fim da fila de contatos / de um worker
+_DONE = object()
+
+# Tentativas de um contato cujo envio falhou porque a instância caiu durante a campanha
+MAX_REROUTES = 2
+
+# Intervalo mínimo (segundos) entre verificações de status disparadas por falhas de envio
+FAILURE_REFRESH_INTERVAL = 2.0
+
+def resolve_pacing(request: BulkMessageRequest) -> Tuple[Optional[float], int]:
+    """
+    Determina a taxa (mensagens/segundo) e o burst de uma campanha
+
+    `rate_per_second` tem prioridade; sem ele, o `delay` legado é convertido
+    em taxa (delay de 1000 ms = 1 mensagem/segundo). Delay 0 desativa o limite,
+    exceto com taxa adaptativa, que parte de DEFAULT_MESSAGE_DELAY.
+    """
+    burst = request.burst or BulkConfig.DEFAULT_BURST
+    if request.rate_per_second:
+        return request.rate_per_second, burst
+    if request.delay and request.delay > 0:
+        return 1000 / request.delay, burst
+    if request.adaptive_rate:
+        return 1000 / EvolutionAPIConfig.DEFAULT_MESSAGE_DELAY, burst
+    return None, burst
+
+def resolve_instances(whatsapp_service, request: BulkMessageRequest) -> Dict[str, float]:
+    """Pesos das instâncias da campanha: as escolhidas na requisição ou o pool configurado"""
+    pool = whatsapp_service.config.INSTANCE_POOL
+    if request.instances:
+        return {name: pool.get(name, 1.0) for name in request.instances}
+    return dict(pool)
+
+class BulkSender:
+    """
+    Envia uma campanha distribuindo os contatos entre as instâncias do pool
+
+    Os contatos passam por uma fila compartilhada consumida por workers; cada
+    envio é direcionado à instância disponível cujo token bucket libera o
+    próximo envio mais cedo, de modo que a taxa de cada instância (proporcional
+    ao seu peso) é preenchida sem esperar o round-trip da mensagem anterior.
+    Instâncias desconectadas durante a campanha são drenadas e os contatos
+    restantes seguem para as instâncias saudáveis; sem nenhuma instância
+    conectada, os envios aguardam uma reconexão por até
+    BULK_INSTANCE_WAIT_TIMEOUT antes de falhar.
+    """
+
+    def __init__(self, whatsapp_service, request: BulkMessageRequest,
+                 contacts: Optional[Union[Iterable[ContactInfo], AsyncIterable[ContactInfo]]] = None,
+                 journal=None, shared_rate_limits=None, adaptive: Optional[AdaptiveRate] = None):
+        self.whatsapp_service = whatsapp_service
+        self.request = request
+        # Fonte dos contatos: a lista da requisição ou um iterável assíncrono (upload em streaming);
+        # fontes com `numbered = True` já produzem pares (seq, contato)
+        self.contacts = contacts if contacts is not None else request.contacts
+        # Registro opcional das transições de estado de cada envio (outbox persistente)
+        self.journal = journal
+        # Template compilado uma vez para toda a campanha
+        self.template = compile_template(request.message, request.use_default_layout)
+        # Mídia da campanha, codificada uma única vez e reusada em todos os envios
+        self.media = None
+        if request.media_id:
+            self.media = whatsapp_service.media.get(request.media_id)
+            if self.media is None:
+                raise ValueError(f"Mídia {request.media_id} não encontrada")
+        weights = resolve_instances(whatsapp_service, request)
+        self.pool = InstancePool(weights)
+        rate, burst = resolve_pacing(request)
+        if shared_rate_limits is not None:
+            # Limites mantidos na fila compartilhada, valendo para todos os processos
+            self.rate_limiters = SharedRateLimiterRegistry(shared_rate_limits, rate, burst, weights)
+        else:
+            self.rate_limiters = RateLimiterRegistry(rate, burst, weights)
+        # Controle adaptativo da taxa (AIMD); o job pode fornecer o seu para exibir a taxa no status
+        self.adaptive = None
+        if request.adaptive_rate and rate is not None:
+            self.adaptive = adaptive if adaptive is not None else AdaptiveRate()
+        self.concurrency = (request.concurrency or BulkConfig.DEFAULT_CONCURRENCY) * len(weights)
+        self._refresh_lock = asyncio.Lock()
+        self._acquire_lock = asyncio.Lock()
+        self._last_refresh = 0.0
+        # Desde quando nenhuma instância está disponível (None: há instâncias)
+        self._unavailable_since: Optional[float] = None
+        # Erro da fonte de contatos, repassado por run() depois dos envios em andamento
+        self._source_error: Optional[Exception] = None
+
+    async def _refresh_after_failure(self):
+        """Reavalia o status das instâncias após uma falha, no máximo uma vez por intervalo"""
+        async with self._refresh_lock:
+            now = asyncio.get_running_loop().time()
+            if now - self._last_refresh < FAILURE_REFRESH_INTERVAL:
+                return
+            self._last_refresh = now
+            await self.pool.refresh(self.whatsapp_service)
+
+    async def _acquire_instance(self) -> Optional[str]:
+        """Aguarda o próximo envio liberado e retorna a instância que o fará"""
+        # Os workers aguardam em ordem de chegada para preservar a ordem da lista
+        async with self._acquire_lock:
+            return await self._next_instance()
+
+    async def _wait_for_instance(self) -> bool:
+        """
+        Aguarda uma instância voltar ao pool quando todas estão drenadas
+
+        O prazo (BULK_INSTANCE_WAIT_TIMEOUT) conta desde que a última
+        instância saiu: esgotado, os contatos seguintes falham na hora até
+        uma instância ser readmitida.
+        """
+        loop = asyncio.get_running_loop()
+        if self._unavailable_since is None:
+            self._unavailable_since = loop.time()
+            logger.warning(
+                f"Nenhuma instância conectada; aguardando reconexão por até {BulkConfig.INSTANCE_WAIT_TIMEOUT:.0f}s"
+            )
+        while True:
+            # Consulta o status sem depender do monitor (que pode estar desativado)
+            await self._refresh_after_failure()
+            if self.pool.available():
+                break
+            remaining = self._unavailable_since + BulkConfig.INSTANCE_WAIT_TIMEOUT - loop.time()
+            if remaining <= 0:
+                return False
+            await self.pool.wait_readmitted(min(remaining, FAILURE_REFRESH_INTERVAL))
+        self._unavailable_since = None
+        return True
+
+    async def _next_instance(self) -> Optional[str]:
+        while True:
+            available = self.pool.available()
+            if not available:
+                if not await self._wait_for_instance():
+                    return None
+                continue
+            # Evita instâncias com o circuito aberto; se todas estiverem, o envio estaciona no circuito
+            closed = [name for name in available if not self.whatsapp_service.breakers.is_open(name)]
+            if closed:
+                available = closed
+            if self.rate_limiters.rate is None:
+                return self.pool.pick(available)
+
+            if self.rate_limiters.shared:
+                # O bucket fica fora do processo: reserva o token e, se não houver, aguarda
+                instance = self.pool.pick(available)
+                wait = await self.rate_limiters.reserve(instance)
+                if wait <= 0:
+                    return instance
+                await asyncio.sleep(wait)
+                continue
+
+            waits = {name: self.rate_limiters.get(name).time_until_available() for name in available}
+            ready = [name for name, wait in waits.items() if wait <= 0]
+            if ready:
+                instance = self.pool.pick(ready)
+                if self.rate_limiters.get(instance).try_acquire():
+                    return instance
+                continue
+            await asyncio.sleep(min(waits.values()))
+
+    def _observer(self, instance: str) -> Optional[Callable[[float, str, Optional[int]], None]]:
+        """Callback que alimenta o controle adaptativo com cada tentativa de envio da instância"""
+        if self.adaptive is None:
+            return None
+        controller = self.adaptive.controller(
+            instance, self.rate_limiters.rate_for(instance), self.pool.weights.get(instance, 1.0)
+        )
+
+        def observe(latency: float, outcome: str, http_status: Optional[int]):
+            if controller.observe(latency, outcome, http_status):
+                self.rate_limiters.set_rate(instance, controller.rate)
+        return observe
+
+    def _unavailable_result(self, contact: ContactInfo) -> Dict[str, Any]:
+        record_send("unavailable")
+        return {
+            "name": contact.name,
+            "phone": contact.phone,
+            "success": False,
+            "message_id": None,
+            "error": "Nenhuma instância conectada disponível",
+            "instance": None
+        }
+
+    async def _send(self, seq: int, contact: ContactInfo) -> Dict[str, Any]:
+        for _ in range(MAX_REROUTES + 1):
+            instance = await self._acquire_instance()
+            if instance is None:
+                return self._unavailable_result(contact)
+
+            if self.journal is not None:
+                # Confirmado antes do envio: após um reinício a mensagem não é reenviada
+                try:
+                    await self.journal.sending(seq, instance)
+                except Exception as e:
+                    return {
+                        "name": contact.name,
+                        "phone": contact.phone,
+                        "success": False,
+                        "message_id": None,
+                        "error": f"Falha ao registrar o envio no outbox: {str(e)}",
+                        "instance": instance
+                    }
+            result = await self.whatsapp_service.send_to_contact(
+                contact, self.template, instance=instance, park=True, on_attempt=self._observer(instance),
+                media=self.media
+            )
+            if result["success"]:
+                return result
+            await self._refresh_after_failure()
+            if self.pool.is_available(instance):
+                return result
+            # A instância foi drenada durante o envio: tentar em outra
+            logger.info(f"Reencaminhando {contact.phone} após queda da instância {instance}")
+        return result
+
+    async def _produce(self, pending: asyncio.Queue):
+        numbered = getattr(self.contacts, "numbered", False)
+        seq = 0
+        try:
+            if hasattr(self.contacts, "__aiter__"):
+                async for item in self.contacts:
+                    await pending.put(item if numbered else (seq, item))
+                    seq += 1
+            else:
+                for item in self.contacts:
+                    await pending.put(item if numbered else (seq, item))
+                    seq += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Fonte de contatos falhou (upload, lista, outbox, fila): os workers terminam
+            # os contatos já lidos e run() repassa o erro
+            logger.error(f"Erro ao ler os contatos da campanha: {str(e)}")
+            self._source_error = e
+        for _ in range(self.concurrency):
+            await pending.put(_DONE)
+
+    async def _worker(self, pending: asyncio.Queue, results: asyncio.Queue):
+        try:
+            while True:
+                item = await pending.get()
+                if item is _DONE:
+                    break
+                seq, contact = item
+                result = await self._send(seq, contact)
+                if self.journal is not None:
+                    await self.journal.finished(seq, result)
+                await results.put(result)
+        finally:
+            await results.put(_DONE)
+
+    async def run(self) -> AsyncIterator[Dict[str, Any]]:
+        """Executa a campanha produzindo cada resultado assim que ele fica pronto"""
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: asyncio.Queue = asyncio.Queue()
+
+        tasks: List[asyncio.Task] = []
+        if BulkConfig.INSTANCE_HEALTH_INTERVAL > 0:
+            await self.pool.refresh(self.whatsapp_service)
+            tasks.append(asyncio.create_task(
+                self.pool.monitor(self.whatsapp_service, BulkConfig.INSTANCE_HEALTH_INTERVAL)
+            ))
+
+        tasks.append(asyncio.create_task(self._produce(pending)))
+        tasks += [
+            asyncio.create_task(self._worker(pending, results))
+            for _ in range(self.concurrency)
+        ]
+
+        active_workers = self.concurrency
+        try:
+            while active_workers:
+                result = await results.get()
+                if result is _DONE:
+                    active_workers -= 1
+                    continue
+                yield result
+            if self._source_error is not None:
+                raise self._source_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -5,6 +5,22 @@ from dotenv import load_dotenv
 # Carregar variáveis de ambiente
 load_dotenv()
 
+def parse_instance_pool(value: str, default_instance: str) -> dict:
+    """
+    Converte "instancia:peso,outra:peso" em {instancia: peso}
+    
+    O peso é opcional (padrão 1) e representa a capacidade relativa de envio
+    da instância. Sem valor, o pool contém apenas a instância padrão.
+    """
+    pool = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, weight = item.partition(":")
+        pool[name.strip()] = float(weight) if weight.strip() else 1.0
+    return pool or {default_instance: 1.0}
+
 class EvolutionAPIConfig:
     """Configurações para integração com Evolution API"""
     
@@ -13,8 +29,11 @@ class EvolutionAPIConfig:
     INSTANCE_ID = os.getenv("EVOLUTION_INSTANCE_ID", "rodolfo")
     API_KEY = os.getenv("EVOLUTION_API_KEY", "75363EE38AA4-438F-84AB-B870ACF55495")
     
-    # URLs da API
-    BASE_URL = f"https://{SERVER_URL}"
+    # Pool de instâncias para campanhas em massa (ex: "rodolfo:2,vendas:1")
+    INSTANCE_POOL = parse_instance_pool(os.getenv("EVOLUTION_INSTANCE_POOL", ""), INSTANCE_ID)
+    
+    # URLs da API (HTTPS, exceto quando o esquema é informado, ex: http://127.0.0.1:8081 do simulador local)
+    BASE_URL = SERVER_URL if SERVER_URL.startswith(("http://", "https://")) else f"https://{SERVER_URL}"
     SEND_TEXT_URL = f"{BASE_URL}/message/sendText/{INSTANCE_ID}"
     
     # Headers padrão para requisições
@@ -26,6 +45,24 @@ class EvolutionAPIConfig:
     # Configurações de timeout e delay
     HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", 30))
     DEFAULT_MESSAGE_DELAY = int(os.getenv("DEFAULT_MESSAGE_DELAY", 1000))
+    
+    # Pool de conexões do cliente HTTP assíncrono (keep-alive)
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+    
+    # Novas tentativas de envio em falhas temporárias (backoff exponencial com jitter)
+    RETRY_MAX_ATTEMPTS = int(os.getenv("EVOLUTION_RETRY_MAX_ATTEMPTS", 3))
+    RETRY_BASE_DELAY = float(os.getenv("EVOLUTION_RETRY_BASE_DELAY", 0.5))
+    RETRY_MAX_DELAY = float(os.getenv("EVOLUTION_RETRY_MAX_DELAY", 10))
+    
+    # Repetir também timeouts de leitura (a mensagem pode ter sido enviada: risco de duplicidade)
+    RETRY_AMBIGUOUS_ERRORS = os.getenv("EVOLUTION_RETRY_AMBIGUOUS_ERRORS", "false").lower() == "true"
+    
+    # Circuit breaker por instância: falhas seguidas para abrir e segundos até o envio de teste
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("EVOLUTION_CIRCUIT_FAILURE_THRESHOLD", 5))
+    CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv("EVOLUTION_CIRCUIT_RECOVERY_TIMEOUT", 30))
 
 class ServerConfig:
     """Configurações do servidor FastAPI"""
@@ -49,12 +86,156 @@ class ServerConfig:
     # Configurações de monitoramento
     ENABLE_METRICS = os.getenv("ENABLE_METRICS", "false").lower() == "true"
     HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", 60))
+    
+    # Idade máxima (segundos) de um status em cache servido enquanto é atualizado
+    STATUS_CACHE_MAX_STALENESS = int(os.getenv("STATUS_CACHE_MAX_STALENESS", 300))
+    
+    # Prazo total (segundos) do diagnóstico completo; verificações pendentes voltam como parciais
+    DIAGNOSIS_TIMEOUT = float(os.getenv("DIAGNOSIS_TIMEOUT", 10))
+    
+    # Chaves de idempotência dos endpoints de envio: validade (segundos) e quantidade máxima
+    IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 86400))
+    IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000))
+    
+    # Tempos por fase de cada requisição no cabeçalho Server-Timing
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+    
+    # Requisições acima deste tempo (ms) são registradas no log com as fases (0 desativa)
+    SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+    
+    # Token do endpoint de profiling /api/debug/profile (sem token o endpoint fica desativado)
+    PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+    PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 60))
+    
+    # Logs: formato (text ou json) e arquivo opcional ("{pid}" no nome separa os workers); no
+    # container, com o volume ./logs montado em /app/logs, grava lá por padrão (LOG_FILE= vazio desativa)
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+    LOG_FILE = os.getenv("LOG_FILE", "/app/logs/app-{pid}.log" if os.path.isdir("/app/logs") else "")
+    LOG_FILE_MAX_MB = float(os.getenv("LOG_FILE_MAX_MB", 50))
+    LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", 5))
+    
+    # Registros aguardando a thread de escrita; com a fila cheia os novos são descartados
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    
+    # Fração mantida dos logs informativos por mensagem enviada (avisos e erros são sempre mantidos)
+    LOG_MESSAGE_SAMPLE_RATE = float(os.getenv("LOG_MESSAGE_SAMPLE_RATE", 1.0))
+
+class PhoneConfig:
+    """Configurações de normalização de números de telefone"""
+    
+    # Código de país assumido para números sem "+" (Brasil)
+    DEFAULT_COUNTRY_CODE = os.getenv("PHONE_DEFAULT_COUNTRY_CODE", "55").lstrip("+")
+    
+    # Quantidade de números normalizados mantidos em cache LRU
+    CACHE_SIZE = int(os.getenv("PHONE_CACHE_SIZE", 100000))
+
+class BulkConfig:
+    """Configurações do envio em massa em segundo plano"""
+    
+    # Número de campanhas processadas simultaneamente
+    MAX_CONCURRENT_JOBS = int(os.getenv("BULK_MAX_CONCURRENT_JOBS", 1))
+    
+    # Quantidade de jobs finalizados mantidos em memória para consulta
+    MAX_FINISHED_JOBS = int(os.getenv("BULK_MAX_FINISHED_JOBS", 100))
+    
+    # Requisições simultâneas em andamento por campanha
+    DEFAULT_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", 5))
+    MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", 50))
+    
+    # Envios imediatos permitidos pelo token bucket antes de aplicar a taxa
+    DEFAULT_BURST = int(os.getenv("BULK_DEFAULT_BURST", 1))
+    
+    # Diretório dos arquivos temporários de uploads de contatos em streaming (padrão: temp do sistema)
+    SPOOL_DIR = os.getenv("BULK_SPOOL_DIR", None)
+    
+    # Linhas rejeitadas detalhadas no relatório de ingestão (as demais são apenas contadas)
+    MAX_REJECTED_ROWS = int(os.getenv("BULK_MAX_REJECTED_ROWS", 1000))
+    
+    # Resultados por campanha mantidos em memória antes de passarem para arquivo temporário
+    RESULTS_MEMORY_LIMIT = int(os.getenv("BULK_RESULTS_MEMORY_LIMIT", 10000))
+    
+    # Resultados por página na consulta de jobs (padrão e máximo)
+    RESULTS_PAGE_SIZE = int(os.getenv("BULK_RESULTS_PAGE_SIZE", 1000))
+    RESULTS_MAX_PAGE_SIZE = int(os.getenv("BULK_RESULTS_MAX_PAGE_SIZE", 10000))
+    
+    # Intervalo (segundos) da verificação de status das instâncias durante a campanha (0 desativa)
+    INSTANCE_HEALTH_INTERVAL = float(os.getenv("BULK_INSTANCE_HEALTH_INTERVAL", 15))
+    
+    # Espera máxima (segundos) por uma instância reconectada quando todas estão fora do ar;
+    # depois disso os contatos restantes falham até uma instância voltar
+    INSTANCE_WAIT_TIMEOUT = float(os.getenv("BULK_INSTANCE_WAIT_TIMEOUT", 300))
+    
+    # Taxa adaptativa (AIMD) por instância de peso 1: limites (mensagens/segundo), aumento
+    # por segundo de envios saudáveis, fator de corte e pico de latência (vezes a média)
+    ADAPTIVE_MIN_RATE = float(os.getenv("BULK_ADAPTIVE_MIN_RATE", 0.2))
+    ADAPTIVE_MAX_RATE = float(os.getenv("BULK_ADAPTIVE_MAX_RATE", 20))
+    ADAPTIVE_INCREASE = float(os.getenv("BULK_ADAPTIVE_INCREASE", 0.2))
+    ADAPTIVE_DECREASE = float(os.getenv("BULK_ADAPTIVE_DECREASE", 0.5))
+    ADAPTIVE_LATENCY_FACTOR = float(os.getenv("BULK_ADAPTIVE_LATENCY_FACTOR", 3.0))
+    
+    # Fuso horário de send_at sem fuso e das janelas de envio (delivery_window)
+    TIMEZONE = os.getenv("BULK_TIMEZONE", "America/Sao_Paulo")
+    
+    # Fila de trabalho dos jobs: local (no próprio processo), memory (fila em memória,
+    # um processo) ou redis (compartilhada entre workers e hosts; padrão com REDIS_URL)
+    WORK_QUEUE = os.getenv("BULK_WORK_QUEUE", "redis" if os.getenv("REDIS_URL") else "local").lower()
+    
+    # Segundos até uma mensagem reivindicada e não confirmada voltar para a fila
+    VISIBILITY_TIMEOUT = float(os.getenv("BULK_VISIBILITY_TIMEOUT", 300))
+    
+    # Intervalo (segundos) em que cada processo procura jobs e mensagens na fila compartilhada
+    QUEUE_POLL_INTERVAL = float(os.getenv("BULK_QUEUE_POLL_INTERVAL", 1.0))
+
+class MediaConfig:
+    """Configurações das mídias (imagem, documento, áudio e vídeo) das mensagens"""
+    
+    # Diretório das mídias enviadas, já codificadas em base64 e identificadas pelo hash do conteúdo
+    DIR = os.getenv("MEDIA_DIR", "data/media")
+    
+    # Tamanho máximo de um upload (MB); o WhatsApp aceita documentos de até 100 MB
+    MAX_UPLOAD_MB = float(os.getenv("MEDIA_MAX_UPLOAD_MB", 100))
+    
+    # Mídias codificadas mantidas em memória para os envios (MB); as demais são lidas do disco
+    CACHE_MB = float(os.getenv("MEDIA_CACHE_MB", 64))
+    
+    # MEDIA_DIR é um volume compartilhado por todos os processos que consomem a fila de
+    # trabalho Redis (ex: NFS, ou um único host); sem ele, jobs com mídia são recusados
+    SHARED = os.getenv("MEDIA_SHARED", "false").lower() == "true"
+
+class WebhookConfig:
+    """Configurações do webhook de eventos da Evolution API (confirmações de entrega e leitura)"""
+    
+    # Token exigido no parâmetro ?token= ou no cabeçalho X-Webhook-Token (vazio aceita qualquer chamada)
+    TOKEN = os.getenv("WEBHOOK_TOKEN", "")
+    
+    # Intervalo (segundos) e tamanho dos lotes gravados no banco
+    FLUSH_INTERVAL = float(os.getenv("WEBHOOK_FLUSH_INTERVAL", 1.0))
+    BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 5000))
+    
+    # Eventos aguardando gravação; acima disso os novos são descartados
+    MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", 200000))
 
 class DatabaseConfig:
     """Configurações de banco de dados (opcional)"""
     
+    # Outbox persistente dos envios em massa (ex: sqlite:///data/outbox.db)
     DATABASE_URL = os.getenv("DATABASE_URL", None)
+    
+    # Listas de contatos guardadas no servidor (vazio desativa)
+    CONTACT_LISTS_URL = os.getenv("CONTACT_LISTS_URL", "sqlite:///data/contact_lists.db")
+    
+    # Índice message_id → job das confirmações de entrega/leitura (vazio desativa) e dias mantidos
+    RECEIPTS_URL = os.getenv("RECEIPTS_URL", "sqlite:///data/receipts.db")
+    RECEIPTS_RETENTION_DAYS = float(os.getenv("RECEIPTS_RETENTION_DAYS", 30))
     REDIS_URL = os.getenv("REDIS_URL", None)
+    
+    # Dias que jobs finalizados permanecem no outbox (0 mantém para sempre)
+    OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", 7))
+    
+    # Cada processo renova a posse dos seus jobs no outbox a cada OUTBOX_HEARTBEAT_INTERVAL segundos;
+    # jobs sem renovação há OUTBOX_LEASE_TIMEOUT segundos (processo parado) são retomados por outro
+    OUTBOX_HEARTBEAT_INTERVAL = float(os.getenv("OUTBOX_HEARTBEAT_INTERVAL", 10))
+    OUTBOX_LEASE_TIMEOUT = float(os.getenv("OUTBOX_LEASE_TIMEOUT", 30))
 
 class EmailConfig:
     """Configurações de email (opcional)"""
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+
+from config import DatabaseConfig
+from models import ContactInfo
+from outbox import READ_PAGE_SIZE, sqlite_path
+from phone_utils import phone_normalizer
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contact_lists (
+    list_id TEXT PRIMARY KEY,
+    name TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS list_contacts (
+    list_id TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    name TEXT NOT NULL,
+    variables TEXT,
+    PRIMARY KEY (list_id, phone)
+) WITHOUT ROWID;
+"""
+
+# Telefone já na lista: a versão mais recente substitui nome e variáveis (atualização incremental)
+UPSERT_CONTACT = (
+    "INSERT INTO list_contacts (list_id, phone, name, variables) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (list_id, phone) DO UPDATE SET name = excluded.name, variables = excluded.variables"
+)
+
+# Nomes de variáveis aceitos nos filtros das campanhas
+FILTER_KEY = re.compile(r"^[A-Za-z0-9_]+$")
+
+def build_filter(filters: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+    """
+    Converte o filtro da campanha em condição SQL sobre as variáveis dos contatos
+
+    `{"cidade": "Recife", "plano": ["ouro", "prata"]}` seleciona os contatos
+    cuja variável `cidade` é "Recife" e `plano` é "ouro" ou "prata".
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    for key, value in (filters or {}).items():
+        if not FILTER_KEY.match(key):
+            raise ValueError(f"Filtro inválido: {key!r} (use letras, números e _)")
+        values = value if isinstance(value, list) else [value]
+        if not values or any(isinstance(item, (dict, list)) for item in values):
+            raise ValueError(f"Filtro {key}: informe um valor ou uma lista de valores")
+        clauses.append(f"json_extract(variables, ?) IN ({','.join('?' for _ in values)})")
+        params.append(f'$."{key}"')
+        params.extend(values)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+class ListWriter:
+    """
+    Destino dos contatos de um upload para uma lista (usado por ingest_contacts)
+
+    Os contatos de cada chunk são gravados numa única transação.
+    """
+
+    def __init__(self, store: "ContactListStore", list_id: str):
+        self.store = store
+        self.list_id = list_id
+        self.rows: List[Tuple] = []
+
+    def append(self, contact: ContactInfo):
+        variables = json.dumps(contact.variables, ensure_ascii=False) if contact.variables else None
+        self.rows.append((self.list_id, contact.phone, contact.name, variables))
+
+    def flush(self) -> Awaitable[None]:
+        rows, self.rows = self.rows, []
+        return self.store._run(self.store._upsert, rows)
+
+class ListContacts:
+    """
+    Contatos de uma lista (com filtro opcional) lidos do banco em páginas
+
+    Fonte de contatos das campanhas por list_id: a lista não é carregada
+    inteira na memória nem validada de novo a cada envio.
+    """
+
+    def __init__(self, store: "ContactListStore", list_id: str, filters: Optional[Dict[str, Any]], total: int):
+        self.store = store
+        self.list_id = list_id
+        self.filters = filters
+        # Contatos selecionados no momento da criação da campanha
+        self.total = total
+
+    async def __aiter__(self) -> AsyncIterator[ContactInfo]:
+        after = ""
+        while True:
+            rows = await self.store.fetch(self.list_id, after, READ_PAGE_SIZE, self.filters)
+            for phone, name, variables in rows:
+                yield ContactInfo.model_construct(
+                    name=name, phone=phone, variables=json.loads(variables) if variables else None
+                )
+            if len(rows) < READ_PAGE_SIZE:
+                return
+            after = rows[-1][0]
+
+class ContactListStore:
+    """
+    Listas de contatos guardadas no servidor (SQLite)
+
+    Os contatos são normalizados e deduplicados uma única vez, no upload, e
+    ficam indexados por telefone; campanhas referenciam a lista pelo
+    list_id. Todas as operações rodam numa thread dedicada, dona da conexão.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="contact-lists")
+        await self._run(self._open)
+        logger.info(f"Listas de contatos: {self.path}")
+
+    async def stop(self):
+        if self._executor is None:
+            return
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory and self.path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def _close(self):
+        self._connection.close()
+        self._connection = None
+
+    def _upsert(self, rows: List[Tuple]):
+        if not rows:
+            return
+        with self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(UPSERT_CONTACT, rows)
+
+    def _describe(self, row: Tuple) -> Dict[str, Any]:
+        list_id, name, size, created_at, updated_at = row
+        return {
+            "list_id": list_id,
+            "name": name,
+            "size": size,
+            "created_at": datetime.fromtimestamp(created_at).isoformat(),
+            "updated_at": datetime.fromtimestamp(updated_at).isoformat()
+        }
+
+    async def create(self, name: Optional[str] = None) -> Dict[str, Any]:
+        list_id = uuid.uuid4().hex
+        return await self._run(self._create, list_id, name)
+
+    def _create(self, list_id: str, name: Optional[str]) -> Dict[str, Any]:
+        now = time.time()
+        self._connection.execute(
+            "INSERT INTO contact_lists (list_id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (list_id, name, now, now)
+        )
+        return self._describe((list_id, name, 0, now, now))
+
+    async def get(self, list_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get, list_id)
+
+    def _get(self, list_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection.execute(
+            "SELECT list_id, name, size, created_at, updated_at FROM contact_lists WHERE list_id = ?", (list_id,)
+        ).fetchone()
+        return self._describe(row) if row else None
+
+    async def all(self) -> List[Dict[str, Any]]:
+        return await self._run(self._all)
+
+    def _all(self) -> List[Dict[str, Any]]:
+        rows = self._connection.execute(
+            "SELECT list_id, name, size, created_at, updated_at FROM contact_lists ORDER BY created_at DESC"
+        ).fetchall()
+        return [self._describe(row) for row in rows]
+
+    def writer(self, list_id: str) -> ListWriter:
+        return ListWriter(self, list_id)
+
+    async def touch(self, list_id: str) -> Optional[Dict[str, Any]]:
+        """Atualiza o tamanho e a data de alteração da lista após uma modificação"""
+        return await self._run(self._touch, list_id)
+
+    def _touch(self, list_id: str) -> Optional[Dict[str, Any]]:
+        self._connection.execute(
+            "UPDATE contact_lists SET size = (SELECT COUNT(*) FROM list_contacts WHERE list_id = ?), "
+            "updated_at = ? WHERE list_id = ?",
+            (list_id, time.time(), list_id)
+        )
+        return self._get(list_id)
+
+    async def remove(self, list_id: str, phones: List[str]) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Remove contatos da lista pelo telefone (normalizado como no upload)
+
+        Returns:
+            Tuple: (contatos removidos, telefones inválidos com o erro)
+        """
+        normalized = phone_normalizer.normalize_batch(phones)
+        valid = [phone for phone, error in normalized if error is None]
+        invalid = [{"phone": raw, "error": error} for raw, (_, error) in zip(phones, normalized) if error is not None]
+        removed = await self._run(self._remove, list_id, valid)
+        return removed, invalid
+
+    def _remove(self, list_id: str, phones: List[str]) -> int:
+        with self._connection:
+            self._connection.execute("BEGIN")
+            return sum(
+                self._connection.execute(
+                    "DELETE FROM list_contacts WHERE list_id = ? AND phone = ?", (list_id, phone)
+                ).rowcount
+                for phone in phones
+            )
+
+    async def delete(self, list_id: str) -> bool:
+        return await self._run(self._delete, list_id)
+
+    def _delete(self, list_id: str) -> bool:
+        with self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.execute("DELETE FROM list_contacts WHERE list_id = ?", (list_id,))
+            return self._connection.execute("DELETE FROM contact_lists WHERE list_id = ?", (list_id,)).rowcount > 0
+
+    async def fetch(self, list_id: str, after_phone: str, limit: int,
+                    filters: Optional[Dict[str, Any]] = None) -> List[Tuple]:
+        """Contatos (phone, name, variables) em ordem de telefone, a partir de `after_phone` (exclusivo)"""
+        return await self._run(self._fetch, list_id, after_phone, limit, filters)
+
+    def _fetch(self, list_id: str, after_phone: str, limit: int, filters: Optional[Dict[str, Any]]) -> List[Tuple]:
+        condition, params = build_filter(filters)
+        return self._connection.execute(
+            f"SELECT phone, name, variables FROM list_contacts WHERE list_id = ? AND phone > ?{condition} "
+            f"ORDER BY phone LIMIT ?",
+            (list_id, after_phone, *params, limit)
+        ).fetchall()
+
+    async def count(self, list_id: str, filters: Optional[Dict[str, Any]] = None) -> int:
+        return await self._run(self._count, list_id, filters)
+
+    def _count(self, list_id: str, filters: Optional[Dict[str, Any]]) -> int:
+        condition, params = build_filter(filters)
+        return self._connection.execute(
+            f"SELECT COUNT(*) FROM list_contacts WHERE list_id = ?{condition}", (list_id, *params)
+        ).fetchone()[0]
+
+    async def contacts(self, list_id: str, filters: Optional[Dict[str, Any]] = None) -> ListContacts:
+        """Fonte de contatos de uma campanha (ValueError para filtro inválido)"""
+        return ListContacts(self, list_id, filters, await self.count(list_id, filters))
+
+def open_contact_lists(url: Optional[str] = DatabaseConfig.CONTACT_LISTS_URL) -> Optional[ContactListStore]:
+    """Cria o armazenamento de listas configurado em CONTACT_LISTS_URL (None quando desativado)"""
+    if not url:
+        return None
+    path = sqlite_path(url)
+    if path is None:
+        logger.warning("CONTACT_LISTS_URL não é SQLite (sqlite:///caminho.db); listas de contatos desativadas")
+        return None
+    return ContactListStore(path)
@@ -0,0 +1,219 @@
+import asyncio
+import codecs
+import csv
+import inspect
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Any, AsyncIterator, List, Optional
+
+from config import BulkConfig
+from models import ContactInfo
+from phone_utils import phone_normalizer
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Nomes de coluna aceitos no CSV além de "name" e "phone"
+CSV_COLUMN_ALIASES = {
+    "nome": "name",
+    "telefone": "phone",
+    "celular": "phone",
+    "numero": "phone",
+    "número": "phone"
+}
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    """Identifica o formato do upload (ndjson ou csv) pelo parâmetro explícito ou Content-Type"""
+    if requested:
+        requested = requested.lower()
+        return requested if requested in ("ndjson", "csv") else None
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"):
+        return "ndjson"
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    return None
+
+def _row_variables(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Variáveis do contato: objeto `variables` (NDJSON) e demais colunas/chaves além de name e phone"""
+    variables = {key: value for key, value in row.items() if key not in ("name", "phone", "variables")}
+    if isinstance(row.get("variables"), dict):
+        variables.update(row["variables"])
+    return variables or None
+
+class ContactSpool:
+    """
+    Fila de contatos validados gravada em arquivo temporário
+
+    O upload escreve os contatos à medida que chegam e o envio os lê do mesmo
+    arquivo em paralelo, de modo que a memória usada não depende do tamanho
+    da lista. O arquivo é removido quando a leitura termina.
+    """
+
+    def __init__(self, directory: Optional[str] = BulkConfig.SPOOL_DIR):
+        fd, self.path = tempfile.mkstemp(prefix="contacts-", suffix=".ndjson", dir=directory)
+        self._writer = os.fdopen(fd, "w", encoding="utf-8")
+        self._data_available = asyncio.Event()
+        self.closed = False
+        self.count = 0
+
+    def append(self, contact: ContactInfo):
+        record = {"name": contact.name, "phone": contact.phone}
+        if contact.variables:
+            record["variables"] = contact.variables
+        self._writer.write(json.dumps(record, ensure_ascii=False))
+        self._writer.write("\n")
+        self.count += 1
+
+    def flush(self):
+        """Torna os contatos gravados visíveis para o leitor"""
+        self._writer.flush()
+        self._data_available.set()
+
+    def close(self):
+        """Encerra a escrita; o leitor termina ao alcançar o fim do arquivo"""
+        if not self.closed:
+            self._writer.close()
+            self.closed = True
+            self._data_available.set()
+
+    async def __aiter__(self) -> AsyncIterator[ContactInfo]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as reader:
+                while True:
+                    position = reader.tell()
+                    line = reader.readline()
+                    if line.endswith("\n"):
+                        data = json.loads(line)
+                        yield ContactInfo.model_construct(name=data["name"], phone=data["phone"], variables=data.get("variables"))
+                        continue
+
+                    # Fim do que já foi gravado: aguardar mais dados ou o fechamento
+                    reader.seek(position)
+                    if self.closed:
+                        break
+                    self._data_available.clear()
+                    await self._data_available.wait()
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        """Remove o arquivo temporário (a escrita em andamento continua sem efeito)"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class IngestionReport:
+    """Estatísticas da ingestão de um upload de contatos"""
+
+    def __init__(self, max_rejected_rows: int = BulkConfig.MAX_REJECTED_ROWS):
+        self.status = "receiving"
+        self.rows = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.rejected_rows: List[Dict[str, Any]] = []
+        self.max_rejected_rows = max_rejected_rows
+
+    def reject(self, line: int, error: str):
+        self.rejected += 1
+        if len(self.rejected_rows) < self.max_rejected_rows:
+            self.rejected_rows.append({"line": line, "error": error})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "rows": self.rows,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "rejected_rows": self.rejected_rows
+        }
+
+async def _iter_lines(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """Decodifica o corpo em UTF-8 de forma incremental, produzindo as linhas completas de cada chunk"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in byte_stream:
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        if lines:
+            yield lines
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield [buffer]
+
+async def ingest_contacts(byte_stream: AsyncIterator[bytes], fmt: str, spool: ContactSpool,
+                          report: IngestionReport) -> IngestionReport:
+    """
+    Lê contatos NDJSON ou CSV do corpo da requisição, validando linha a linha
+
+    Contatos válidos vão para o spool (ou outro destino com append/flush, como
+    uma lista de contatos; um flush assíncrono é aguardado) assim que cada
+    chunk é processado;
+    linhas inválidas são registradas no relatório sem interromper o lote e
+    telefones repetidos são descartados.
+    CSV exige cabeçalho com as colunas `name`/`nome` e `phone`/`telefone`
+    e um contato por linha; as demais colunas viram variáveis do contato.
+    """
+    header: Optional[List[str]] = None
+    line_number = 0
+    seen_phones = set()
+
+    async for lines in _iter_lines(byte_stream):
+        # Primeiro interpretar as linhas do chunk, depois normalizar os telefones em lote
+        rows = []
+        for line in lines:
+            line_number += 1
+            line = line.rstrip("\r")
+            if not line.strip():
+                continue
+
+            try:
+                if fmt == "csv":
+                    values = next(csv.reader([line]))
+                    if header is None:
+                        columns = [CSV_COLUMN_ALIASES.get(col.strip().lower(), col.strip().lower()) for col in values]
+                        if "name" not in columns or "phone" not in columns:
+                            raise ValueError("Cabeçalho CSV deve conter as colunas name e phone")
+                        header = columns
+                        continue
+                    report.rows += 1
+                    row = dict(zip(header, values))
+                else:
+                    report.rows += 1
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise ValueError("Cada linha deve ser um objeto JSON")
+                if not isinstance(row.get("name"), str):
+                    raise ValueError("name: campo obrigatório")
+            except (ValueError, csv.Error) as e:
+                if header is None and fmt == "csv":
+                    # Sem cabeçalho válido não há como interpretar as linhas seguintes
+                    raise
+                report.reject(line_number, str(e))
+                continue
+
+            rows.append((line_number, row))
+
+        normalized = phone_normalizer.normalize_batch([row.get("phone") for _, row in rows])
+        for (row_line, row), (phone, error) in zip(rows, normalized):
+            if error is not None:
+                report.reject(row_line, f"phone: {error}")
+                continue
+            if phone in seen_phones:
+                report.duplicates += 1
+                continue
+            seen_phones.add(phone)
+            spool.append(ContactInfo.model_construct(name=row["name"], phone=phone, variables=_row_variables(row)))
+            report.accepted += 1
+
+        flushed = spool.flush()
+        if inspect.isawaitable(flushed):
+            await flushed
+
+    return report
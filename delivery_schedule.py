@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, time as dtime, timedelta
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import BulkConfig
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Maior espera contínua (segundos): esperas longas são divididas para acompanhar ajustes do relógio
+MAX_SLEEP = 60.0
+
+try:
+    TIMEZONE: Optional[ZoneInfo] = ZoneInfo(BulkConfig.TIMEZONE)
+except (ZoneInfoNotFoundError, ValueError):
+    logger.warning(f"Fuso horário {BulkConfig.TIMEZONE} indisponível: usando o horário local do servidor")
+    TIMEZONE = None
+
+def to_timestamp(value: Union[datetime, str]) -> float:
+    """Converte send_at (datetime ou ISO 8601) em timestamp; sem fuso, usa BULK_TIMEZONE"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None and TIMEZONE is not None:
+        value = value.replace(tzinfo=TIMEZONE)
+    return value.timestamp()
+
+def format_timestamp(timestamp: Optional[float]) -> Optional[str]:
+    """Timestamp em ISO 8601 no fuso BULK_TIMEZONE"""
+    return datetime.fromtimestamp(timestamp, TIMEZONE).isoformat() if timestamp else None
+
+async def sleep_until(timestamp: float):
+    """Aguarda até o horário `timestamp` (relógio de parede)"""
+    while True:
+        remaining = timestamp - time.time()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, MAX_SLEEP))
+
+class DeliveryWindow:
+    """
+    Janela diária de envio, ex: "09:00-18:00" (no fuso BULK_TIMEZONE)
+
+    Janelas que atravessam a meia-noite ("22:00-06:00") são aceitas.
+    """
+
+    def __init__(self, start: dtime, end: dtime):
+        if start == end:
+            raise ValueError("A janela de envio precisa ter início e fim diferentes")
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def parse(cls, value: str) -> "DeliveryWindow":
+        try:
+            start, end = (datetime.strptime(part.strip(), "%H:%M").time() for part in value.split("-"))
+        except ValueError:
+            raise ValueError(f"Janela de envio inválida: {value!r} (use HH:MM-HH:MM)")
+        return cls(start, end)
+
+    def _local(self, timestamp: float) -> datetime:
+        return datetime.fromtimestamp(timestamp, TIMEZONE)
+
+    def _at(self, day: datetime, moment: dtime) -> float:
+        return day.replace(hour=moment.hour, minute=moment.minute, second=moment.second, microsecond=0).timestamp()
+
+    def contains(self, timestamp: float) -> bool:
+        now = self._local(timestamp).time()
+        if self.start < self.end:
+            return self.start <= now < self.end
+        return now >= self.start or now < self.end
+
+    def next_open(self, timestamp: float) -> float:
+        """Início da janela em andamento ou da próxima"""
+        if self.contains(timestamp):
+            return timestamp
+        local = self._local(timestamp)
+        opens = self._at(local, self.start)
+        return opens if opens > timestamp else self._at(local + timedelta(days=1), self.start)
+
+    def closes_at(self, timestamp: float) -> float:
+        """Fim da janela que contém `timestamp` (ou da próxima)"""
+        local = self._local(self.next_open(timestamp))
+        closes = self._at(local, self.end)
+        return closes if closes > local.timestamp() else self._at(local + timedelta(days=1), self.end)
+
+    def __str__(self) -> str:
+        return f"{self.start.strftime('%H:%M')}-{self.end.strftime('%H:%M')}"
+
+class ReleaseGate:
+    """
+    Libera os contatos de uma campanha para o envio dentro da janela
+
+    Fora da janela a leitura dos contatos pausa até a próxima abertura. Com
+    `spread`, os envios restantes são distribuídos uniformemente até o fim da
+    janela: o intervalo é recalculado a cada contato (tempo restante / envios
+    restantes), então uploads que ainda crescem e atrasos do envio são
+    absorvidos. Os horários são calculados na hora, sem um timer por contato.
+    """
+
+    # Contatos liberados aos poucos: quem consome não deve acumulá-los em lotes
+    paced = True
+
+    def __init__(self, source, window: DeliveryWindow, spread: bool = False,
+                 remaining: Optional[Callable[[int], int]] = None):
+        self.source = source
+        self.window = window
+        self.spread = spread
+        # Envios restantes dado quantos já foram liberados (padrão: sem distribuição)
+        self.remaining = remaining
+        self.numbered = getattr(source, "numbered", False)
+        self.released = 0
+        self.next_due = 0.0
+
+    async def _items(self) -> AsyncIterator[Any]:
+        if hasattr(self.source, "__aiter__"):
+            async for item in self.source:
+                yield item
+        else:
+            for item in self.source:
+                yield item
+
+    async def _wait_turn(self):
+        while True:
+            now = time.time()
+            opens = self.window.next_open(max(now, self.next_due))
+            if opens <= now:
+                return
+            await sleep_until(opens)
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        async for item in self._items():
+            await self._wait_turn()
+            yield item
+            self.released += 1
+            if self.spread and self.remaining is not None:
+                now = time.time()
+                # O contato liberado agora ocupa uma das fatias do tempo restante, os pendentes as demais
+                slots = max(self.remaining(self.released), 0) + 1
+                self.next_due = now + (self.window.closes_at(now) - now) / slots
+
+class JobScheduler:
+    """
+    Jobs aguardando o horário de início, num heap ordenado pelo horário
+
+    Uma única tarefa acorda no próximo vencimento e libera os jobs vencidos,
+    então milhares de campanhas agendadas não ocupam workers nem timers
+    próprios. Jobs cancelados enquanto aguardam são descartados ao vencer.
+    """
+
+    def __init__(self, release: Callable[[Any], None]):
+        self.release = release
+        self.heap: List[Tuple[float, int, Any]] = []
+        self._counter = itertools.count()
+        self._changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def schedule(self, job, timestamp: float):
+        heapq.heappush(self.heap, (timestamp, next(self._counter), job))
+        if self.heap[0][2] is job:
+            self._changed.set()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run(), name="bulk-job-scheduler")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self):
+        while True:
+            self._changed.clear()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                _, _, job = heapq.heappop(self.heap)
+                if job.status == "scheduled":
+                    self.release(job)
+            timeout = min(self.heap[0][0] - now, MAX_SLEEP) if self.heap else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
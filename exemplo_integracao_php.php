@@ -14,32 +14,70 @@ class WhatsAppMessageManager {
     
     /**
      * Envia mensagem para um único contato
+     * 
+     * $idempotencyKey: chave única do envio (ex: ID do registro no seu sistema);
+     * ao repetir a chamada após um timeout, a mensagem não é enviada de novo
      */
-    public function sendSingleMessage($name, $phone, $message) {
+    public function sendSingleMessage($name, $phone, $message, $idempotencyKey = null) {
         $data = [
             'name' => $name,
             'phone' => $phone,
             'message' => $message
         ];
         
-        $response = $this->makeRequest('/api/send-message', $data);
+        $response = $this->makeRequest('/api/send-message', $data, $idempotencyKey);
         return $response;
     }
     
     /**
      * Envia mensagens em massa para múltiplos contatos
      */
-    public function sendBulkMessages($contacts, $message, $delay = 1000) {
+    public function sendBulkMessages($contacts, $message, $delay = 1000, $idempotencyKey = null) {
         $data = [
             'contacts' => $contacts,
             'message' => $message,
             'delay' => $delay
         ];
         
-        $response = $this->makeRequest('/api/send-bulk-messages', $data);
+        $response = $this->makeRequest('/api/send-bulk-messages', $data, $idempotencyKey);
         return $response;
     }
     
+    /**
+     * Enfileira uma campanha em massa em segundo plano e retorna o job_id
+     */
+    public function sendBulkMessagesBackground($contacts, $message, $delay = 1000, $idempotencyKey = null) {
+        $data = [
+            'contacts' => $contacts,
+            'message' => $message,
+            'delay' => $delay,
+            'background' => true
+        ];
+        
+        $response = $this->makeRequest('/api/send-bulk-messages', $data, $idempotencyKey);
+        return $response;
+    }
+    
+    /**
+     * Consulta o progresso de um job de envio em massa
+     */
+    public function getJobStatus($jobId, $includeResults = false) {
+        $ch = curl_init();
+        curl_setopt($ch, CURLOPT_URL, $this->baseUrl . '/api/jobs/' . urlencode($jobId) . '?include_results=' . ($includeResults ? 'true' : 'false'));
+        curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+        curl_setopt($ch, CURLOPT_TIMEOUT, 10);
+        
+        $response = curl_exec($ch);
+        $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+        curl_close($ch);
+        
+        if ($httpCode === 200) {
+            return json_decode($response, true);
+        } else {
+            return ['success' => false, 'error' => 'HTTP ' . $httpCode];
+        }
+    }
+    
     /**
      * Testa a conexão com o serviço
      */
@@ -79,16 +117,22 @@ class WhatsAppMessageManager {
     /**
      * Método privado para fazer requisições HTTP
      */
-    private function makeRequest($endpoint, $data) {
+    private function makeRequest($endpoint, $data, $idempotencyKey = null) {
         $ch = curl_init();
         
+        $headers = [
+            'Content-Type: application/json',
+            'Content-Length: ' . strlen(json_encode($data))
+        ];
+        if ($idempotencyKey !== null) {
+            // Repetições com a mesma chave recebem o resultado original sem reenviar
+            $headers[] = 'Idempotency-Key: ' . $idempotencyKey;
+        }
+        
         curl_setopt($ch, CURLOPT_URL, $this->baseUrl . $endpoint);
         curl_setopt($ch, CURLOPT_POST, 1);
         curl_setopt($ch, CURLOPT_POSTFIELDS, json_encode($data));
-        curl_setopt($ch, CURLOPT_HTTPHEADER, [
-            'Content-Type: application/json',
-            'Content-Length: ' . strlen(json_encode($data))
-        ]);
+        curl_setopt($ch, CURLOPT_HTTPHEADER, $headers);
         curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
         curl_setopt($ch, CURLOPT_TIMEOUT, 30);
         
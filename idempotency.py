@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Tuple
+
+from config import ServerConfig
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+class IdempotencyConflict(Exception):
+    """Chave de idempotência reutilizada com um corpo de requisição diferente"""
+
+class IdempotencyRecord:
+    __slots__ = ("fingerprint", "task", "created_at")
+
+    def __init__(self, fingerprint: str, task: asyncio.Task):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.created_at = time.monotonic()
+
+class IdempotencyStore:
+    """
+    Resultados das requisições por chave de idempotência
+
+    A primeira requisição com uma chave executa normalmente e o resultado
+    fica guardado por `ttl` segundos; repetições com a mesma chave (inclusive
+    enquanto a original ainda está em andamento) recebem o mesmo resultado sem
+    executar de novo. Requisições que terminam com exceção não são guardadas,
+    para que possam ser repetidas. O armazenamento é limitado a `max_entries`
+    chaves, descartando as mais antigas.
+    """
+
+    def __init__(self, ttl: float = ServerConfig.IDEMPOTENCY_TTL,
+                 max_entries: int = ServerConfig.IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, IdempotencyRecord]" = OrderedDict()
+
+    def _evict(self):
+        # As entradas estão em ordem de criação: as expiradas ficam no início
+        now = time.monotonic()
+        while self.entries:
+            record = next(iter(self.entries.values()))
+            if now - record.created_at < self.ttl and len(self.entries) < self.max_entries:
+                break
+            self.entries.popitem(last=False)
+
+    def _discard_failed(self, key: str, record: IdempotencyRecord):
+        def callback(task: asyncio.Task):
+            if task.cancelled() or task.exception() is not None:
+                if self.entries.get(key) is record:
+                    del self.entries[key]
+        return callback
+
+    async def execute(self, key: str, fingerprint: str,
+                      producer: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Executa `producer` uma única vez por chave
+
+        Args:
+            key: Chave de idempotência (já com o escopo do endpoint)
+            fingerprint: Hash do corpo da requisição
+            producer: Função que processa a requisição
+
+        Returns:
+            Tuple: (resultado, True se o resultado foi reaproveitado)
+
+        Raises:
+            IdempotencyConflict: Chave já usada com outro corpo
+        """
+        self._evict()
+        record = self.entries.get(key)
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                raise IdempotencyConflict("Idempotency-Key já utilizada com um corpo de requisição diferente")
+            logger.info(f"Requisição repetida com Idempotency-Key {key}: resultado original reaproveitado")
+            return await asyncio.shield(record.task), True
+
+        # A execução continua mesmo que o cliente desista, para atender as repetições
+        task = asyncio.ensure_future(producer())
+        record = IdempotencyRecord(fingerprint, task)
+        self.entries[key] = record
+        task.add_done_callback(self._discard_failed(key, record))
+        return await asyncio.shield(task), False
+
+    def to_dict(self):
+        return {"keys": len(self.entries), "max_keys": self.max_entries, "ttl_seconds": self.ttl}
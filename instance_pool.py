@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+class InstancePool:
+    """
+    Pool de instâncias WhatsApp usadas por uma campanha em massa
+
+    Cada instância tem um peso proporcional à sua capacidade de envio. Uma
+    instância cujo `connectionStatus` deixa de ser `open` é drenada (não recebe
+    novos contatos) até voltar a ficar conectada.
+    """
+
+    def __init__(self, weights: Dict[str, float]):
+        if not weights:
+            raise ValueError("O pool de instâncias não pode estar vazio")
+        self.weights = dict(weights)
+        self.statuses: Dict[str, str] = {name: "unknown" for name in self.weights}
+        self.drained = set()
+        self._current = {name: 0.0 for name in self.weights}
+        # Sinalizado quando uma instância drenada é readmitida
+        self._readmitted = asyncio.Event()
+
+    def available(self) -> List[str]:
+        """Instâncias aptas a receber novos envios"""
+        return [name for name in self.weights if name not in self.drained]
+
+    def is_available(self, name: str) -> bool:
+        return name in self.weights and name not in self.drained
+
+    def pick(self, candidates: Optional[List[str]] = None) -> Optional[str]:
+        """Escolhe uma instância por round-robin ponderado suave (nginx)"""
+        candidates = candidates if candidates is not None else self.available()
+        if not candidates:
+            return None
+        total = 0.0
+        best = None
+        for name in candidates:
+            weight = self.weights[name]
+            self._current[name] += weight
+            total += weight
+            if best is None or self._current[name] > self._current[best]:
+                best = name
+        self._current[best] -= total
+        return best
+
+    def update_statuses(self, statuses: Dict[str, str]):
+        """
+        Atualiza o estado das instâncias a partir do fetchInstances
+
+        Args:
+            statuses: connectionStatus por nome de instância; instâncias do
+                pool ausentes do dicionário são consideradas não encontradas
+        """
+        for name in self.weights:
+            status = statuses.get(name, "not_found")
+            self.statuses[name] = status
+
+            if status != "open" and name not in self.drained:
+                self.drained.add(name)
+                logger.warning(f"Instância {name} drenada (connectionStatus: {status})")
+            elif status == "open" and name in self.drained:
+                self.drained.discard(name)
+                self._readmitted.set()
+                logger.info(f"Instância {name} reconectada e readmitida no pool")
+
+    async def wait_readmitted(self, timeout: float) -> bool:
+        """Aguarda até `timeout` segundos que uma instância drenada seja readmitida"""
+        self._readmitted.clear()
+        try:
+            await asyncio.wait_for(self._readmitted.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def refresh(self, whatsapp_service) -> bool:
+        """Consulta o status das instâncias; mantém o estado atual se a consulta falhar"""
+        # Aceita um fetchInstances de até 1s para coalescer campanhas simultâneas
+        statuses = await whatsapp_service.fetch_connection_statuses(max_age=1.0)
+        if statuses is None:
+            return False
+        self.update_statuses(statuses)
+        return True
+
+    async def monitor(self, whatsapp_service, interval: float):
+        """Reavalia periodicamente o status das instâncias durante a campanha"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh(whatsapp_service)
+
+    def to_dict(self) -> Dict[str, Dict[str, object]]:
+        return {
+            name: {
+                "weight": self.weights[name],
+                "connection_status": self.statuses[name],
+                "available": name not in self.drained
+            }
+            for name in self.weights
+        }
@@ -0,0 +1,582 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, AsyncIterator, Set
+
+from adaptive_rate import AdaptiveRate
+from bulk_results import ResultStore
+from delivery_schedule import DeliveryWindow, JobScheduler, ReleaseGate, format_timestamp, to_timestamp
+from config import BulkConfig, DatabaseConfig
+from models import BulkMessageRequest
+from outbox import FEED_FLUSH_EVERY
+from work_queue import PUSH_BATCH_SIZE, QueueConsumer, encode_item
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Eventos pendentes por assinante do stream de progresso antes de descartar resultados
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Intervalo (segundos) dos comentários de keep-alive no stream SSE
+SSE_HEARTBEAT_INTERVAL = 15
+
+# Resultados lidos da fila compartilhada por consulta
+RESULTS_BATCH_SIZE = 500
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Formata um evento no padrão Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class BulkJob:
+    """Estado e progresso de uma campanha de envio em massa executada em segundo plano"""
+
+    def __init__(self, job_id: str, request: BulkMessageRequest, contacts=None, ingestion=None):
+        self.job_id = job_id
+        self.request = request
+        # Fonte alternativa de contatos e relatório do upload em streaming
+        self.contacts = contacts
+        self.ingestion = ingestion
+        self.status = "queued"
+        self.processed = 0
+        self.successful = 0
+        self.failed = 0
+        self.results = ResultStore()
+        self.instances: Dict[str, Dict[str, int]] = {}
+        # Confirmações recebidas pelo webhook da Evolution API
+        self.delivered = 0
+        self.read = 0
+        self.error: Optional[str] = None
+        # Horário (timestamp) em que um job agendado será liberado para execução
+        self.scheduled_for: Optional[float] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[asyncio.Queue] = []
+        # Com outbox: contatos pendentes lidos do banco e tarefa que grava o upload em streaming
+        self.pending = None
+        self.feeder: Optional[asyncio.Task] = None
+        # Job retomado após reinício: total e contadores vêm do outbox
+        self.resumed = False
+        # Taxa adaptativa (AIMD): dos envios deste processo ou publicada pelos consumidores da fila
+        self.adaptive = AdaptiveRate() if request.adaptive_rate else None
+        self._restored_total: Optional[int] = None
+        self._started_monotonic: Optional[float] = None
+        self._finished_monotonic: Optional[float] = None
+
+    @property
+    def total_contacts(self) -> int:
+        if self._restored_total is not None:
+            return self._restored_total
+        # Em uploads em streaming o total cresce à medida que as linhas são aceitas
+        if self.ingestion is not None:
+            return self.ingestion.accepted
+        # Lista de contatos guardada no servidor: contatos selecionados na criação do job
+        total = getattr(self.contacts, "total", None)
+        if total is not None:
+            return total
+        return len(self.request.contacts)
+
+    def start_time(self) -> Optional[float]:
+        """Primeiro horário permitido pelo send_at e pela janela de envio (None: imediatamente)"""
+        start = to_timestamp(self.request.send_at) if self.request.send_at else None
+        if self.request.delivery_window:
+            start = DeliveryWindow.parse(self.request.delivery_window).next_open(max(start or 0, time.time()))
+        return start
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def record(self, result: Dict[str, Any]):
+        """Registra o resultado de um contato e atualiza os contadores"""
+        self.processed += 1
+        counters = self.instances.setdefault(result.get("instance") or "none", {"successful": 0, "failed": 0})
+        if result.get("success"):
+            self.successful += 1
+            counters["successful"] += 1
+        else:
+            self.failed += 1
+            counters["failed"] += 1
+        self.results.append(result)
+        self._publish("result", {"result": result, "progress": self.progress()})
+
+    def set_receipts(self, delivered: int, read: int):
+        """Atualiza as mensagens entregues e lidas; publica o progresso quando mudam"""
+        if (delivered, read) != (self.delivered, self.read):
+            self.delivered, self.read = delivered, read
+            self._publish("progress", self.progress())
+
+    def restore(self, counts: Dict[str, int]):
+        """Restaura total e contadores de um job retomado a partir dos estados no outbox"""
+        self.resumed = True
+        self._restored_total = sum(counts.values())
+        self.successful = counts.get("sent", 0)
+        self.failed = counts.get("failed", 0) + counts.get("uncertain", 0)
+        self.processed = self.successful + self.failed
+
+    def mark_started(self):
+        self.status = "running"
+        self.started_at = datetime.now()
+        self._started_monotonic = time.monotonic()
+        self._publish("progress", self.progress())
+
+    def mark_finished(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.now()
+        self._finished_monotonic = time.monotonic()
+        if self.feeder is not None:
+            self.feeder.cancel()
+        cleanup = getattr(self.contacts, "cleanup", None)
+        if cleanup is not None:
+            cleanup()
+        self._publish("done", self.progress())
+
+    def progress(self) -> Dict[str, Any]:
+        """Contadores em tempo real: progresso, vazão e taxa de falhas"""
+        elapsed = 0.0
+        if self._started_monotonic is not None:
+            elapsed = (self._finished_monotonic or time.monotonic()) - self._started_monotonic
+        return {
+            "status": self.status,
+            "total_contacts": self.total_contacts,
+            "processed": self.processed,
+            "successful_sends": self.successful,
+            "failed_sends": self.failed,
+            "delivered": self.delivered,
+            "read": self.read,
+            "pending": self.total_contacts - self.processed,
+            "progress": round(self.processed / self.total_contacts * 100, 2) if self.total_contacts else 100.0,
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_per_second": round(self.processed / elapsed, 3) if elapsed > 0 else 0.0,
+            "failure_rate": round(self.failed / self.processed, 4) if self.processed else 0.0
+        }
+
+    def _publish(self, event: str, data: Dict[str, Any]):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # Assinante lento: descarta o evento; os contadores seguem no próximo.
+                # O "done" sempre chega: abre espaço descartando o evento mais antigo
+                if event == "done":
+                    queue.get_nowait()
+                    queue.put_nowait((event, data))
+
+    async def events(self, replay: bool = True) -> AsyncIterator[str]:
+        """
+        Stream de eventos SSE com cada resultado e os contadores da campanha
+
+        Eventos: `progress` (contadores), `result` (resultado de um contato com
+        os contadores atualizados) e `done` (fim do job).
+        """
+        # Inscrição e retrato do job no mesmo passo (sem await entre eles): os
+        # resultados registrados depois chegam só pela fila, nunca em dobro
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.append(queue)
+        replayed = len(self.results)
+        progress = self.progress()
+        finished = self.is_finished
+        try:
+            yield _sse("progress", progress)
+            if replay:
+                for result in self.results.iter_rows(0, replayed):
+                    yield _sse("result", {"result": result})
+            if finished:
+                yield _sse("done", progress)
+                return
+
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if self.is_finished and queue.empty():
+                        # Garantia extra: o job terminou sem o "done" chegar à fila
+                        yield _sse("done", self.progress())
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event, data)
+                if event == "done":
+                    return
+        finally:
+            self.subscribers.remove(queue)
+
+    def to_dict(self, include_results: bool = True) -> Dict[str, Any]:
+        """Representação do job para a API de consulta de status"""
+        data = {
+            "job_id": self.job_id,
+            **self.progress(),
+            "resumed": self.resumed,
+            "instances": self.instances,
+            "scheduled_for": format_timestamp(self.scheduled_for),
+            "delivery_window": self.request.delivery_window,
+            "spread": bool(self.request.spread),
+            "adaptive_rate": self.adaptive.to_dict() if self.adaptive is not None else None,
+            "ingestion": self.ingestion.to_dict() if self.ingestion is not None else None,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_results:
+            data.update(self.results.page())
+        return data
+
+class JobManager:
+    """
+    Fila de campanhas em massa processadas em segundo plano
+
+    O endpoint apenas valida e enfileira a campanha; workers assíncronos
+    consomem a fila e atualizam o progresso de cada job. Com um outbox
+    configurado, os contatos e o estado de cada mensagem ficam no banco e os
+    jobs interrompidos por um reinício são retomados na inicialização. Com
+    uma fila de trabalho, o processo dono do job apenas publica as mensagens
+    e coleta os resultados; o envio é dividido entre os consumidores de todos
+    os processos.
+    """
+
+    def __init__(self, whatsapp_service, max_concurrent_jobs: int = BulkConfig.MAX_CONCURRENT_JOBS,
+                 max_finished_jobs: int = BulkConfig.MAX_FINISHED_JOBS, outbox=None, work_queue=None,
+                 receipts=None):
+        self.whatsapp_service = whatsapp_service
+        self.outbox = outbox
+        # Confirmações de entrega/leitura: os envios bem-sucedidos são indexados pelo message_id
+        self.receipts = receipts
+        if receipts is not None:
+            receipts.on_totals = self._apply_receipts
+        # Fila compartilhada: as mensagens são enviadas pelos consumidores de todos os processos
+        self.work_queue = work_queue
+        self.consumer: Optional[asyncio.Task] = None
+        # Renovação da posse dos jobs no outbox e retomada dos jobs de processos parados
+        self.outbox_watcher: Optional[asyncio.Task] = None
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: "OrderedDict[str, BulkJob]" = OrderedDict()
+        self.queue: Optional[asyncio.Queue] = None
+        # Jobs com início futuro (send_at ou janela de envio fechada)
+        self.scheduler = JobScheduler(self._release)
+        self.workers: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self):
+        """Inicia os workers que processam a fila de jobs"""
+        if self.workers:
+            return
+        self.queue = asyncio.Queue()
+        self.scheduler.start()
+        if self.receipts is not None:
+            await self.receipts.start()
+        if self.outbox is not None:
+            await self.outbox.start()
+            await self._resume_jobs()
+            self.outbox_watcher = asyncio.create_task(self._watch_outbox(), name="bulk-outbox-watcher")
+        if self.work_queue is not None:
+            await self.work_queue.start()
+            consumer = QueueConsumer(self.whatsapp_service, self.work_queue)
+            self.consumer = asyncio.create_task(consumer.run(), name="bulk-queue-consumer")
+        self.workers = [
+            asyncio.create_task(self._worker(i), name=f"bulk-job-worker-{i}")
+            for i in range(self.max_concurrent_jobs)
+        ]
+        logger.info(f"{len(self.workers)} worker(s) de envio em massa iniciados")
+
+    async def _watch_outbox(self):
+        """Renova a posse dos jobs deste processo e assume os de processos que pararam"""
+        while True:
+            await asyncio.sleep(DatabaseConfig.OUTBOX_HEARTBEAT_INTERVAL)
+            try:
+                await self.outbox.heartbeat()
+                await self._resume_jobs()
+            except Exception as e:
+                logger.error(f"Erro ao renovar os jobs no outbox: {str(e)}")
+
+    async def _resume_jobs(self):
+        """Reenfileira os jobs que estavam na fila ou em execução quando o processo dono parou"""
+        for record in await self.outbox.recover():
+            request = BulkMessageRequest.model_construct(**{**record["request"], "contacts": []})
+            job = BulkJob(record["job_id"], request)
+            job.created_at = datetime.fromtimestamp(record["created_at"])
+            job.restore(record["counts"])
+            job.pending = self.outbox.pending(job.job_id, complete=True)
+            self.jobs[job.job_id] = job
+            self._enqueue(job)
+            logger.info(
+                f"Job {job.job_id} retomado do outbox: {job.total_contacts - job.processed} pendentes, "
+                f"{record['counts'].get('uncertain', 0)} interrompidos durante o envio não serão reenviados"
+            )
+
+    async def stop(self):
+        """Cancela os workers e os jobs em andamento"""
+        self._stopping = True
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        await self.scheduler.stop()
+        if self.consumer is not None:
+            self.consumer.cancel()
+            await asyncio.gather(self.consumer, return_exceptions=True)
+            self.consumer = None
+            await self.work_queue.close()
+        if self.outbox is not None:
+            if self.outbox_watcher is not None:
+                self.outbox_watcher.cancel()
+                await asyncio.gather(self.outbox_watcher, return_exceptions=True)
+                self.outbox_watcher = None
+            feeders = [job.feeder for job in self.jobs.values() if job.feeder is not None]
+            for feeder in feeders:
+                feeder.cancel()
+            await asyncio.gather(*feeders, return_exceptions=True)
+            await self.outbox.release()
+            await self.outbox.stop()
+        if self.receipts is not None:
+            await self.receipts.stop()
+
+    async def submit(self, request: BulkMessageRequest, contacts=None, ingestion=None) -> BulkJob:
+        """
+        Enfileira uma campanha e retorna o job criado
+
+        Com outbox, a lista de contatos é gravada antes de o job ser aceito;
+        contatos em streaming são gravados à medida que chegam.
+
+        Args:
+            request: Dados da campanha
+            contacts: Fonte alternativa de contatos (ex: spool de upload em streaming)
+            ingestion: Relatório do upload, quando os contatos chegam em streaming
+        """
+        if self.queue is None:
+            raise RuntimeError("JobManager não foi iniciado")
+
+        job = BulkJob(uuid.uuid4().hex, request, contacts=contacts, ingestion=ingestion)
+        if self.outbox is not None:
+            await self._persist(job)
+        self.jobs[job.job_id] = job
+        self._prune_finished()
+        self._enqueue(job)
+
+        if job.status == "scheduled":
+            logger.info(
+                f"Job {job.job_id} agendado para {format_timestamp(job.scheduled_for)} "
+                f"com {job.total_contacts} contatos"
+            )
+        else:
+            logger.info(f"Job {job.job_id} enfileirado com {job.total_contacts} contatos")
+        return job
+
+    def _enqueue(self, job: BulkJob):
+        """Coloca o job na fila de execução ou, com início futuro, no agendador"""
+        start = job.start_time()
+        if start is not None and start > time.time():
+            job.status = "scheduled"
+            job.scheduled_for = start
+            self.scheduler.schedule(job, start)
+        else:
+            self.queue.put_nowait(job)
+
+    def _release(self, job: BulkJob):
+        """Chamado pelo agendador no horário de início do job"""
+        job.status = "queued"
+        job._publish("progress", job.progress())
+        self.queue.put_nowait(job)
+
+    async def _persist(self, job: BulkJob):
+        await self.outbox.create_job(job.job_id, job.request)
+        if job.contacts is None:
+            await self.outbox.add_contacts(job.job_id, job.request.contacts)
+            await self.outbox.mark_contacts_complete(job.job_id)
+            job.pending = self.outbox.pending(job.job_id, complete=True)
+        else:
+            job.pending = self.outbox.pending(job.job_id)
+            job.feeder = asyncio.create_task(self._feed(job), name=f"bulk-job-feeder-{job.job_id}")
+
+    async def _feed(self, job: BulkJob):
+        """Grava no outbox os contatos do upload em streaming à medida que chegam"""
+        seq = 0
+        last_write = None
+        async for contact in job.contacts:
+            last_write = self.outbox.add_contact(job.job_id, seq, contact)
+            seq += 1
+            if seq % FEED_FLUSH_EVERY == 0:
+                await last_write
+        if last_write is not None:
+            await last_write
+        await self.outbox.mark_contacts_complete(job.job_id)
+        job.pending.complete = True
+        self.outbox.notify()
+
+    def get(self, job_id: str) -> Optional[BulkJob]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [job.to_dict(include_results=False) for job in reversed(self.jobs.values())]
+
+    def cancel(self, job_id: str) -> Optional[BulkJob]:
+        """Cancela um job na fila ou em execução"""
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Ainda na fila: o worker descarta jobs já cancelados
+            job.mark_finished("cancelled")
+            if self.outbox is not None:
+                self.outbox.update_job(job.job_id, "cancelled")
+        return job
+
+    def _prune_finished(self):
+        """Descarta os jobs finalizados mais antigos além do limite de retenção"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            self.jobs.pop(job_id).results.close()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status == "cancelled":
+                    continue
+                job.task = asyncio.create_task(self._run(job))
+                try:
+                    await job.task
+                except asyncio.CancelledError:
+                    if self._stopping:
+                        # O próprio worker foi cancelado (desligamento)
+                        raise
+                    if not job.is_finished:
+                        # Cancelado antes de começar a executar
+                        job.mark_finished("cancelled")
+                        if self.outbox is not None:
+                            self.outbox.update_job(job.job_id, "cancelled")
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: BulkJob):
+        job.mark_started()
+        logger.info(f"Job {job.job_id} iniciado")
+
+        contacts, journal = job.contacts, None
+        if self.outbox is not None:
+            self.outbox.update_job(job.job_id, "running")
+            contacts, journal = job.pending, self.outbox.journal(job.job_id)
+
+        if job.request.delivery_window:
+            # Envios liberados só dentro da janela (e distribuídos até o fim dela com spread)
+            already_processed = job.processed
+            contacts = ReleaseGate(
+                contacts if contacts is not None else job.request.contacts,
+                DeliveryWindow.parse(job.request.delivery_window),
+                spread=bool(job.request.spread),
+                remaining=lambda released: job.total_contacts - already_processed - released
+            )
+
+        status, error = "completed", None
+        try:
+            if self.work_queue is not None:
+                await self._run_distributed(job, contacts, journal)
+            else:
+                async for result in self.whatsapp_service.iter_bulk_messages(
+                    job.request, contacts=contacts, journal=journal, adaptive=job.adaptive
+                ):
+                    self._record(job, result)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Erro no job {job.job_id}: {str(e)}")
+            status, error = "failed", str(e)
+        finally:
+            job.mark_finished(status, error)
+            if self.outbox is not None and not self._stopping:
+                # No desligamento o job continua "running" no outbox para ser retomado
+                self.outbox.update_job(job.job_id, status, error)
+            logger.info(f"Job {job.job_id} finalizado ({job.status}): {job.successful} sucessos, {job.failed} falhas")
+
+    def _record(self, job: BulkJob, result: Dict[str, Any]):
+        job.record(result)
+        if self.receipts is not None and result.get("success"):
+            self.receipts.register(result.get("message_id"), job.job_id)
+
+    def _apply_receipts(self, totals: Dict[str, Any]):
+        """Chamado pelo ReceiptTracker com (entregues, lidas) dos jobs alterados"""
+        for job_id, (delivered, read) in totals.items():
+            job = self.jobs.get(job_id)
+            if job is not None:
+                job.set_receipts(delivered, read)
+
+    async def refresh_receipts(self, jobs: List[BulkJob]):
+        """Lê do banco as confirmações dos jobs (inclui eventos recebidos por outros processos)"""
+        if self.receipts is None or not jobs:
+            return
+        self._apply_receipts(await self.receipts.counts([job.job_id for job in jobs]))
+
+    async def _run_distributed(self, job: BulkJob, contacts, journal):
+        """Publica as mensagens do job na fila compartilhada e coleta os resultados"""
+        queue = self.work_queue
+        feeder = None
+        if await queue.get_job(job.job_id) is None:
+            await queue.put_job(job.job_id, job.request.model_dump(mode="json", exclude={"contacts"}))
+            feeder = asyncio.create_task(self._feed_queue(job, contacts))
+        # Job retomado que continua na fila: as mensagens já foram publicadas
+
+        # Uma mensagem devolvida à fila (consumidor que parou) pode ter resultado
+        # publicado duas vezes; só o primeiro de cada seq conta
+        seen: Set[int] = set()
+        try:
+            while True:
+                if feeder is not None and feeder.done():
+                    feeder.result()
+                if (feeder is None or feeder.done()) and job.processed >= job.total_contacts:
+                    break
+                for payload in await queue.pop_results(job.job_id, RESULTS_BATCH_SIZE, BulkConfig.QUEUE_POLL_INTERVAL):
+                    data = json.loads(payload)
+                    if job.adaptive is not None and "adaptive" in data:
+                        job.adaptive.update_remote(data["consumer"], data["adaptive"])
+                    if data["seq"] in seen:
+                        continue
+                    seen.add(data["seq"])
+                    if journal is not None:
+                        await journal.finished(data["seq"], data["result"])
+                    self._record(job, data["result"])
+        except asyncio.CancelledError:
+            if not self._stopping:
+                # Cancelado: os consumidores param de reivindicar as mensagens restantes
+                await queue.finish_job(job.job_id)
+            raise
+        finally:
+            if feeder is not None and not feeder.done():
+                feeder.cancel()
+        await queue.finish_job(job.job_id)
+
+    async def _feed_queue(self, job: BulkJob, contacts):
+        """Publica os contatos do job na fila em lotes (um a um quando liberados pela janela de envio)"""
+        source = contacts if contacts is not None else job.request.contacts
+        numbered = getattr(source, "numbered", False)
+        batch_size = 1 if getattr(source, "paced", False) else PUSH_BATCH_SIZE
+        batch: List[str] = []
+        seq = 0
+        if hasattr(source, "__aiter__"):
+            async for item in source:
+                batch.append(encode_item(*item) if numbered else encode_item(seq, item))
+                seq += 1
+                if len(batch) >= batch_size:
+                    await self.work_queue.push(job.job_id, batch)
+                    batch = []
+        else:
+            for item in source:
+                batch.append(encode_item(*item) if numbered else encode_item(seq, item))
+                seq += 1
+                if len(batch) >= batch_size:
+                    await self.work_queue.push(job.job_id, batch)
+                    batch = []
+        await self.work_queue.push(job.job_id, batch)
+        await self.work_queue.mark_complete(job.job_id)
@@ -0,0 +1,164 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config import ServerConfig
+
+# Formatos de saída aceitos em LOG_FORMAT
+LOG_FORMATS = ("text", "json")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Marca os logs por mensagem enviada, sujeitos à amostragem (ex: logger.info(..., extra=PER_MESSAGE))
+PER_MESSAGE = {"per_message": True}
+
+# Loggers de terceiros que registram uma linha por envio (httpx: "HTTP Request: POST ...")
+PER_MESSAGE_LOGGERS = ("httpx",)
+
+# Atributos padrão do LogRecord (o restante vem de `extra` e vira campo do JSON; color_message é do uvicorn)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "per_message", "color_message"
+}
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON compacto por linha, com os campos de `extra` no nível principal"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRS:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+class MessageSampler(logging.Filter):
+    """
+    Mantém só uma fração dos logs por mensagem (marcados com PER_MESSAGE ou
+    vindos de PER_MESSAGE_LOGGERS)
+
+    Avisos e erros passam sempre; os demais logs não são afetados.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = min(max(rate, 0.0), 1.0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        if not getattr(record, "per_message", False) and record.name not in PER_MESSAGE_LOGGERS:
+            return True
+        return random.random() < self.rate
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira o registro sem formatá-lo e sem bloquear
+
+    A mensagem só é montada (msg % args) na thread de escrita; com a fila
+    cheia o registro é descartado e contado em `dropped`. Os argumentos do
+    log não devem ser alterados depois da chamada.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogPipeline:
+    """Fila de logs com uma thread que escreve no console e, opcionalmente, em arquivo"""
+
+    def __init__(self, handlers: List[logging.Handler], queue_size: int = ServerConfig.LOG_QUEUE_SIZE,
+                 sample_rate: float = ServerConfig.LOG_MESSAGE_SAMPLE_RATE):
+        self.queue: queue.Queue = queue.Queue(max(queue_size, 1))
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.handler.addFilter(MessageSampler(sample_rate))
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.running = False
+
+    def start(self):
+        if not self.running:
+            self.listener.start()
+            self.running = True
+
+    def stop(self):
+        """Escreve os registros pendentes e encerra a thread de escrita"""
+        if self.running:
+            self.listener.stop()
+            self.running = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"queued": self.queue.qsize(), "dropped": self.handler.dropped, "running": self.running}
+
+def build_formatter(log_format: str) -> logging.Formatter:
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"LOG_FORMAT deve ser um de {', '.join(LOG_FORMATS)}")
+    return JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+
+def build_handlers(log_format: str, log_file: str) -> List[logging.Handler]:
+    """Handlers de destino: console e, com `log_file`, arquivo rotativo ("{pid}" no nome separa os workers)"""
+    formatter = build_formatter(log_format)
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        path = log_file.format(pid=os.getpid())
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=int(ServerConfig.LOG_FILE_MAX_MB * 1024 * 1024),
+            backupCount=ServerConfig.LOG_FILE_BACKUPS,
+            encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+# Pipeline ativo (criado por setup_logging)
+pipeline: Optional[LogPipeline] = None
+
+def setup_logging(level: str = ServerConfig.LOG_LEVEL, log_format: str = ServerConfig.LOG_FORMAT,
+                  log_file: str = ServerConfig.LOG_FILE) -> LogPipeline:
+    """
+    Substitui os handlers do logger raiz pela fila de logs
+
+    Os logs do uvicorn (inclusive o access log) passam pela mesma fila. A
+    escrita pendente é concluída na saída do processo.
+    """
+    global pipeline
+    if pipeline is not None:
+        return pipeline
+
+    pipeline = LogPipeline(build_handlers(log_format, log_file))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(pipeline.handler)
+    root.setLevel(level.upper())
+
+    for name in ("uvicorn", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    return pipeline
@@ -1,24 +1,86 @@
-from fastapi import FastAPI, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Request, Form, Query, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import List
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict, List, Optional
+import asyncio
+import hashlib
+import hmac
 import json
 import logging
 from datetime import datetime
 import os
+import time
 
-from models import BulkMessageRequest, SingleMessageRequest, MessageResponse, ContactInfo
+from pydantic import BaseModel, ValidationError
+
+from models import BulkMessageRequest, SingleMessageRequest, MessageResponse, ContactInfo, ContactListRemoval
 from whatsapp_service import WhatsAppService
-from config import ServerConfig
+from phone_utils import dedupe_contacts
+from job_manager import JobManager
+from contact_stream import ContactSpool, IngestionReport, detect_format, ingest_contacts
+from outbox import open_outbox
+from contact_lists import open_contact_lists
+from media_store import MediaAsset, MediaTooLarge
+from receipts import open_receipts
+from idempotency import IdempotencyConflict, IdempotencyStore
+from work_queue import open_work_queue
+from config import BulkConfig, DatabaseConfig, MediaConfig, ServerConfig, WebhookConfig
+from bulk_results import stream_json, stream_ndjson
+from delivery_schedule import format_timestamp
+from request_timing import ServerTimingMiddleware, TimedRoute, instrument_logging
+from log_pipeline import setup_logging
+from profiler import PROFILE_MODES, profile
+import metrics
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging: fila com escrita em segundo plano (o tempo de enfileirar entra no Server-Timing)
+log_pipeline = setup_logging()
+instrument_logging()
 logger = logging.getLogger(__name__)
 
 # Obter path prefix da variável de ambiente
 ROOT_PATH = os.getenv("ROOT_PATH", "").rstrip("/")
 
+# Inicializar serviço WhatsApp
+whatsapp_service = WhatsAppService()
+
+# Fila de campanhas em massa processadas em segundo plano
+job_manager = JobManager(
+    whatsapp_service,
+    outbox=open_outbox(DatabaseConfig.DATABASE_URL),
+    work_queue=open_work_queue(BulkConfig.WORK_QUEUE, DatabaseConfig.REDIS_URL),
+    receipts=open_receipts()
+)
+metrics.bind_job_manager(job_manager)
+if job_manager.receipts is not None:
+    metrics.bind_receipts(job_manager.receipts)
+
+# Listas de contatos guardadas no servidor e referenciadas pelas campanhas via list_id
+contact_lists = open_contact_lists()
+metrics.bind_log_pipeline(log_pipeline)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Cria o cliente HTTP compartilhado e os workers de jobs na inicialização e os encerra no desligamento"""
+    await whatsapp_service.start()
+    if contact_lists is not None:
+        await contact_lists.start()
+    await job_manager.start()
+    if job_manager.receipts is not None and not WebhookConfig.TOKEN:
+        logger.warning(
+            "Webhook da Evolution API sem WEBHOOK_TOKEN: qualquer um pode alterar as contagens de entregues e lidas"
+        )
+    yield
+    await job_manager.stop()
+    if contact_lists is not None:
+        await contact_lists.stop()
+    await whatsapp_service.close()
+
+# Resultados dos envios por chave de idempotência (repetições não reenviam)
+idempotency_store = IdempotencyStore()
+
 # Inicializar FastAPI com root_path para subdiretórios
 app = FastAPI(
     title="WhatsApp Message Manager",
@@ -27,16 +89,21 @@ app = FastAPI(
     root_path=ROOT_PATH,  # Suporte para subdiretórios
     docs_url="/docs" if not ROOT_PATH else f"{ROOT_PATH}/docs",
     redoc_url="/redoc" if not ROOT_PATH else f"{ROOT_PATH}/redoc",
-    openapi_url="/openapi.json" if not ROOT_PATH else f"{ROOT_PATH}/openapi.json"
+    openapi_url="/openapi.json" if not ROOT_PATH else f"{ROOT_PATH}/openapi.json",
+    lifespan=lifespan
 )
 
+# Tempos por fase no cabeçalho Server-Timing e log de requisições lentas
+app.router.route_class = TimedRoute
+app.add_middleware(ServerTimingMiddleware)
+
+# Apenas um profiling por vez
+profile_lock = asyncio.Lock()
+
 # Configurar templates e arquivos estáticos
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Inicializar serviço WhatsApp
-whatsapp_service = WhatsAppService()
-
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """Página inicial do frontend"""
@@ -48,53 +115,170 @@ async def index(request: Request):
     }
     return templates.TemplateResponse("index.html", context)
 
+async def run_idempotent(scope: str, key: Optional[str], payload: BaseModel, handler):
+    """
+    Executa o handler uma única vez por chave de idempotência
+    
+    Sem chave, apenas executa. Com chave, a resposta original (status e
+    corpo) é guardada e devolvida às repetições com o cabeçalho
+    `Idempotent-Replayed: true`, sem chamar a Evolution API de novo.
+    """
+    if not key:
+        return await handler()
+    
+    fingerprint = hashlib.sha256(
+        payload.model_dump_json(exclude={"idempotency_key"}).encode("utf-8")
+    ).hexdigest()
+    
+    async def produce():
+        response = await handler()
+        if isinstance(response, StreamingResponse):
+            # A resposta guardada para as repetições precisa do corpo completo
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            return response.status_code, body, response.media_type
+        if not isinstance(response, Response):
+            response = JSONResponse(content=jsonable_encoder(response))
+        return response.status_code, response.body, response.media_type
+    
+    try:
+        (status_code, body, media_type), replayed = await idempotency_store.execute(
+            f"{scope}:{key}", fingerprint, produce
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    return Response(content=body, status_code=status_code, media_type=media_type, headers={
+        "Idempotency-Key": key,
+        "Idempotent-Replayed": "true" if replayed else "false"
+    })
+
 @app.post("/api/send-message", response_model=MessageResponse)
-async def send_single_message(message_data: SingleMessageRequest):
+async def send_single_message(
+    message_data: SingleMessageRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255)
+):
     """
     Endpoint para envio de mensagem individual
     Usado pelo frontend e pode ser chamado externamente
+    
+    Aceita `Idempotency-Key` (cabeçalho ou campo `idempotency_key`): repetições
+    com a mesma chave devolvem o resultado original sem reenviar.
     """
+    return await run_idempotent(
+        "send-message",
+        idempotency_key or message_data.idempotency_key,
+        message_data,
+        lambda: _send_single_message(message_data)
+    )
+
+async def _send_single_message(message_data: SingleMessageRequest):
     try:
         # Formatar mensagem personalizada
         formatted_message = whatsapp_service.format_message(
             name=message_data.name,
-            message=message_data.message
-        )
-        
-        # Enviar mensagem
-        result = whatsapp_service.send_message(
+            message=message_data.message,
             phone=message_data.phone,
-            text=formatted_message
+            variables=message_data.variables,
+            use_default_layout=message_data.use_default_layout
         )
         
+        # Enviar mensagem (com mídia, a mensagem formatada é a legenda)
+        if message_data.media_id:
+            result = await whatsapp_service.send_media(
+                phone=message_data.phone,
+                media=_get_media(message_data.media_id),
+                caption=formatted_message
+            )
+        else:
+            result = await whatsapp_service.send_message(
+                phone=message_data.phone,
+                text=formatted_message
+            )
+        
         logger.info(f"Mensagem enviada para {message_data.name} ({message_data.phone}): {result.success}")
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao enviar mensagem individual: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.post("/api/send-bulk-messages")
-async def send_bulk_messages(bulk_data: BulkMessageRequest):
+async def send_bulk_messages(
+    bulk_data: BulkMessageRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255)
+):
     """
     Endpoint principal para envio em massa
     Este é o endpoint que será chamado pelo sistema PHP
+    
+    Aceita `Idempotency-Key` (cabeçalho ou campo `idempotency_key`): repetições
+    com a mesma chave devolvem o resultado (ou o job_id) original sem reenviar.
     """
+    return await run_idempotent(
+        "send-bulk-messages",
+        idempotency_key or bulk_data.idempotency_key,
+        bulk_data,
+        lambda: _send_bulk_messages(bulk_data)
+    )
+
+async def _send_bulk_messages(bulk_data: BulkMessageRequest):
     try:
-        logger.info(f"Iniciando envio em massa para {len(bulk_data.contacts)} contatos")
+        if bulk_data.media_id:
+            _get_media(bulk_data.media_id, queued=bulk_data.background or bulk_data.scheduled)
+        
+        # Lista guardada no servidor: contatos já normalizados e sem duplicados
+        contacts = None
+        if bulk_data.list_id:
+            await _get_contact_list(bulk_data.list_id)
+            try:
+                contacts = await contact_lists.contacts(bulk_data.list_id, bulk_data.list_filter)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+        
+        # Evitar envios pagos duplicados para o mesmo número
+        duplicates_removed = 0
+        if bulk_data.deduplicate:
+            bulk_data.contacts, duplicates_removed = dedupe_contacts(bulk_data.contacts)
+        
+        if bulk_data.background or bulk_data.scheduled:
+            # Enfileirar (ou agendar) a campanha e responder imediatamente com o ID do job
+            job = await job_manager.submit(bulk_data, contacts=contacts)
+            return JSONResponse(status_code=202, content={
+                "success": True,
+                "job_id": job.job_id,
+                "status": job.status,
+                "scheduled_for": format_timestamp(job.scheduled_for),
+                "total_contacts": job.total_contacts,
+                "duplicates_removed": duplicates_removed,
+                "status_url": f"{ROOT_PATH}/api/jobs/{job.job_id}"
+            })
+        
+        logger.info(f"Iniciando envio em massa para {contacts.total if contacts else len(bulk_data.contacts)} contatos")
         
         # Enviar mensagens em massa
-        results = whatsapp_service.send_bulk_messages(bulk_data)
+        results = await whatsapp_service.send_bulk_messages(bulk_data, contacts=contacts)
         
         logger.info(f"Envio em massa concluído: {results['successful']} sucessos, {results['failed']} falhas")
-        return {
+        summary = {
             "success": True,
             "total_contacts": results['total_contacts'],
             "successful_sends": results['successful'],
             "failed_sends": results['failed'],
-            "results": results['results']
+            "duplicates_removed": duplicates_removed
         }
         
+        # Resultados gerados aos pedaços a partir do armazenamento compacto (sem montar a lista inteira)
+        if bulk_data.result_format == "summary":
+            results['results'].close()
+            return summary
+        if bulk_data.result_format == "ndjson":
+            return StreamingResponse(stream_ndjson(summary, results['results']), media_type="application/x-ndjson")
+        return StreamingResponse(stream_json(summary, results['results']), media_type="application/json")
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro no envio em massa: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
@@ -103,7 +287,9 @@ async def send_bulk_messages(bulk_data: BulkMessageRequest):
 async def send_bulk_form_data(
     request: Request,
     message: str = Form(...),
-    contacts_json: str = Form(...)
+    contacts_json: str = Form(...),
+    background: bool = Form(False),
+    adaptive_rate: bool = Form(False)
 ):
     """
     Endpoint para envio em massa via formulário do frontend
@@ -120,11 +306,13 @@ async def send_bulk_form_data(
         bulk_request = BulkMessageRequest(
             contacts=contacts,
             message=message,
-            delay=1000
+            delay=1000,
+            adaptive_rate=adaptive_rate,
+            background=background
         )
         
         # Reutilizar lógica do endpoint principal
-        return await send_bulk_messages(bulk_request)
+        return await _send_bulk_messages(bulk_request)
         
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="JSON dos contatos inválido")
@@ -132,50 +320,421 @@ async def send_bulk_form_data(
         logger.error(f"Erro no formulário de envio em massa: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+@app.post("/api/send-bulk-stream")
+async def send_bulk_stream(
+    request: Request,
+    message: str = Query(..., description="Mensagem a ser enviada (aceita placeholders {{campo}})"),
+    media_id: Optional[str] = Query(None, description="Mídia enviada em POST /api/media (a mensagem vira a legenda)"),
+    use_default_layout: bool = Query(True, description="Envolver a mensagem no layout padrão"),
+    format: Optional[str] = Query(None, description="ndjson ou csv (padrão: detectado pelo Content-Type)"),
+    delay: int = Query(1000, description="Delay entre mensagens em milissegundos"),
+    rate_per_second: Optional[float] = Query(None, description="Taxa máxima de envio por instância"),
+    burst: Optional[int] = Query(None, description="Envios imediatos permitidos antes de aplicar a taxa"),
+    adaptive_rate: bool = Query(False, description="Ajustar a taxa automaticamente conforme latência, 429 e 5xx"),
+    concurrency: Optional[int] = Query(None, description="Requisições simultâneas por instância"),
+    instances: Optional[str] = Query(None, description="Instâncias separadas por vírgula"),
+    send_at: Optional[datetime] = Query(None, description="Início agendado (ISO 8601; sem fuso usa BULK_TIMEZONE)"),
+    delivery_window: Optional[str] = Query(None, description="Janela diária de envio HH:MM-HH:MM"),
+    spread: bool = Query(False, description="Distribuir os envios uniformemente até o fim da janela")
+):
+    """
+    Envio em massa com upload de contatos em streaming (NDJSON ou CSV)
+    
+    O corpo é lido e validado linha a linha; os contatos aceitos são enviados
+    em segundo plano à medida que chegam. Linhas inválidas são relatadas sem
+    interromper o lote. A resposta traz o job_id e o relatório da ingestão.
+    """
+    fmt = detect_format(request.headers.get("content-type"), format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Envie application/x-ndjson ou text/csv (ou informe format=ndjson|csv)")
+    if media_id:
+        _get_media(media_id, queued=True)
+    
+    try:
+        bulk_request = BulkMessageRequest(
+            contacts=[],
+            message=message,
+            media_id=media_id,
+            use_default_layout=use_default_layout,
+            delay=delay,
+            rate_per_second=rate_per_second,
+            burst=burst,
+            adaptive_rate=adaptive_rate,
+            concurrency=concurrency,
+            instances=[name.strip() for name in instances.split(",") if name.strip()] if instances else None,
+            send_at=send_at,
+            delivery_window=delivery_window,
+            spread=spread,
+            background=True
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    
+    spool = ContactSpool()
+    report = IngestionReport()
+    job = await job_manager.submit(bulk_request, contacts=spool, ingestion=report)
+    
+    async def body_until_job_finished():
+        # Parar de ler o upload se o job for cancelado durante a ingestão
+        async for chunk in request.stream():
+            if job.is_finished:
+                break
+            yield chunk
+    
+    try:
+        await ingest_contacts(body_until_job_finished(), fmt, spool, report)
+        report.status = "completed"
+    except Exception as e:
+        # Upload interrompido ou cabeçalho inválido: o cliente não recebe o job_id,
+        # então o job é cancelado para não ficar pela metade sem dono
+        report.status = "failed"
+        job_manager.cancel(job.job_id)
+        logger.error(f"Erro na ingestão do upload do job {job.job_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Erro ao ler contatos: {str(e)}")
+    finally:
+        spool.close()
+    
+    logger.info(f"Upload do job {job.job_id} concluído: {report.accepted} aceitos, {report.rejected} rejeitados")
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "job_id": job.job_id,
+        "status": job.status,
+        "ingestion": report.to_dict(),
+        "status_url": f"{ROOT_PATH}/api/jobs/{job.job_id}"
+    })
+
+def _get_media(media_id: str, queued: bool = False) -> MediaAsset:
+    media = whatsapp_service.media.get(media_id)
+    if media is None:
+        raise HTTPException(status_code=404, detail=f"Mídia {media_id} não encontrada")
+    # A mídia fica no disco deste processo: os consumidores da fila em outros hosts não a encontrariam
+    if queued and getattr(job_manager.work_queue, "distributed", False) and not MediaConfig.SHARED:
+        raise HTTPException(
+            status_code=422,
+            detail="Mídias não podem ser usadas em jobs da fila compartilhada sem MEDIA_SHARED=true (MEDIA_DIR compartilhado)"
+        )
+    return media
+
+@app.post("/api/media")
+async def upload_media(
+    request: Request,
+    filename: str = Query("arquivo", description="Nome do arquivo exibido no WhatsApp (documentos)"),
+    mimetype: Optional[str] = Query(None, description="Tipo da mídia (padrão: Content-Type do upload)")
+):
+    """
+    Envia uma mídia (imagem, vídeo, documento ou áudio) para uso nas mensagens
+    
+    O corpo é o arquivo em si, lido em streaming e codificado uma única vez.
+    O `media_id` é o hash do conteúdo: o mesmo arquivo enviado de novo
+    devolve a mídia existente (HTTP 200 em vez de 201).
+    """
+    mimetype = mimetype or (request.headers.get("content-type") or "").split(";")[0].strip()
+    if not mimetype or "/" not in mimetype:
+        raise HTTPException(status_code=415, detail="Informe o tipo da mídia no Content-Type ou em mimetype (ex: application/pdf)")
+    try:
+        media, created = await whatsapp_service.media.save(request.stream(), mimetype, filename)
+    except MediaTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse({"success": True, **media.to_dict(), "deduplicated": not created}, status_code=201 if created else 200)
+
+@app.get("/api/media/{media_id}")
+async def get_media(media_id: str):
+    """Dados de uma mídia enviada"""
+    return {"success": True, **_get_media(media_id).to_dict()}
+
+async def _get_contact_list(list_id: str) -> Dict[str, Any]:
+    if contact_lists is None:
+        raise HTTPException(status_code=503, detail="Listas de contatos desativadas (configure CONTACT_LISTS_URL)")
+    contact_list = await contact_lists.get(list_id)
+    if contact_list is None:
+        raise HTTPException(status_code=404, detail=f"Lista de contatos {list_id} não encontrada")
+    return contact_list
+
+async def _ingest_into_list(request: Request, list_id: str, fmt: str) -> IngestionReport:
+    """Grava os contatos do corpo (NDJSON ou CSV) na lista; telefones já existentes são atualizados"""
+    report = IngestionReport()
+    try:
+        await ingest_contacts(request.stream(), fmt, contact_lists.writer(list_id), report)
+    except Exception as e:
+        report.status = "failed"
+        logger.error(f"Erro na ingestão da lista de contatos {list_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Erro ao ler contatos: {str(e)}")
+    report.status = "completed"
+    return report
+
+@app.post("/api/contact-lists", status_code=201)
+async def create_contact_list(
+    request: Request,
+    name: Optional[str] = Query(None, description="Nome da lista"),
+    format: Optional[str] = Query(None, description="ndjson ou csv (padrão: detectado pelo Content-Type)")
+):
+    """
+    Cria uma lista de contatos a partir de um upload em streaming (NDJSON ou CSV)
+    
+    Os telefones são normalizados e deduplicados uma única vez; as campanhas
+    passam a referenciar a lista com `list_id` em vez de reenviar os contatos.
+    """
+    if contact_lists is None:
+        raise HTTPException(status_code=503, detail="Listas de contatos desativadas (configure CONTACT_LISTS_URL)")
+    fmt = detect_format(request.headers.get("content-type"), format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Envie application/x-ndjson ou text/csv (ou informe format=ndjson|csv)")
+    
+    contact_list = await contact_lists.create(name)
+    try:
+        report = await _ingest_into_list(request, contact_list["list_id"], fmt)
+    except HTTPException:
+        await contact_lists.delete(contact_list["list_id"])
+        raise
+    contact_list = await contact_lists.touch(contact_list["list_id"])
+    logger.info(f"Lista de contatos {contact_list['list_id']} criada com {contact_list['size']} contatos")
+    return {"success": True, **contact_list, "ingestion": report.to_dict()}
+
+@app.get("/api/contact-lists")
+async def list_contact_lists():
+    """Listar as listas de contatos guardadas"""
+    if contact_lists is None:
+        raise HTTPException(status_code=503, detail="Listas de contatos desativadas (configure CONTACT_LISTS_URL)")
+    return {"success": True, "lists": await contact_lists.all()}
+
+@app.get("/api/contact-lists/{list_id}")
+async def get_contact_list(
+    list_id: str,
+    cursor: str = Query("", description="Telefone após o qual a página começa (next_cursor da página anterior)"),
+    limit: int = Query(100, ge=0, le=BulkConfig.RESULTS_MAX_PAGE_SIZE, description="Contatos por página (0: apenas os dados da lista)")
+):
+    """Dados de uma lista e uma página dos seus contatos, em ordem de telefone"""
+    contact_list = await _get_contact_list(list_id)
+    rows = await contact_lists.fetch(list_id, cursor, limit) if limit else []
+    contacts = [
+        {"name": name, "phone": phone, "variables": json.loads(variables) if variables else None}
+        for phone, name, variables in rows
+    ]
+    next_cursor = rows[-1][0] if limit and len(rows) == limit else None
+    return {"success": True, **contact_list, "contacts": contacts, "next_cursor": next_cursor}
+
+@app.post("/api/contact-lists/{list_id}/contacts")
+async def update_contact_list(
+    list_id: str,
+    request: Request,
+    format: Optional[str] = Query(None, description="ndjson ou csv (padrão: detectado pelo Content-Type)")
+):
+    """Atualização incremental: adiciona contatos novos e atualiza nome/variáveis dos telefones já na lista"""
+    await _get_contact_list(list_id)
+    fmt = detect_format(request.headers.get("content-type"), format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Envie application/x-ndjson ou text/csv (ou informe format=ndjson|csv)")
+    try:
+        report = await _ingest_into_list(request, list_id, fmt)
+    finally:
+        contact_list = await contact_lists.touch(list_id)
+    return {"success": True, **contact_list, "ingestion": report.to_dict()}
+
+@app.post("/api/contact-lists/{list_id}/contacts/remove")
+async def remove_from_contact_list(list_id: str, removal: ContactListRemoval):
+    """Remove contatos da lista pelo telefone"""
+    await _get_contact_list(list_id)
+    removed, invalid = await contact_lists.remove(list_id, removal.phones)
+    contact_list = await contact_lists.touch(list_id)
+    return {"success": True, **contact_list, "removed": removed, "invalid": invalid}
+
+@app.delete("/api/contact-lists/{list_id}")
+async def delete_contact_list(list_id: str):
+    """Exclui uma lista de contatos (jobs já criados a partir dela continuam lendo até o fim do que restar)"""
+    await _get_contact_list(list_id)
+    await contact_lists.delete(list_id)
+    return {"success": True, "list_id": list_id}
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """Listar os jobs de envio em massa conhecidos por este processo"""
+    await job_manager.refresh_receipts(list(job_manager.jobs.values()))
+    return {"success": True, "jobs": job_manager.list_jobs()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(
+    job_id: str,
+    include_results: bool = True,
+    cursor: int = Query(0, ge=0, description="Posição do primeiro resultado (next_cursor da página anterior)"),
+    limit: int = Query(BulkConfig.RESULTS_PAGE_SIZE, ge=1, le=BulkConfig.RESULTS_MAX_PAGE_SIZE, description="Resultados por página")
+):
+    """
+    Consultar progresso e resultados de um job de envio em massa
+    
+    Os resultados são paginados: repita a consulta com `cursor=next_cursor`
+    até next_cursor voltar nulo. Para a lista completa use /results.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
+    await job_manager.refresh_receipts([job])
+    data = job.to_dict(include_results=False)
+    if include_results:
+        data.update(job.results.page(cursor, limit))
+    return {"success": True, **data}
+
+@app.get("/api/jobs/{job_id}/results")
+async def download_job_results(job_id: str, cursor: int = Query(0, ge=0, description="Posição do primeiro resultado")):
+    """Download em streaming (NDJSON, um resultado por linha) dos resultados já registrados do job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
+    return StreamingResponse(
+        job.results.iter_ndjson(cursor),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="job-{job_id}-results.ndjson"'}
+    )
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, replay: bool = True):
+    """
+    Stream (Server-Sent Events) com cada resultado e os contadores do job em tempo real
+    Com replay=true os resultados já processados são reenviados ao conectar
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
+    return StreamingResponse(
+        job.events(replay=replay),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Desativar buffering do nginx
+        }
+    )
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancelar um job de envio em massa na fila ou em execução"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
+    return {"success": True, "job_id": job.job_id, "status": job.status}
+
+@app.post("/api/webhooks/evolution")
+@app.post("/api/webhooks/evolution/{event}")
+async def evolution_webhook(
+    request: Request,
+    event: Optional[str] = None,
+    token: Optional[str] = Query(None, description="Token do webhook (WEBHOOK_TOKEN)"),
+    x_webhook_token: Optional[str] = Header(None)
+):
+    """
+    Recebe os eventos da Evolution API (configure a URL do webhook da instância)
+    
+    Só `messages.update` é processado: o status de cada mensagem vai para um
+    buffer gravado em lote, e os jobs passam a mostrar `delivered` e `read`.
+    Os demais eventos são ignorados. Com "webhook por eventos" a Evolution
+    API acrescenta o evento ao caminho (ex: /messages-update).
+    """
+    if WebhookConfig.TOKEN:
+        provided = token or x_webhook_token or ""
+        # Comparado em bytes: compare_digest rejeita str com caracteres não ASCII
+        if not hmac.compare_digest(provided.encode(), WebhookConfig.TOKEN.encode()):
+            raise HTTPException(status_code=403, detail="Token do webhook inválido")
+    if job_manager.receipts is None:
+        raise HTTPException(status_code=503, detail="Confirmações de entrega desativadas (configure RECEIPTS_URL)")
+    try:
+        payload = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Corpo JSON inválido")
+    return {"success": True, "accepted": job_manager.receipts.ingest(payload, event)}
+
 @app.get("/api/test-connection")
-async def test_connection():
+async def test_connection(refresh: bool = False):
     """Testar conexão com Evolution API"""
     try:
-        result = whatsapp_service.test_connection()
+        result = await whatsapp_service.test_connection(refresh=refresh)
         return result
     except Exception as e:
         logger.error(f"Erro ao testar conexão: {str(e)}")
         return {"success": False, "error": str(e)}
 
 @app.get("/api/instance-status")
-async def get_instance_status():
+async def get_instance_status(refresh: bool = False):
     """Obter status detalhado da instância WhatsApp"""
     try:
-        result = whatsapp_service.get_instance_status()
+        result = await whatsapp_service.get_instance_status(refresh=refresh)
         return result
     except Exception as e:
         logger.error(f"Erro ao obter status da instância: {str(e)}")
         return {"success": False, "error": str(e)}
 
 @app.get("/api/whatsapp-connection")
-async def get_whatsapp_connection():
+async def get_whatsapp_connection(refresh: bool = False):
     """Verificar conexão específica do WhatsApp"""
     try:
-        result = whatsapp_service.get_whatsapp_connection_status()
+        result = await whatsapp_service.get_whatsapp_connection_status(refresh=refresh)
         return result
     except Exception as e:
         logger.error(f"Erro ao verificar conexão WhatsApp: {str(e)}")
         return {"success": False, "error": str(e)}
 
+async def run_checks(checks: Dict[str, Awaitable[Dict[str, Any]]], timeout: float) -> Dict[str, Dict[str, Any]]:
+    """
+    Executa verificações em paralelo sob um único prazo
+    
+    Verificações que não terminam dentro do prazo são canceladas e voltam
+    com `timed_out: true`; as consultas em cache continuam em segundo plano
+    e ficam disponíveis para o próximo diagnóstico.
+    """
+    started = time.monotonic()
+    finished_at: Dict[str, float] = {}
+    tasks = {}
+    for name, check in checks.items():
+        task = asyncio.ensure_future(check)
+        task.add_done_callback(lambda _, name=name: finished_at.setdefault(name, time.monotonic()))
+        tasks[name] = task
+    
+    await asyncio.wait(tasks.values(), timeout=timeout)
+    
+    results = {}
+    for name, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            results[name] = {
+                "success": False,
+                "timed_out": True,
+                "error": f"Verificação não concluída em {timeout:g}s"
+            }
+            continue
+        
+        try:
+            result = dict(task.result())
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        result["timed_out"] = False
+        result["duration_ms"] = round((finished_at[name] - started) * 1000, 1)
+        results[name] = result
+    return results
+
 @app.get("/api/full-diagnosis")
-async def full_diagnosis():
-    """Diagnóstico completo do sistema"""
+async def full_diagnosis(refresh: bool = False):
+    """Diagnóstico completo do sistema (verificações em paralelo sob o prazo DIAGNOSIS_TIMEOUT)"""
     try:
-        # Coletar todas as informações de diagnóstico
-        connection_test = whatsapp_service.test_connection()
-        instance_status = whatsapp_service.get_instance_status()
-        whatsapp_connection = whatsapp_service.get_whatsapp_connection_status()
+        started = time.monotonic()
+        
+        # Coletar todas as informações de diagnóstico em paralelo; o fetchInstances é
+        # compartilhado pelo cache de status entre as verificações que o utilizam
+        checks = await run_checks({
+            "evolution_api_connection": whatsapp_service.test_connection(refresh=refresh),
+            "instance_status": whatsapp_service.get_instance_status(refresh=refresh),
+            "whatsapp_connection": whatsapp_service.get_whatsapp_connection_status(refresh=refresh)
+        }, ServerConfig.DIAGNOSIS_TIMEOUT)
+        connection_test = checks["evolution_api_connection"]
+        instance_status = checks["instance_status"]
+        whatsapp_connection = checks["whatsapp_connection"]
+        timed_out = [name for name, result in checks.items() if result["timed_out"]]
         
         diagnosis = {
             "timestamp": datetime.now().isoformat(),
-            "evolution_api_connection": connection_test,
-            "instance_status": instance_status,
-            "whatsapp_connection": whatsapp_connection,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            "partial": bool(timed_out),
+            **checks,
+            "status_cache": whatsapp_service.status_cache.to_dict(),
+            "circuit_breakers": whatsapp_service.breakers.to_dict(),
             "summary": {
                 "api_reachable": connection_test.get("success", False),
                 "instance_found": instance_status.get("success", False),
@@ -185,18 +744,30 @@ async def full_diagnosis():
         }
         
         # Analisar problemas
-        if not connection_test.get("success"):
-            diagnosis["summary"]["issues"].append("Evolution API não está acessível")
+        issues = diagnosis["summary"]["issues"]
+        for name in timed_out:
+            issues.append(f"Verificação {name} não respondeu dentro do prazo")
+        
+        if not connection_test.get("success") and not connection_test["timed_out"]:
+            issues.append("Evolution API não está acessível")
+        
+        for name, breaker in diagnosis["circuit_breakers"].items():
+            if breaker["state"] != "closed":
+                issues.append(f"Circuito da instância {name} aberto: envios suspensos após falhas seguidas")
         
-        if not instance_status.get("success"):
-            diagnosis["summary"]["issues"].append("Instância não encontrada ou com erro")
+        if instance_status["timed_out"]:
+            pass  # Já reportado como prazo esgotado
+        elif not instance_status.get("success"):
+            issues.append("Instância não encontrada ou com erro")
         elif not instance_status.get("is_connected"):
-            diagnosis["summary"]["issues"].append("Instância não está conectada ao WhatsApp")
+            issues.append("Instância não está conectada ao WhatsApp")
             
-        if not whatsapp_connection.get("success"):
-            diagnosis["summary"]["issues"].append("Erro ao verificar conexão WhatsApp")
+        if whatsapp_connection["timed_out"]:
+            pass  # Já reportado como prazo esgotado
+        elif not whatsapp_connection.get("success"):
+            issues.append("Erro ao verificar conexão WhatsApp")
         elif not whatsapp_connection.get("is_whatsapp_connected"):
-            diagnosis["summary"]["issues"].append("WhatsApp não está conectado")
+            issues.append("WhatsApp não está conectado")
         else:
             diagnosis["summary"]["whatsapp_connected"] = True
         
@@ -207,15 +778,57 @@ async def full_diagnosis():
         return {"success": False, "error": str(e)}
 
 @app.get("/api/list-instances")
-async def list_instances():
+async def list_instances(refresh: bool = False):
     """Listar todas as instâncias disponíveis no Evolution API"""
     try:
-        result = whatsapp_service.list_all_instances()
+        result = await whatsapp_service.list_all_instances(refresh=refresh)
         return result
     except Exception as e:
         logger.error(f"Erro ao listar instâncias: {str(e)}")
         return {"success": False, "error": str(e)}
 
+if ServerConfig.ENABLE_METRICS:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        """Métricas no formato do Prometheus (habilitado com ENABLE_METRICS=true)"""
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+@app.post("/api/debug/profile", include_in_schema=False)
+async def debug_profile(
+    seconds: float = Query(10, gt=0, description="Duração da amostragem"),
+    interval_ms: float = Query(5, ge=1, le=1000, description="Intervalo entre amostras"),
+    mode: str = Query("cpu", description="cpu (pilha do event loop) ou wall (inclui as tasks aguardando)"),
+    x_debug_token: Optional[str] = Header(None)
+):
+    """
+    Profiling por amostragem do processo em produção (protegido por PROFILER_TOKEN)
+    
+    Amostra o event loop por `seconds` segundos e retorna as pilhas no formato
+    "collapsed" (flamegraph.pl, speedscope).
+    """
+    if not ServerConfig.PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_debug_token or not hmac.compare_digest(x_debug_token.encode(), ServerConfig.PROFILER_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Token de debug inválido")
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=422, detail=f"mode deve ser um de {', '.join(PROFILE_MODES)}")
+    if seconds > ServerConfig.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=422, detail=f"seconds deve ser no máximo {ServerConfig.PROFILER_MAX_SECONDS:g}")
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Já existe um profiling em andamento")
+    
+    async with profile_lock:
+        logger.info(f"Profiling iniciado: {seconds:g}s, intervalo {interval_ms:g} ms, modo {mode}")
+        profiler = await profile(seconds, interval_ms / 1000, mode)
+    
+    summary = profiler.summary()
+    return PlainTextResponse(profiler.collapsed(), headers={
+        "X-Profile-Samples": str(summary["samples"]),
+        "X-Profile-Stacks": str(summary["distinct_stacks"]),
+        "X-Profile-Sampler": "signal" if summary["signal_based"] else "thread",
+        "Content-Disposition": f'attachment; filename="profile-{mode}-{int(time.time())}.folded"'
+    })
+
 @app.get("/api/health")
 async def health_check():
     """
@@ -248,6 +861,19 @@ async def example_usage():
                     "delay": 1000
                 }
             },
+            "send_bulk_background": {
+                "url": "/api/send-bulk-messages",
+                "method": "POST",
+                "description": "Com background=true a resposta traz um job_id; acompanhe em GET /api/jobs/{job_id}",
+                "example_payload": {
+                    "contacts": [
+                        {"name": "João Silva", "phone": "+5511999999999"}
+                    ],
+                    "message": "Esta é uma mensagem de teste!",
+                    "delay": 1000,
+                    "background": True
+                }
+            },
             "send_single": {
                 "url": "/api/send-message",
                 "method": "POST",
@@ -0,0 +1,207 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from config import MediaConfig
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Bytes acumulados antes de codificar um bloco (múltiplo de 3: cada bloco em base64 é independente)
+ENCODE_BLOCK_SIZE = 3 * 64 * 1024
+
+# Bloco lido do arquivo codificado ao enviar mídias que não estão no cache
+READ_BLOCK_SIZE = 64 * 1024
+
+# Identificador da mídia: SHA-256 do conteúdo original
+MEDIA_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class MediaTooLarge(ValueError):
+    """Upload acima de MEDIA_MAX_UPLOAD_MB"""
+
+def media_type(mimetype: str) -> str:
+    """Tipo de mídia da Evolution API (image, video, audio ou document) a partir do mimetype"""
+    category = mimetype.split("/", 1)[0].lower()
+    return category if category in ("image", "video", "audio") else "document"
+
+class MediaAsset:
+    """Mídia enviada ao servidor, guardada já codificada em base64 (`<media_id>.b64`)"""
+
+    def __init__(self, media_id: str, mimetype: str, filename: str, size: int, encoded_size: int,
+                 path: str, created_at: Optional[float] = None):
+        self.media_id = media_id
+        self.mimetype = mimetype
+        self.filename = filename
+        self.size = size
+        self.encoded_size = encoded_size
+        self.path = path
+        self.created_at = created_at or time.time()
+
+    @property
+    def mediatype(self) -> str:
+        return media_type(self.mimetype)
+
+    @property
+    def is_audio(self) -> bool:
+        """Áudios vão para sendWhatsAppAudio (mensagem de voz, sem legenda)"""
+        return self.mediatype == "audio"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "media_id": self.media_id,
+            "mimetype": self.mimetype,
+            "mediatype": self.mediatype,
+            "filename": self.filename,
+            "size": self.size,
+            "encoded_size": self.encoded_size
+        }
+
+class MediaStore:
+    """
+    Mídias das mensagens, deduplicadas pelo hash do conteúdo
+
+    O upload é lido em streaming: o conteúdo é ao mesmo tempo resumido
+    (SHA-256) e codificado em base64 em blocos, direto para o arquivo, sem
+    manter o arquivo inteiro em memória. O mesmo conteúdo enviado de novo
+    reaproveita a mídia existente. No envio, a mídia codificada é reusada
+    por todos os contatos: as mais usadas ficam num cache LRU em memória
+    (até MEDIA_CACHE_MB) e as demais são lidas do disco em blocos.
+    """
+
+    def __init__(self, directory: str = MediaConfig.DIR,
+                 max_upload_bytes: int = int(MediaConfig.MAX_UPLOAD_MB * 1024 * 1024),
+                 cache_bytes: int = int(MediaConfig.CACHE_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_upload_bytes = max_upload_bytes
+        self.cache_bytes = cache_bytes
+        self.assets: Dict[str, MediaAsset] = {}
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._cached_bytes = 0
+
+    def _path(self, media_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{media_id}{suffix}")
+
+    async def save(self, chunks: AsyncIterator[bytes], mimetype: str, filename: str) -> Tuple[MediaAsset, bool]:
+        """
+        Grava uma mídia recebida em streaming
+
+        Returns:
+            Tuple: (mídia, True se foi criada; False se o conteúdo já existia)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix="upload-", suffix=".b64", dir=self.directory)
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        size = 0
+        encoded_size = 0
+        try:
+            with os.fdopen(fd, "wb") as writer:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise MediaTooLarge(f"Mídia acima do limite de {self.max_upload_bytes // (1024 * 1024)} MB")
+                    digest.update(chunk)
+                    buffer.extend(chunk)
+                    if len(buffer) >= ENCODE_BLOCK_SIZE:
+                        cut = len(buffer) - len(buffer) % 3
+                        encoded = base64.b64encode(buffer[:cut])
+                        writer.write(encoded)
+                        encoded_size += len(encoded)
+                        del buffer[:cut]
+                encoded = base64.b64encode(buffer)
+                writer.write(encoded)
+                encoded_size += len(encoded)
+            if size == 0:
+                raise ValueError("Mídia vazia")
+
+            media_id = digest.hexdigest()
+            existing = self.get(media_id)
+            if existing is not None:
+                os.remove(temp_path)
+                return existing, False
+
+            asset = MediaAsset(media_id, mimetype, filename, size, encoded_size, self._path(media_id, ".b64"))
+            os.replace(temp_path, asset.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with open(self._path(media_id, ".json"), "w", encoding="utf-8") as meta:
+            json.dump({**asset.to_dict(), "created_at": asset.created_at}, meta, ensure_ascii=False)
+        self.assets[media_id] = asset
+        logger.info(f"Mídia {media_id[:12]} gravada ({asset.mediatype}, {size} bytes)")
+        return asset, True
+
+    def get(self, media_id: str) -> Optional[MediaAsset]:
+        """Mídia pelo identificador (carrega os dados do disco na primeira consulta)"""
+        asset = self.assets.get(media_id)
+        if asset is not None or not MEDIA_ID_PATTERN.match(media_id or ""):
+            return asset
+        try:
+            with open(self._path(media_id, ".json"), encoding="utf-8") as meta:
+                data = json.load(meta)
+        except (OSError, ValueError):
+            return None
+        path = self._path(media_id, ".b64")
+        if not os.path.exists(path):
+            return None
+        asset = MediaAsset(
+            media_id, data["mimetype"], data["filename"], data["size"], data["encoded_size"], path, data.get("created_at")
+        )
+        self.assets[media_id] = asset
+        return asset
+
+    def _cached(self, asset: MediaAsset) -> Optional[bytes]:
+        """Conteúdo codificado em memória; mídias maiores que o cache são sempre lidas do disco"""
+        data = self._cache.get(asset.media_id)
+        if data is not None:
+            self._cache.move_to_end(asset.media_id)
+            return data
+        if asset.encoded_size > self.cache_bytes:
+            return None
+        with open(asset.path, "rb") as reader:
+            data = reader.read()
+        self._cache[asset.media_id] = data
+        self._cached_bytes += len(data)
+        while self._cached_bytes > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+        return data
+
+    def body(self, asset: MediaAsset, fields: Dict[str, Any], media_field: str) -> Tuple[int, AsyncIterator[bytes]]:
+        """
+        Corpo JSON de um envio: `fields` mais a mídia em base64 no campo `media_field`
+
+        Só os campos do contato são serializados a cada envio; a mídia
+        codificada entra como está. Retorna o tamanho do corpo (Content-Length)
+        e um iterador novo a cada chamada (uma por tentativa de envio).
+        """
+        prefix = json.dumps(fields, ensure_ascii=False)[:-1].encode("utf-8") + f',"{media_field}":"'.encode("ascii")
+        suffix = b'"}'
+        data = self._cached(asset)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            yield prefix
+            if data is not None:
+                yield data
+            else:
+                with open(asset.path, "rb") as reader:
+                    while True:
+                        block = reader.read(READ_BLOCK_SIZE)
+                        if not block:
+                            break
+                        yield block
+            yield suffix
+
+        return len(prefix) + asset.encoded_size + len(suffix), chunks()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"known": len(self.assets), "cached": len(self._cache), "cached_bytes": self._cached_bytes}
@@ -0,0 +1,89 @@
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Placeholders no formato {{campo}} ou {{campo|valor padrão}}
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([\w.]+)\s*(?:\|([^}]*))?\}\}")
+
+# Layout padrão das mensagens: Olá [Nome]! / [Mensagem] / [Data e hora atual]
+DEFAULT_LAYOUT = "Olá {{name}}!\n\n{message}\n\n{{datetime}}"
+
+DATETIME_FORMAT = "%d/%m/%Y às %H:%M"
+
+class TimestampClock:
+    """
+    Data/hora formatada recalculada apenas quando o minuto muda
+
+    O formato padrão só tem resolução de minutos, então todas as mensagens
+    do mesmo minuto compartilham a mesma string.
+    """
+
+    def __init__(self, fmt: str = DATETIME_FORMAT):
+        self.fmt = fmt
+        self._minute = None
+        self._value = ""
+
+    def now(self) -> str:
+        minute = int(time.time() // 60)
+        if minute != self._minute:
+            self._value = datetime.now().strftime(self.fmt)
+            self._minute = minute
+        return self._value
+
+# Relógio compartilhado por todos os templates
+timestamp_clock = TimestampClock()
+
+class MessageTemplate:
+    """
+    Template de mensagem compilado uma única vez por campanha
+
+    O texto é dividido em trechos literais e campos; renderizar para um
+    contato é apenas juntar os trechos com os valores do contato. Campos
+    disponíveis: `name`, `phone`, `datetime` e qualquer chave de `variables`
+    do contato. Campos ausentes usam o valor padrão do placeholder (ou vazio).
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        # Cada parte é (literal, None, None) ou (None, campo, padrão)
+        self.parts: List[Tuple[Optional[str], Optional[str], Optional[str]]] = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            if match.start() > position:
+                self.parts.append((source[position:match.start()], None, None))
+            self.parts.append((None, match.group(1), match.group(2) or ""))
+            position = match.end()
+        if position < len(source):
+            self.parts.append((source[position:], None, None))
+        self.fields = {field for _, field, _ in self.parts if field is not None}
+
+    def render(self, name: str, phone: str = "", variables: Optional[Dict[str, str]] = None) -> str:
+        builtins = {"name": name, "phone": phone}
+        if "datetime" in self.fields:
+            builtins["datetime"] = timestamp_clock.now()
+
+        chunks = []
+        for literal, field, default in self.parts:
+            if literal is not None:
+                chunks.append(literal)
+                continue
+            value = builtins.get(field)
+            if value is None and variables:
+                value = variables.get(field)
+            chunks.append(default if value is None or value == "" else str(value))
+        return "".join(chunks)
+
+@lru_cache(maxsize=256)
+def compile_template(message: str, use_default_layout: bool = True) -> MessageTemplate:
+    """
+    Compila a mensagem (opcionalmente dentro do layout padrão)
+
+    Templates ficam em cache para que envios individuais com a mesma
+    mensagem também não recompilem o texto.
+    """
+    if use_default_layout:
+        # O texto da mensagem entra literalmente no layout; seus placeholders continuam válidos
+        return MessageTemplate(DEFAULT_LAYOUT.replace("{message}", message))
+    return MessageTemplate(message)
@@ -0,0 +1,177 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.registry import Collector
+
+from config import ServerConfig
+from request_timing import record_phase
+
+# As métricas só são coletadas com ENABLE_METRICS=true
+ENABLED = ServerConfig.ENABLE_METRICS
+
+# Buckets de latência (segundos) das chamadas à Evolution API
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Janela (segundos) usada no cálculo de mensagens por segundo
+SEND_RATE_WINDOW = 60
+
+evolution_request_duration = Histogram(
+    "evolution_request_duration_seconds",
+    "Latência das requisições à Evolution API por endpoint",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+evolution_requests_in_flight = Gauge(
+    "evolution_requests_in_flight",
+    "Requisições à Evolution API em andamento por endpoint",
+    ["endpoint"]
+)
+messages_sent = Counter(
+    "whatsapp_messages_sent",
+    "Envios de mensagens por resultado e status HTTP",
+    ["outcome", "http_status"]
+)
+send_retries = Counter(
+    "evolution_send_retries",
+    "Novas tentativas de envio por resultado da tentativa que falhou",
+    ["outcome"]
+)
+messages_per_second = Gauge(
+    "whatsapp_messages_per_second",
+    f"Envios por segundo (média dos últimos {SEND_RATE_WINDOW}s)"
+)
+bulk_jobs_queued = Gauge("bulk_jobs_queued", "Jobs de envio em massa aguardando na fila")
+bulk_jobs_scheduled = Gauge("bulk_jobs_scheduled", "Jobs de envio em massa aguardando o horário agendado")
+bulk_jobs_running = Gauge("bulk_jobs_running", "Jobs de envio em massa em execução")
+bulk_contacts_pending = Gauge("bulk_contacts_pending", "Contatos ainda não enviados nos jobs ativos")
+webhook_receipts_pending = Gauge("webhook_receipts_pending", "Atualizações de status aguardando gravação")
+log_queue_size = Gauge("log_queue_size", "Registros de log aguardando a thread de escrita")
+
+class CounterFunctions(Collector):
+    """
+    Contadores cujos totais são mantidos por outros componentes
+
+    Os totais (só crescem desde o início do processo) são lidos a cada
+    coleta e expostos como Counter (`<nome>_total`), como um Gauge com
+    set_function, mas com o tipo certo para rate()/increase().
+    """
+
+    def __init__(self):
+        self.functions: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def bind(self, name: str, documentation: str, function: Callable[[], float]):
+        self.functions[name] = (documentation, function)
+
+    def collect(self) -> Iterator[CounterMetricFamily]:
+        for name, (documentation, function) in list(self.functions.items()):
+            yield CounterMetricFamily(name, documentation, value=function())
+
+counter_functions = CounterFunctions()
+REGISTRY.register(counter_functions)
+
+class RateMeter:
+    """Eventos por segundo numa janela deslizante, agregados em buckets de 1s"""
+
+    def __init__(self, window: int = SEND_RATE_WINDOW):
+        self.window = window
+        self.buckets = deque()  # [segundo, contagem]
+
+    def mark(self, count: int = 1):
+        now = int(time.monotonic())
+        if self.buckets and self.buckets[-1][0] == now:
+            self.buckets[-1][1] += count
+        else:
+            self.buckets.append([now, count])
+            self._trim(now)
+
+    def _trim(self, now: int):
+        while self.buckets and self.buckets[0][0] <= now - self.window:
+            self.buckets.popleft()
+
+    def rate(self) -> float:
+        self._trim(int(time.monotonic()))
+        return sum(count for _, count in self.buckets) / self.window
+
+send_rate = RateMeter()
+messages_per_second.set_function(send_rate.rate)
+
+@contextmanager
+def track_request(endpoint: str):
+    """Mede a latência e as requisições em andamento de um endpoint da Evolution API"""
+    started = time.perf_counter()
+    if not ENABLED:
+        try:
+            yield
+        finally:
+            record_phase("evolution", time.perf_counter() - started)
+        return
+
+    in_flight = evolution_requests_in_flight.labels(endpoint)
+    in_flight.inc()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        evolution_request_duration.labels(endpoint).observe(elapsed)
+        in_flight.dec()
+        record_phase("evolution", elapsed)
+
+def record_send(outcome: str, http_status: Optional[int] = None):
+    """
+    Contabiliza um envio
+
+    Args:
+        outcome: success, http_error, timeout, transport_error, error, unavailable ou circuit_open
+        http_status: Status HTTP da Evolution API (None quando não houve resposta)
+    """
+    if not ENABLED:
+        return
+    messages_sent.labels(outcome, str(http_status) if http_status is not None else "none").inc()
+    send_rate.mark()
+
+def record_retry(outcome: str):
+    """Contabiliza uma nova tentativa de envio após uma falha temporária (`outcome` da tentativa que falhou)"""
+    if ENABLED:
+        send_retries.labels(outcome).inc()
+
+def bind_job_manager(job_manager):
+    """Expõe a fila de jobs em massa; os valores são lidos a cada coleta"""
+    def active_jobs(status: str):
+        return [job for job in job_manager.jobs.values() if job.status == status]
+
+    bulk_jobs_queued.set_function(lambda: len(active_jobs("queued")))
+    bulk_jobs_scheduled.set_function(lambda: len(active_jobs("scheduled")))
+    bulk_jobs_running.set_function(lambda: len(active_jobs("running")))
+    bulk_contacts_pending.set_function(lambda: sum(
+        max(job.total_contacts - job.processed, 0)
+        for job in job_manager.jobs.values() if not job.is_finished
+    ))
+
+def bind_receipts(receipts):
+    """Expõe o buffer de confirmações do webhook; os valores são lidos a cada coleta"""
+    webhook_receipts_pending.set_function(lambda: receipts.pending)
+    counter_functions.bind(
+        "webhook_receipts_received", "Atualizações de status recebidas pelo webhook", lambda: receipts.received
+    )
+    counter_functions.bind(
+        "webhook_receipts_unmatched", "Atualizações de status sem mensagem de campanha correspondente",
+        lambda: receipts.unmatched
+    )
+    counter_functions.bind(
+        "webhook_receipts_dropped", "Atualizações de status descartadas com o buffer cheio", lambda: receipts.dropped
+    )
+
+def bind_log_pipeline(pipeline):
+    """Expõe a fila de logs; os valores são lidos a cada coleta"""
+    log_queue_size.set_function(pipeline.queue.qsize)
+    counter_functions.bind(
+        "log_records_dropped", "Registros de log descartados com a fila cheia", lambda: pipeline.handler.dropped
+    )
+
+def render() -> bytes:
+    """Métricas no formato de exposição do Prometheus"""
+    return generate_latest()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Servidor local que simula a Evolution API v2
+Implementa os endpoints usados pela aplicação (sendText, sendMedia,
+sendWhatsAppAudio, fetchInstances, connectionState e connect) com latência, erros e limite de taxa (429)
+configuráveis, para testes e benchmarks sem um servidor real.
+
+Uso:
+    python mock_evolution.py --port 8081 --latency-ms 150 --latency-dist lognormal \\
+        --error-rate 0.01 --rate-limit 20
+
+Aponte a aplicação para o simulador com:
+    EVOLUTION_SERVER_URL=http://127.0.0.1:8081 EVOLUTION_API_KEY=mock-key
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from rate_limiter import TokenBucket
+
+# Distribuições de latência aceitas
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# Endpoints de envio contados em messages_accepted
+SEND_ENDPOINTS = ("sendText ", "sendMedia ", "sendWhatsAppAudio ")
+
+# Amostras de latência guardadas para os percentis de /mock/stats
+MAX_LATENCY_SAMPLES = 100000
+
+class MockSettings:
+    """Comportamento do simulador (alterável em tempo de execução via POST /mock/config)"""
+
+    def __init__(self, api_key: str = "mock-key", instances: Optional[Dict[str, str]] = None,
+                 latency_ms: float = 100.0, latency_dist: str = "lognormal", latency_sigma: float = 0.5,
+                 error_rate: float = 0.0, error_status: int = 503, rate_limit: float = 0.0,
+                 retry_after: float = 1.0):
+        # Chave esperada no cabeçalho `apikey` (vazia aceita qualquer uma)
+        self.api_key = api_key
+        # Instâncias simuladas e o connectionStatus de cada uma
+        self.instances = instances or {"rodolfo": "open"}
+        # Latência mediana do sendText e sua distribuição (sigma: dispersão da lognormal)
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        # Fração dos envios que falha com `error_status`
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Envios por segundo aceitos por instância antes de responder 429 (0 desativa)
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+
+    def update(self, values: Dict[str, Any]):
+        for name, value in values.items():
+            if not hasattr(self, name):
+                raise ValueError(f"Configuração desconhecida: {name}")
+            setattr(self, name, value)
+        if self.latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_dist deve ser um de {', '.join(LATENCY_DISTRIBUTIONS)}")
+
+    def sample_latency(self) -> float:
+        """Latência de um envio em segundos"""
+        median = self.latency_ms / 1000
+        if self.latency_dist == "fixed":
+            return median
+        if self.latency_dist == "uniform":
+            return random.uniform(0, 2 * median)
+        return random.lognormvariate(math.log(median), self.latency_sigma) if median > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+class MockStats:
+    """Contadores das requisições atendidas pelo simulador"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.monotonic()
+        self.requests: Counter = Counter()
+        self.latencies: List[float] = []
+        # Envios aceitos por número (detecta mensagens duplicadas)
+        self.recipients: Counter = Counter()
+
+    def record(self, endpoint: str, status_code: int, latency: Optional[float] = None):
+        self.requests[f"{endpoint} {status_code}"] += 1
+        if latency is not None and len(self.latencies) < MAX_LATENCY_SAMPLES:
+            self.latencies.append(latency)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started_at
+        sent = sum(count for key, count in self.requests.items() if key.startswith(SEND_ENDPOINTS) and key.split()[1].startswith("2"))
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "requests": dict(self.requests),
+            "messages_accepted": sent,
+            "accepted_per_second": round(sent / elapsed, 3) if elapsed > 0 else 0.0,
+            "distinct_recipients": len(self.recipients),
+            "duplicate_sends": sum(count - 1 for count in self.recipients.values()),
+            "send_latency_ms": {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99)}
+        }
+
+def create_app(settings: Optional[MockSettings] = None) -> FastAPI:
+    """Cria o app do simulador"""
+    settings = settings or MockSettings()
+    stats = MockStats()
+    buckets: Dict[str, TokenBucket] = {}
+    app = FastAPI(title="Mock Evolution API")
+    app.state.settings = settings
+    app.state.stats = stats
+
+    def unauthorized(request: Request) -> Optional[JSONResponse]:
+        if settings.api_key and request.headers.get("apikey") != settings.api_key:
+            return JSONResponse({"status": 401, "error": "Unauthorized"}, status_code=401)
+        return None
+
+    def not_found(instance: str) -> JSONResponse:
+        return JSONResponse(
+            {"status": 404, "error": "Not Found", "response": {"message": [f'The "{instance}" instance does not exist']}},
+            status_code=404
+        )
+
+    def throttled(instance: str) -> bool:
+        if settings.rate_limit <= 0:
+            return False
+        bucket = buckets.get(instance)
+        if bucket is None:
+            bucket = buckets[instance] = TokenBucket(settings.rate_limit, max(1, int(settings.rate_limit)))
+        elif bucket.rate != settings.rate_limit:
+            bucket.set_rate(settings.rate_limit)
+        return not bucket.try_acquire()
+
+    def instance_payload(name: str, status: str) -> Dict[str, Any]:
+        return {
+            "instance": {
+                "instanceName": name,
+                "instanceId": str(uuid.uuid5(uuid.NAMESPACE_DNS, name)),
+                "owner": "5511999999999@s.whatsapp.net",
+                "profileName": f"Mock {name}",
+                "profilePictureUrl": None,
+                "number": "5511999999999",
+                "connectionStatus": status,
+                "serverUrl": "http://mock-evolution",
+                "apikey": settings.api_key or "mock-key",
+                "createdAt": "2024-01-01T00:00:00.000Z",
+                "updatedAt": "2024-01-01T00:00:00.000Z"
+            }
+        }
+
+    async def accept_send(endpoint: str, instance: str, request: Request, content_field: str,
+                          message_type: str) -> JSONResponse:
+        """Fluxo comum dos envios: autenticação, instância, limite de taxa, latência e falhas simuladas"""
+        error = unauthorized(request)
+        if error is not None:
+            stats.record(endpoint, error.status_code)
+            return error
+        if instance not in settings.instances:
+            stats.record(endpoint, 404)
+            return not_found(instance)
+        if throttled(instance):
+            stats.record(endpoint, 429)
+            return JSONResponse(
+                {"status": 429, "error": "Too Many Requests"},
+                status_code=429,
+                headers={"Retry-After": f"{settings.retry_after:g}"}
+            )
+
+        payload = await request.json()
+        if not payload.get("number") or not payload.get(content_field):
+            stats.record(endpoint, 400)
+            return JSONResponse({"status": 400, "error": "Bad Request", "response": {"message": [f"number e {content_field} são obrigatórios"]}}, status_code=400)
+
+        latency = settings.sample_latency()
+        await asyncio.sleep(latency)
+
+        if settings.instances[instance] != "open":
+            stats.record(endpoint, 500, latency)
+            return JSONResponse({"status": 500, "error": "Internal Server Error", "response": {"message": "Connection Closed"}}, status_code=500)
+        if settings.error_rate > 0 and random.random() < settings.error_rate:
+            stats.record(endpoint, settings.error_status, latency)
+            return JSONResponse({"status": settings.error_status, "error": "Simulated failure"}, status_code=settings.error_status)
+
+        stats.record(endpoint, 201, latency)
+        stats.recipients[payload["number"]] += 1
+        message = {"extendedTextMessage": {"text": payload["text"]}} if content_field == "text" else {
+            message_type.format(**payload): {"mimetype": payload.get("mimetype"), "caption": payload.get("caption"), "fileLength": len(payload[content_field]) * 3 // 4}
+        }
+        return JSONResponse({
+            "key": {"remoteJid": f"{payload['number']}@s.whatsapp.net", "fromMe": True, "id": uuid.uuid4().hex[:20].upper()},
+            "message": message,
+            "messageTimestamp": int(time.time()),
+            "status": "PENDING"
+        }, status_code=201)
+
+    @app.post("/message/sendText/{instance}")
+    async def send_text(instance: str, request: Request):
+        return await accept_send("sendText", instance, request, "text", "extendedTextMessage")
+
+    @app.post("/message/sendMedia/{instance}")
+    async def send_media(instance: str, request: Request):
+        return await accept_send("sendMedia", instance, request, "media", "{mediatype}Message")
+
+    @app.post("/message/sendWhatsAppAudio/{instance}")
+    async def send_audio(instance: str, request: Request):
+        return await accept_send("sendWhatsAppAudio", instance, request, "audio", "audioMessage")
+
+    @app.get("/instance/fetchInstances")
+    async def fetch_instances(request: Request):
+        error = unauthorized(request)
+        if error is not None:
+            stats.record("fetchInstances", error.status_code)
+            return error
+        stats.record("fetchInstances", 200)
+        return [instance_payload(name, status) for name, status in settings.instances.items()]
+
+    @app.get("/instance/connectionState/{instance}")
+    async def connection_state(instance: str, request: Request):
+        error = unauthorized(request)
+        if error is not None:
+            stats.record("connectionState", error.status_code)
+            return error
+        if instance not in settings.instances:
+            stats.record("connectionState", 404)
+            return not_found(instance)
+        stats.record("connectionState", 200)
+        return {"instance": {"instanceName": instance, "state": settings.instances[instance]}}
+
+    @app.get("/instance/connect/{instance}")
+    async def connect(instance: str, request: Request):
+        error = unauthorized(request)
+        if error is not None:
+            stats.record("connect", error.status_code)
+            return error
+        if instance not in settings.instances:
+            stats.record("connect", 404)
+            return not_found(instance)
+        stats.record("connect", 200)
+        if settings.instances[instance] == "open":
+            return {"instance": {"instanceName": instance, "state": "open"}}
+        return {"pairingCode": None, "code": f"2@mock-{instance}", "count": 1}
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        """Contadores por endpoint/status, vazão aceita e percentis da latência simulada"""
+        return {**stats.to_dict(), "settings": settings.to_dict()}
+
+    @app.post("/mock/reset")
+    async def reset_stats():
+        stats.reset()
+        buckets.clear()
+        return {"success": True}
+
+    @app.post("/mock/config")
+    async def update_config(request: Request):
+        """Altera o comportamento em tempo de execução (ex: {"error_rate": 0.2} ou {"instances": {"rodolfo": "close"}})"""
+        try:
+            settings.update(await request.json())
+        except ValueError as e:
+            return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+        return {"success": True, "settings": settings.to_dict()}
+
+    return app
+
+def parse_instances(value: str) -> Dict[str, str]:
+    """Converte "rodolfo,vendas:close" em {instância: connectionStatus}"""
+    instances = {}
+    for item in value.split(","):
+        name, _, status = item.strip().partition(":")
+        if name:
+            instances[name] = status or "open"
+    return instances
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Simulador local da Evolution API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--api-key", default="mock-key", help="Chave esperada no cabeçalho apikey (vazia aceita qualquer uma)")
+    parser.add_argument("--instances", default="rodolfo", help="Instâncias e status, ex: rodolfo,vendas:close")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Latência mediana do sendText")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Dispersão da distribuição lognormal")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração dos envios que falha")
+    parser.add_argument("--error-status", type=int, default=503, help="Status HTTP das falhas simuladas")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Envios/segundo por instância antes de responder 429 (0 desativa)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Valor do cabeçalho Retry-After nas respostas 429")
+    return parser
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(
+        api_key=args.api_key,
+        instances=parse_instances(args.instances),
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after
+    )
+
+def main():
+    import uvicorn
+
+    args = build_parser().parse_args()
+    app = create_app(settings_from_args(args))
+    print(f"🧪 Mock Evolution API em http://{args.host}:{args.port} (estatísticas em /mock/stats)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
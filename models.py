@@ -1,55 +1,86 @@
+from datetime import datetime
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional
-import re
+from typing import Any, Dict, List, Literal, Optional
+
+from config import BulkConfig
+from delivery_schedule import DeliveryWindow
+from phone_utils import normalize_phone
 
 class ContactInfo(BaseModel):
     """Modelo para informações de contato"""
     name: str = Field(..., description="Nome do contato")
     phone: str = Field(..., description="Número do telefone com código do país")
+    variables: Optional[Dict[str, Any]] = Field(None, description="Variáveis do contato para os placeholders {{campo}} da mensagem")
     
     @validator('phone')
     def validate_phone(cls, v):
-        """Valida o formato do número de telefone"""
-        # Remove espaços e caracteres especiais
-        phone_clean = re.sub(r'[^\d+]', '', v)
-        
-        # Verifica se tem o código do país
-        if not phone_clean.startswith('+'):
-            # Assume código do Brasil se não especificado
-            phone_clean = '+55' + phone_clean
-        
-        # Verifica se o número tem pelo menos 10 dígitos (sem código do país)
-        digits_only = re.sub(r'[^\d]', '', phone_clean)
-        if len(digits_only) < 10:
-            raise ValueError('Número de telefone deve ter pelo menos 10 dígitos')
-        
-        return phone_clean
+        """Valida e normaliza o número de telefone para E.164"""
+        return normalize_phone(v)
 
 class BulkMessageRequest(BaseModel):
     """Modelo para requisição de envio em massa"""
-    contacts: List[ContactInfo] = Field(..., description="Lista de contatos")
-    message: str = Field(..., description="Mensagem a ser enviada")
-    delay: Optional[int] = Field(1000, description="Delay entre mensagens em milissegundos")
+    contacts: List[ContactInfo] = Field(default_factory=list, description="Lista de contatos (ou list_id de uma lista guardada no servidor)")
+    list_id: Optional[str] = Field(None, description="Enviar para uma lista de contatos guardada no servidor (POST /api/contact-lists)")
+    list_filter: Optional[Dict[str, Any]] = Field(None, description="Filtro sobre as variáveis dos contatos da lista, ex: {\"cidade\": \"Recife\", \"plano\": [\"ouro\", \"prata\"]}")
+    message: str = Field(..., description="Mensagem a ser enviada (aceita placeholders {{campo}} e {{campo|padrão}})")
+    media_id: Optional[str] = Field(None, description="Mídia enviada em POST /api/media; a mensagem vira a legenda (áudios não têm legenda)")
+    use_default_layout: Optional[bool] = Field(True, description="Envolver a mensagem no layout padrão (Olá [Nome]! ... data e hora)")
+    delay: Optional[int] = Field(1000, description="Delay entre mensagens em milissegundos (usado quando rate_per_second não é informado)")
+    rate_per_second: Optional[float] = Field(None, gt=0, description="Taxa máxima de envio por instância de peso 1 (mensagens/segundo)")
+    burst: Optional[int] = Field(None, ge=1, description="Envios imediatos permitidos antes de aplicar a taxa")
+    adaptive_rate: Optional[bool] = Field(False, description="Ajustar a taxa automaticamente (AIMD) conforme latência, 429 e 5xx; rate_per_second/delay definem a taxa inicial")
+    concurrency: Optional[int] = Field(None, ge=1, le=BulkConfig.MAX_CONCURRENCY, description="Requisições simultâneas em andamento por instância")
+    instances: Optional[List[str]] = Field(None, description="Instâncias usadas na campanha (padrão: pool configurado em EVOLUTION_INSTANCE_POOL)")
+    background: Optional[bool] = Field(False, description="Processar em segundo plano e retornar um job_id imediatamente")
+    send_at: Optional[datetime] = Field(None, description="Início agendado da campanha (ISO 8601; sem fuso usa BULK_TIMEZONE). Implica background")
+    delivery_window: Optional[str] = Field(None, description="Janela diária de envio HH:MM-HH:MM (ex: 09:00-18:00); fora dela o envio pausa. Implica background")
+    spread: Optional[bool] = Field(False, description="Distribuir os envios uniformemente até o fim da janela de envio (requer delivery_window)")
+    deduplicate: Optional[bool] = Field(True, description="Remover contatos com telefone repetido (mantém a primeira ocorrência)")
+    result_format: Optional[Literal["full", "summary", "ndjson"]] = Field("full", description="Resposta do envio síncrono: full (JSON com todos os resultados), summary (só contadores) ou ndjson (resumo na primeira linha e um resultado por linha)")
+    idempotency_key: Optional[str] = Field(None, max_length=255, description="Chave de idempotência (alternativa ao cabeçalho Idempotency-Key)")
+    
+    @validator('list_id')
+    def validate_list_id(cls, v, values):
+        if v and values.get('contacts'):
+            raise ValueError("Informe contacts ou list_id, não ambos")
+        return v
+    
+    @validator('delivery_window')
+    def validate_delivery_window(cls, v):
+        """Valida o formato HH:MM-HH:MM da janela de envio"""
+        if v:
+            return str(DeliveryWindow.parse(v))
+        return v
+    
+    @validator('spread')
+    def validate_spread(cls, v, values):
+        if v and not values.get('delivery_window'):
+            raise ValueError("spread requer delivery_window")
+        return v
+    
+    @property
+    def scheduled(self) -> bool:
+        """Campanha com início agendado ou janela de envio (processada em segundo plano)"""
+        return bool(self.send_at or self.delivery_window)
+
+class ContactListRemoval(BaseModel):
+    """Modelo para remoção de contatos de uma lista guardada no servidor"""
+    phones: List[str] = Field(..., description="Telefones a remover (normalizados como no upload)")
 
 class SingleMessageRequest(BaseModel):
     """Modelo para requisição de mensagem individual"""
     name: str = Field(..., description="Nome do destinatário")
     phone: str = Field(..., description="Número do telefone")
-    message: str = Field(..., description="Mensagem a ser enviada")
+    message: str = Field(..., description="Mensagem a ser enviada (aceita placeholders {{campo}} e {{campo|padrão}})")
+    variables: Optional[Dict[str, Any]] = Field(None, description="Variáveis para os placeholders {{campo}} da mensagem")
+    media_id: Optional[str] = Field(None, description="Mídia enviada em POST /api/media; a mensagem vira a legenda (áudios não têm legenda)")
+    use_default_layout: Optional[bool] = Field(True, description="Envolver a mensagem no layout padrão (Olá [Nome]! ... data e hora)")
+    idempotency_key: Optional[str] = Field(None, max_length=255, description="Chave de idempotência (alternativa ao cabeçalho Idempotency-Key)")
     
     @validator('phone')
     def validate_phone(cls, v):
-        """Valida o formato do número de telefone"""
-        phone_clean = re.sub(r'[^\d+]', '', v)
-        
-        if not phone_clean.startswith('+'):
-            phone_clean = '+55' + phone_clean
-        
-        digits_only = re.sub(r'[^\d]', '', phone_clean)
-        if len(digits_only) < 10:
-            raise ValueError('Número de telefone deve ter pelo menos 10 dígitos')
-        
-        return phone_clean
+        """Valida e normaliza o número de telefone para E.164"""
+        return normalize_phone(v)
 
 class MessageResponse(BaseModel):
     """Modelo para resposta de envio de mensagem"""
@@ -0,0 +1,407 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from config import DatabaseConfig
+from models import BulkMessageRequest, ContactInfo
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Operações gravadas por transação (group commit)
+WRITE_BATCH_SIZE = 1000
+
+# Contatos lidos do outbox por consulta durante o envio
+READ_PAGE_SIZE = 500
+
+# Contatos gravados entre esperas pela confirmação (controle de vazão da ingestão)
+FEED_FLUSH_EVERY = 1000
+
+# Situação de um job que ainda deve ser executado após um reinício
+UNFINISHED_JOB_STATUSES = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    request TEXT NOT NULL,
+    status TEXT NOT NULL,
+    contacts_complete INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    heartbeat_at REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    variables TEXT,
+    state TEXT NOT NULL,
+    instance TEXT,
+    message_id TEXT,
+    error TEXT,
+    queued_at REAL NOT NULL,
+    sending_at REAL,
+    finished_at REAL,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+"""
+
+INSERT_MESSAGE = (
+    "INSERT OR IGNORE INTO messages (job_id, seq, name, phone, variables, state, queued_at) "
+    "VALUES (?, ?, ?, ?, ?, 'pending', ?)"
+)
+MARK_SENDING = (
+    "UPDATE messages SET state = 'sending', instance = ?, sending_at = ? "
+    "WHERE job_id = ? AND seq = ?"
+)
+MARK_FINISHED = (
+    "UPDATE messages SET state = ?, instance = ?, message_id = ?, error = ?, finished_at = ? "
+    "WHERE job_id = ? AND seq = ?"
+)
+
+# Colunas acrescentadas a bancos criados por versões anteriores
+JOB_COLUMNS = {"owner": "TEXT", "heartbeat_at": "REAL"}
+
+# Erro registrado para mensagens interrompidas no meio do envio
+UNCERTAIN_ERROR = "Envio interrompido por reinício; não reenviado para evitar duplicidade"
+
+def sqlite_path(database_url: Optional[str]) -> Optional[str]:
+    """
+    Caminho do arquivo a partir de DATABASE_URL
+
+    `sqlite:///data/outbox.db` (relativo) ou `sqlite:////var/lib/app/outbox.db`
+    (absoluto). Retorna None para URLs que não são SQLite.
+    """
+    if not database_url or not database_url.startswith("sqlite://"):
+        return None
+    path = database_url[len("sqlite://"):]
+    if path.startswith("/"):
+        path = path[1:]
+    return path or ":memory:"
+
+class PendingMessages:
+    """
+    Contatos pendentes de um job lidos do outbox em ordem
+
+    Produz pares (seq, contato). Enquanto a ingestão não termina, aguarda
+    novos contatos gravados em vez de encerrar.
+    """
+
+    # O BulkSender usa o seq do outbox em vez de numerar os contatos
+    numbered = True
+
+    def __init__(self, outbox: "SQLiteOutbox", job_id: str, complete: bool = False):
+        self.outbox = outbox
+        self.job_id = job_id
+        self.complete = complete
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[int, ContactInfo]]:
+        last_seq = -1
+        while True:
+            # Capturados antes da consulta para não perder uma gravação concorrente
+            committed = self.outbox.committed
+            complete = self.complete
+            rows = await self.outbox.fetch_pending(self.job_id, last_seq, READ_PAGE_SIZE)
+            for seq, name, phone, variables in rows:
+                last_seq = seq
+                yield seq, ContactInfo.model_construct(
+                    name=name, phone=phone, variables=json.loads(variables) if variables else None
+                )
+            if rows:
+                continue
+            if complete:
+                return
+            await committed.wait()
+
+class OutboxJournal:
+    """Registra as transições de estado das mensagens de um job durante o envio"""
+
+    def __init__(self, outbox: "SQLiteOutbox", job_id: str):
+        self.outbox = outbox
+        self.job_id = job_id
+
+    async def sending(self, seq: int, instance: Optional[str]):
+        """Grava (com confirmação) que a mensagem vai ser enviada; chamado antes do envio"""
+        await self.outbox.write(MARK_SENDING, (instance, time.time(), self.job_id, seq))
+
+    async def finished(self, seq: int, result: Dict[str, Any]):
+        """Grava o resultado do envio (sem aguardar a confirmação)"""
+        self.outbox.write(MARK_FINISHED, (
+            "sent" if result.get("success") else "failed",
+            result.get("instance"),
+            result.get("message_id"),
+            result.get("error"),
+            time.time(),
+            self.job_id,
+            seq
+        ))
+
+class SQLiteOutbox:
+    """
+    Outbox persistente das campanhas em massa (SQLite em modo WAL)
+
+    Cada mensagem passa por pending → sending → sent/failed. A marcação
+    `sending` é confirmada no disco antes do envio; assim, após um reinício,
+    as mensagens `pending` são retomadas e as que estavam `sending` viram
+    `uncertain` (não são reenviadas, pois podem ter sido entregues).
+
+    As gravações passam por uma fila e são aplicadas em lote numa única
+    transação (group commit) por uma thread dedicada, que é a única dona da
+    conexão SQLite.
+
+    Vários processos (WORKERS > 1) podem usar o mesmo arquivo: cada job tem
+    um dono (`owner`) que renova `heartbeat_at` periodicamente, e a retomada
+    só assume, numa transação exclusiva, jobs sem dono ou com a posse vencida.
+    """
+
+    def __init__(self, path: str, retention_days: float = DatabaseConfig.OUTBOX_RETENTION_DAYS,
+                 lease_timeout: float = DatabaseConfig.OUTBOX_LEASE_TIMEOUT):
+        self.path = path
+        self.retention_days = retention_days
+        self.lease_timeout = lease_timeout
+        # Identifica este processo como dono dos jobs que executa
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.committed = asyncio.Event()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._queue = asyncio.Queue()
+        await self._run(self._open)
+        self._writer = asyncio.create_task(self._write_loop(), name="outbox-writer")
+        logger.info(f"Outbox de envios em massa: {self.path}")
+
+    async def stop(self):
+        """Grava as operações pendentes e fecha a conexão"""
+        if self._writer is None:
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._writer = None
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory and self.path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Em WAL, NORMAL só pode perder transações numa queda de energia, não do processo
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+        for name, kind in JOB_COLUMNS.items():
+            if name not in columns:
+                try:
+                    self._connection.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+                except sqlite3.OperationalError:
+                    # Outro processo acrescentou a coluna ao mesmo tempo
+                    pass
+        self._prune()
+
+    def _close(self):
+        self._connection.close()
+        self._connection = None
+
+    def _prune(self):
+        """Remove jobs finalizados há mais de retention_days"""
+        if self.retention_days <= 0:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        placeholders = ",".join("?" for _ in UNFINISHED_JOB_STATUSES)
+        with self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.execute(
+                f"DELETE FROM messages WHERE job_id IN (SELECT job_id FROM jobs "
+                f"WHERE status NOT IN ({placeholders}) AND updated_at < ?)",
+                (*UNFINISHED_JOB_STATUSES, cutoff)
+            )
+            self._connection.execute(
+                f"DELETE FROM jobs WHERE status NOT IN ({placeholders}) AND updated_at < ?",
+                (*UNFINISHED_JOB_STATUSES, cutoff)
+            )
+
+    def write(self, sql: str, params: Tuple) -> asyncio.Future:
+        """
+        Enfileira uma gravação
+
+        Returns:
+            Future resolvido quando a transação do lote é confirmada; quem
+            não precisa da confirmação pode simplesmente não aguardá-lo
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sql, params, future))
+        return future
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._run(self._apply, [(sql, params) for sql, params, _ in batch])
+            except Exception as e:
+                logger.error(f"Erro ao gravar {len(batch)} operações no outbox: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                        # Evita aviso de exceção não observada em gravações sem espera
+                        future.exception()
+            else:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                self.notify()
+
+    def notify(self):
+        """Acorda os leitores aguardando novos contatos"""
+        committed, self.committed = self.committed, asyncio.Event()
+        committed.set()
+
+    def _apply(self, operations: List[Tuple[str, Tuple]]):
+        with self._connection:
+            self._connection.execute("BEGIN")
+            for sql, params in operations:
+                self._connection.execute(sql, params)
+
+    async def create_job(self, job_id: str, request: BulkMessageRequest):
+        now = time.time()
+        await self.write(
+            "INSERT INTO jobs (job_id, request, status, created_at, updated_at, owner, heartbeat_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, request.model_dump_json(exclude={"contacts"}), now, now, self.owner, now)
+        )
+
+    def add_contact(self, job_id: str, seq: int, contact: ContactInfo) -> asyncio.Future:
+        variables = json.dumps(contact.variables, ensure_ascii=False) if contact.variables else None
+        return self.write(INSERT_MESSAGE, (job_id, seq, contact.name, contact.phone, variables, time.time()))
+
+    async def add_contacts(self, job_id: str, contacts: Iterable[ContactInfo], start_seq: int = 0) -> int:
+        """Grava os contatos de um job e aguarda a confirmação; retorna o próximo seq"""
+        seq = start_seq
+        future = None
+        for contact in contacts:
+            future = self.add_contact(job_id, seq, contact)
+            seq += 1
+            if seq % FEED_FLUSH_EVERY == 0:
+                await future
+        if future is not None:
+            await future
+        return seq
+
+    async def mark_contacts_complete(self, job_id: str):
+        await self.write("UPDATE jobs SET contacts_complete = 1 WHERE job_id = ?", (job_id,))
+
+    def update_job(self, job_id: str, status: str, error: Optional[str] = None) -> asyncio.Future:
+        return self.write(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+            (status, error, time.time(), job_id)
+        )
+
+    async def heartbeat(self):
+        """Renova a posse dos jobs ainda não finalizados deste processo"""
+        placeholders = ",".join("?" for _ in UNFINISHED_JOB_STATUSES)
+        await self.write(
+            f"UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ({placeholders})",
+            (time.time(), self.owner, *UNFINISHED_JOB_STATUSES)
+        )
+
+    async def release(self):
+        """Abre mão dos jobs no desligamento, para outro processo (ou o reinício) retomá-los na hora"""
+        await self.write("UPDATE jobs SET owner = NULL, heartbeat_at = NULL WHERE owner = ?", (self.owner,))
+
+    def journal(self, job_id: str) -> OutboxJournal:
+        return OutboxJournal(self, job_id)
+
+    def pending(self, job_id: str, complete: bool = False) -> PendingMessages:
+        return PendingMessages(self, job_id, complete=complete)
+
+    async def fetch_pending(self, job_id: str, after_seq: int, limit: int) -> List[Tuple]:
+        return await self._run(self._fetch_pending, job_id, after_seq, limit)
+
+    def _fetch_pending(self, job_id: str, after_seq: int, limit: int) -> List[Tuple]:
+        return self._connection.execute(
+            "SELECT seq, name, phone, variables FROM messages "
+            "WHERE job_id = ? AND seq > ? AND state = 'pending' ORDER BY seq LIMIT ?",
+            (job_id, after_seq, limit)
+        ).fetchall()
+
+    async def recover(self) -> List[Dict[str, Any]]:
+        """
+        Prepara a retomada dos jobs interrompidos por um reinício
+
+        Só assume jobs sem dono ou cuja posse não é renovada há
+        `lease_timeout` segundos (o dono parou); jobs de processos vivos não
+        são tocados. Mensagens que estavam sendo enviadas viram `uncertain`;
+        a lista de contatos de cada job é considerada completa com o que foi
+        gravado.
+
+        Returns:
+            List: job_id, request, created_at e contadores por estado de cada job a retomar
+        """
+        return await self._run(self._recover)
+
+    def _recover(self) -> List[Dict[str, Any]]:
+        placeholders = ",".join("?" for _ in UNFINISHED_JOB_STATUSES)
+        now = time.time()
+        with self._connection:
+            # Exclusiva desde a leitura: dois processos nunca assumem o mesmo job
+            self._connection.execute("BEGIN IMMEDIATE")
+            rows = self._connection.execute(
+                f"SELECT job_id, request, created_at FROM jobs WHERE status IN ({placeholders}) "
+                "AND (owner IS NULL OR (owner != ? AND COALESCE(heartbeat_at, 0) < ?)) ORDER BY created_at",
+                (*UNFINISHED_JOB_STATUSES, self.owner, now - self.lease_timeout)
+            ).fetchall()
+            jobs = []
+            for job_id, request, created_at in rows:
+                self._connection.execute(
+                    "UPDATE messages SET state = 'uncertain', error = ?, finished_at = ? "
+                    "WHERE job_id = ? AND state = 'sending'",
+                    (UNCERTAIN_ERROR, time.time(), job_id)
+                )
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'queued', contacts_complete = 1, updated_at = ?, owner = ?, "
+                    "heartbeat_at = ? WHERE job_id = ?",
+                    (now, self.owner, now, job_id)
+                )
+                counts = dict(self._connection.execute(
+                    "SELECT state, COUNT(*) FROM messages WHERE job_id = ? GROUP BY state", (job_id,)
+                ).fetchall())
+                jobs.append({
+                    "job_id": job_id,
+                    "request": json.loads(request),
+                    "created_at": created_at,
+                    "counts": counts
+                })
+            return jobs
+
+def open_outbox(database_url: Optional[str] = DatabaseConfig.DATABASE_URL) -> Optional[SQLiteOutbox]:
+    """Cria o outbox configurado em DATABASE_URL (None quando não configurado)"""
+    if not database_url:
+        return None
+    path = sqlite_path(database_url)
+    if path is None:
+        logger.warning("DATABASE_URL não é SQLite (sqlite:///caminho.db); outbox de envios desativado")
+        return None
+    return SQLiteOutbox(path)
@@ -0,0 +1,154 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+from config import PhoneConfig
+
+# Comprimentos válidos do número nacional (sem o código do país) por código de país E.164
+COUNTRY_RULES = {
+    "1": (10,),             # EUA/Canadá (NANP)
+    "7": (10,),             # Rússia/Cazaquistão
+    "33": (9,),             # França
+    "34": (9,),             # Espanha
+    "39": tuple(range(6, 12)),  # Itália
+    "44": (10,),            # Reino Unido
+    "49": tuple(range(6, 14)),  # Alemanha
+    "51": (8, 9),           # Peru
+    "52": (10,),            # México
+    "54": (10, 11),         # Argentina
+    "55": (10, 11),         # Brasil (DDD + 8 ou 9 dígitos)
+    "56": (9,),             # Chile
+    "57": (10,),            # Colômbia
+    "58": (10,),            # Venezuela
+    "81": (9, 10),          # Japão
+    "86": (10, 11),         # China
+    "91": (10,),            # Índia
+    "244": (9,),            # Angola
+    "258": (9,),            # Moçambique
+    "351": (9,),            # Portugal
+    "591": (8,),            # Bolívia
+    "593": (8, 9),          # Equador
+    "595": (9,),            # Paraguai
+    "598": (8,),            # Uruguai
+}
+
+# Prefixos antigos de celular removidos do número nacional (México: 52 1 + 10 dígitos, extinto em 2019)
+LEGACY_MOBILE_PREFIXES = {
+    "52": "1",
+}
+
+# Limites E.164 para países sem regra específica (código + número nacional)
+E164_MIN_DIGITS = 8
+E164_MAX_DIGITS = 15
+
+_NON_DIGITS = re.compile(r"\D")
+
+def _split_country_code(digits: str) -> Tuple[Optional[str], str]:
+    """Separa o código de país conhecido (maior prefixo) do número nacional"""
+    for size in (3, 2, 1):
+        code = digits[:size]
+        if code in COUNTRY_RULES:
+            return code, digits[size:]
+    return None, digits
+
+def _strip_legacy_prefix(code: str, national: str) -> str:
+    """Remove o prefixo antigo de celular quando o restante tem um comprimento válido"""
+    prefix = LEGACY_MOBILE_PREFIXES.get(code)
+    if prefix and national.startswith(prefix) and len(national) - len(prefix) in COUNTRY_RULES[code]:
+        return national[len(prefix):]
+    return national
+
+def _check_international(digits: str) -> str:
+    code, national = _split_country_code(digits)
+    if code is None:
+        if not E164_MIN_DIGITS <= len(digits) <= E164_MAX_DIGITS:
+            raise ValueError(f"Número de telefone deve ter entre {E164_MIN_DIGITS} e {E164_MAX_DIGITS} dígitos no formato internacional")
+        return "+" + digits
+
+    lengths = COUNTRY_RULES[code]
+    national = _strip_legacy_prefix(code, national)
+    if len(national) not in lengths:
+        expected = " ou ".join(str(n) for n in lengths) if len(lengths) <= 2 else f"{lengths[0]} a {lengths[-1]}"
+        raise ValueError(f"Número de telefone inválido para +{code}: esperado {expected} dígitos após o código do país")
+    return "+" + code + national
+
+class PhoneNormalizer:
+    """
+    Normaliza números de telefone para E.164 (+<código do país><número>)
+
+    Números sem "+" são interpretados no país padrão: o prefixo internacional
+    "00" e o prefixo de tronco "0" são removidos e o código do país é
+    acrescentado quando o número ainda não o contém. Os resultados (inclusive
+    erros) ficam em cache LRU, pois as mesmas listas são reenviadas com
+    frequência.
+    """
+
+    def __init__(self, default_country_code: str = PhoneConfig.DEFAULT_COUNTRY_CODE,
+                 cache_size: int = PhoneConfig.CACHE_SIZE):
+        self.default_country_code = default_country_code
+        self._cached = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _normalize(self, raw: str) -> Tuple[Optional[str], Optional[str]]:
+        """Retorna (número normalizado, erro) para que erros também fiquem em cache"""
+        raw = raw.strip()
+        digits = _NON_DIGITS.sub("", raw)
+        if not digits:
+            return None, "Número de telefone vazio"
+
+        try:
+            if raw.startswith("+"):
+                return _check_international(digits), None
+            if digits.startswith("00"):
+                return _check_international(digits[2:]), None
+
+            national = digits.lstrip("0")
+            country = self.default_country_code
+            lengths = COUNTRY_RULES.get(country, ())
+            if national.startswith(country) and (
+                len(_strip_legacy_prefix(country, national[len(country):])) in lengths
+            ):
+                # Número já contém o código do país, apenas sem o "+"
+                return _check_international(national), None
+            return _check_international(country + national), None
+        except ValueError as e:
+            return None, str(e)
+
+    def normalize(self, raw: str) -> str:
+        """Normaliza um número; levanta ValueError se ele for inválido"""
+        normalized, error = self._cached(raw)
+        if error is not None:
+            raise ValueError(error)
+        return normalized
+
+    def normalize_batch(self, raws: Iterable[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """Normaliza vários números de uma vez, retornando (número, erro) para cada um"""
+        cached = self._cached
+        return [cached(raw) if isinstance(raw, str) else (None, "Número de telefone ausente") for raw in raws]
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+    def cache_clear(self):
+        self._cached.cache_clear()
+
+# Instância compartilhada usada pelos modelos e pelos envios em massa
+phone_normalizer = PhoneNormalizer()
+
+def normalize_phone(raw: str) -> str:
+    return phone_normalizer.normalize(raw)
+
+def dedupe_contacts(contacts: list) -> Tuple[list, int]:
+    """
+    Remove contatos com telefone repetido mantendo a primeira ocorrência
+
+    Returns:
+        Tuple: (contatos únicos, quantidade de duplicados removidos)
+    """
+    seen = set()
+    unique = []
+    for contact in contacts:
+        if contact.phone in seen:
+            continue
+        seen.add(contact.phone)
+        unique.append(contact)
+    return unique, len(contacts) - len(unique)
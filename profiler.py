@@ -0,0 +1,146 @@
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+# Modos de amostragem: cpu (tempo de CPU do event loop) ou wall (tempo real, inclui as tasks aguardando)
+PROFILE_MODES = ("cpu", "wall")
+
+# Timer e sinal usados por modo quando o event loop roda na thread principal
+_TIMERS = {"cpu": ("ITIMER_PROF", "SIGPROF"), "wall": ("ITIMER_REAL", "SIGALRM")}
+
+def _frame_label(code) -> str:
+    # O formato "collapsed" separa os frames com ";"
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+def _thread_stack(frame) -> List[str]:
+    """Pilha da raiz até o frame em execução"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+def _coroutine_stack(task: asyncio.Task) -> List[str]:
+    """Cadeia de awaits de uma task, da corrotina externa até o ponto de espera"""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            # Future ou objeto aguardado sem frame Python
+            stack.append(f"<{type(awaitable).__name__}>")
+            break
+        stack.append(_frame_label(frame.f_code))
+        awaitable = (
+            getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+            or getattr(awaitable, "ag_await", None)
+        )
+    return stack
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem do event loop
+
+    A cada `interval` segundos registra a pilha da thread do event loop
+    (raiz `loop`; `<idle>` quando o loop aguarda I/O). No modo `wall`
+    registra também a cadeia de awaits de cada task pendente (raiz `tasks`),
+    para mostrar onde as requisições passam o tempo esperando (ex: Evolution
+    API). O resultado é contado por pilha no formato "collapsed" do
+    flamegraph.pl / speedscope.
+
+    Com o event loop na thread principal (uvicorn) a pilha do loop é lida por
+    um timer de sinal (SIGPROF/SIGALRM), que interrompe o código Python onde
+    ele estiver. Caso contrário, uma thread lê a pilha, o que só acontece
+    quando o loop libera o GIL e tende a superestimar o tempo em I/O.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, thread_id: int,
+                 interval: float = 0.005, mode: str = "cpu"):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Modo de profiling deve ser um de {', '.join(PROFILE_MODES)}")
+        self.loop = loop
+        self.thread_id = thread_id
+        self.interval = interval
+        self.mode = mode
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.signal_based = False
+        self._previous_handler = None
+
+    def _record_loop_stack(self, frame):
+        stack = _thread_stack(frame)
+        # Loop parado no select(): nenhuma corrotina usando CPU
+        if stack and stack[-1].startswith(("select (", "poll (")):
+            stack = ["<idle>"]
+        self.stacks[";".join(["loop"] + stack)] += 1
+        self.samples += 1
+
+    def _on_signal(self, signum, frame):
+        if frame is not None:
+            self._record_loop_stack(frame)
+
+    def start_signal_sampling(self) -> bool:
+        """Amostra o loop por timer de sinal; só é possível com o loop na thread principal"""
+        timer, signum = _TIMERS[self.mode]
+        if threading.get_ident() != threading.main_thread().ident or self.thread_id != threading.get_ident():
+            return False
+        if not hasattr(signal, "setitimer") or not hasattr(signal, signum):
+            return False
+        self._previous_handler = signal.signal(getattr(signal, signum), self._on_signal)
+        signal.setitimer(getattr(signal, timer), self.interval, self.interval)
+        self.signal_based = True
+        return True
+
+    def stop_signal_sampling(self):
+        if not self.signal_based:
+            return
+        timer, signum = _TIMERS[self.mode]
+        signal.setitimer(getattr(signal, timer), 0)
+        signal.signal(getattr(signal, signum), self._previous_handler or signal.SIG_DFL)
+
+    def _sample_tasks(self):
+        try:
+            tasks = asyncio.all_tasks(self.loop)
+        except RuntimeError:
+            return
+        for task in tasks:
+            if not task.done():
+                self.stacks[";".join(["tasks"] + _coroutine_stack(task))] += 1
+
+    def run(self, seconds: float) -> Counter:
+        """Amostra por `seconds` segundos (bloqueante: chame fora do event loop)"""
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+        while next_sample < deadline:
+            if not self.signal_based:
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is not None:
+                    self._record_loop_stack(frame)
+            if self.mode == "wall":
+                self._sample_tasks()
+            next_sample += self.interval
+            time.sleep(max(0.0, next_sample - time.monotonic()))
+        return self.stacks
+
+    def collapsed(self) -> str:
+        """Pilhas no formato collapsed ("frame;frame;frame contagem" por linha)"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        return {"samples": self.samples, "distinct_stacks": len(self.stacks), "signal_based": self.signal_based}
+
+async def profile(seconds: float, interval: float = 0.005, mode: str = "cpu") -> SamplingProfiler:
+    """Executa o profiler sobre o event loop atual sem bloqueá-lo"""
+    profiler = SamplingProfiler(asyncio.get_running_loop(), threading.get_ident(), interval, mode)
+    profiler.start_signal_sampling()
+    try:
+        await asyncio.to_thread(profiler.run, seconds)
+    finally:
+        profiler.stop_signal_sampling()
+    return profiler
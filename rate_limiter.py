@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+class TokenBucket:
+    """
+    Limitador de taxa do tipo token bucket
+
+    Libera até `burst` envios imediatos e depois repõe `rate` tokens por
+    segundo. Quem chama `acquire` espera (sem bloquear o event loop) até
+    haver um token disponível; a espera é atendida em ordem de chegada.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("A taxa do token bucket deve ser maior que zero")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate: float):
+        """Altera a taxa mantendo os tokens já acumulados"""
+        if rate <= 0:
+            raise ValueError("A taxa do token bucket deve ser maior que zero")
+        self._refill()
+        self.rate = float(rate)
+
+    def time_until_available(self) -> float:
+        """Segundos até haver um token disponível (0 se já houver)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def try_acquire(self) -> bool:
+        """Consome um token se houver um disponível, sem esperar"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Aguarda até que um token esteja disponível e o consome"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class RateLimiterRegistry:
+    """
+    Mantém um token bucket por instância da Evolution API
+
+    A taxa de cada instância é a taxa base multiplicada pelo seu peso
+    (capacidade) no pool de instâncias.
+    """
+
+    shared = False
+
+    def __init__(self, rate: Optional[float], burst: int = 1, weights: Optional[Dict[str, float]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights or {}
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def rate_for(self, instance: str) -> Optional[float]:
+        """Taxa atual da instância (mensagens/segundo)"""
+        bucket = self.buckets.get(instance)
+        if bucket is not None:
+            return bucket.rate
+        return self.rate * self.weights.get(instance, 1.0) if self.rate is not None else None
+
+    def set_rate(self, instance: str, rate: float):
+        """Altera a taxa de uma instância (controle adaptativo)"""
+        bucket = self.get(instance)
+        if bucket is not None:
+            bucket.set_rate(rate)
+
+    def get(self, instance: str) -> Optional[TokenBucket]:
+        """Retorna o bucket da instância, ou None quando o ritmo não é limitado"""
+        if self.rate is None:
+            return None
+        bucket = self.buckets.get(instance)
+        if bucket is None:
+            bucket = TokenBucket(self.rate * self.weights.get(instance, 1.0), self.burst)
+            self.buckets[instance] = bucket
+        return bucket
+
+    async def acquire(self, instance: str):
+        bucket = self.get(instance)
+        if bucket is not None:
+            await bucket.acquire()
+
+class SharedRateLimiterRegistry:
+    """
+    Token buckets por instância mantidos na fila de trabalho compartilhada
+
+    Todos os processos que enviam pela mesma instância consomem do mesmo
+    bucket, de modo que a taxa configurada vale para o conjunto.
+    """
+
+    shared = True
+
+    def __init__(self, backend, rate: Optional[float], burst: int = 1, weights: Optional[Dict[str, float]] = None):
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights or {}
+        # Taxas ajustadas pelo controle adaptativo deste processo
+        self.rates: Dict[str, float] = {}
+
+    def rate_for(self, instance: str) -> Optional[float]:
+        if instance in self.rates:
+            return self.rates[instance]
+        return self.rate * self.weights.get(instance, 1.0) if self.rate is not None else None
+
+    def set_rate(self, instance: str, rate: float):
+        """Altera a taxa de uma instância; o bucket compartilhado adota a taxa da próxima reserva"""
+        if self.rate is not None:
+            self.rates[instance] = rate
+
+    async def reserve(self, instance: str) -> float:
+        """Consome um token da instância; retorna 0 ou os segundos até haver um token"""
+        if self.rate is None:
+            return 0.0
+        return await self.backend.acquire_token(f"rate:{instance}", self.rate_for(instance), self.burst)
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import DatabaseConfig, WebhookConfig
+from outbox import sqlite_path
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Status das mensagens nos eventos da Evolution API (Baileys: WebMessageInfo.Status), em ordem
+STATUS_LEVELS = {"ERROR": 0, "PENDING": 1, "SERVER_ACK": 2, "DELIVERY_ACK": 3, "READ": 4, "PLAYED": 5}
+DELIVERED = STATUS_LEVELS["DELIVERY_ACK"]
+READ = STATUS_LEVELS["READ"]
+
+# Evento de atualização de status (messages.update, MESSAGES_UPDATE ou messages-update com webhook por evento)
+UPDATE_EVENT = "messages.update"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_index (
+    message_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    status INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS message_index_created_at ON message_index (created_at);
+CREATE TABLE IF NOT EXISTS job_receipts (
+    job_id TEXT PRIMARY KEY,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    read INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+UPSERT_COUNTS = (
+    "INSERT INTO job_receipts (job_id, delivered, read) VALUES (?, ?, ?) "
+    "ON CONFLICT (job_id) DO UPDATE SET delivered = delivered + excluded.delivered, read = read + excluded.read"
+)
+
+def status_level(status: Any) -> Optional[int]:
+    """Nível do status (texto como "DELIVERY_ACK" ou número); None quando desconhecido"""
+    if isinstance(status, int):
+        return status
+    if isinstance(status, str):
+        return STATUS_LEVELS.get(status.upper())
+    return None
+
+def parse_updates(payload: Any, event: Optional[str] = None) -> List[Tuple[str, int]]:
+    """
+    Extrai (message_id, nível do status) de um evento de webhook da Evolution API
+
+    Aceita o formato da v2 (`data` com `keyId` e `status`) e o da v1 (`data`
+    com uma lista de `{"key": {"id"}, "update": {"status"}}`). Outros eventos
+    resultam numa lista vazia.
+    """
+    if not isinstance(payload, dict):
+        return []
+    name = (event or payload.get("event") or "").lower().replace("_", ".").replace("-", ".")
+    if name != UPDATE_EVENT:
+        return []
+    data = payload.get("data")
+    items = data if isinstance(data, list) else [data]
+    updates = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        key = item.get("key") if isinstance(item.get("key"), dict) else {}
+        update = item.get("update") if isinstance(item.get("update"), dict) else item
+        message_id = item.get("keyId") or key.get("id")
+        level = status_level(update.get("status"))
+        if message_id and level is not None:
+            updates.append((message_id, level))
+    return updates
+
+class ReceiptTracker:
+    """
+    Confirmações de entrega e leitura das mensagens das campanhas
+
+    Os envios bem-sucedidos dos jobs registram message_id → job_id num índice
+    (SQLite). O webhook só extrai (message_id, status) de cada evento e o
+    acrescenta a um buffer em memória; uma tarefa grava o buffer em lote numa
+    thread dedicada, correlaciona cada evento ao job pelo índice e atualiza os
+    contadores de entregues e lidas por job. O status de uma mensagem só
+    avança, então eventos repetidos ou fora de ordem não contam duas vezes.
+    Eventos sem mensagem no índice são tentados de novo no lote seguinte (o
+    envio pode ter sido registrado por outro processo ainda não gravado).
+    Com o buffer cheio os eventos novos são descartados (e contados): a
+    ingestão nunca bloqueia os envios.
+    """
+
+    def __init__(self, path: str, flush_interval: float = WebhookConfig.FLUSH_INTERVAL,
+                 batch_size: int = WebhookConfig.BATCH_SIZE, max_pending: int = WebhookConfig.MAX_PENDING,
+                 retention_days: float = DatabaseConfig.RECEIPTS_RETENTION_DAYS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        # Chamado com {job_id: (entregues, lidas)} dos jobs alterados em cada lote
+        self.on_totals: Optional[Callable[[Dict[str, Tuple[int, int]]], None]] = None
+        self._sent: List[Tuple[str, str, float]] = []
+        self._updates: List[Tuple[str, int]] = []
+        # Eventos sem mensagem no índice, tentados mais uma vez no próximo lote
+        self._retry: List[Tuple[str, int]] = []
+        self._wakeup = asyncio.Event()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.applied = 0
+        self.unmatched = 0
+        self.dropped = 0
+
+    async def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="receipts")
+        await self._run(self._open)
+        self.task = asyncio.create_task(self._flush_loop(), name="receipts-flush")
+        logger.info(f"Confirmações de entrega: {self.path}")
+
+    async def stop(self):
+        """Grava os eventos pendentes e fecha o banco"""
+        if self._executor is None:
+            return
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory and self.path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._prune()
+
+    def _close(self):
+        self._connection.close()
+        self._connection = None
+
+    def _prune(self):
+        """Remove do índice as mensagens enviadas há mais de retention_days"""
+        if self.retention_days <= 0:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        removed = self._connection.execute("DELETE FROM message_index WHERE created_at < ?", (cutoff,)).rowcount
+        if removed:
+            logger.info(f"{removed} mensagens antigas removidas do índice de confirmações")
+
+    def register(self, message_id: Optional[str], job_id: str):
+        """Associa uma mensagem enviada ao job (gravado no próximo lote)"""
+        if message_id:
+            self._sent.append((message_id, job_id, time.time()))
+
+    def ingest(self, payload: Any, event: Optional[str] = None) -> int:
+        """Acrescenta ao buffer as atualizações de status de um evento; retorna quantas foram aceitas"""
+        updates = parse_updates(payload, event)
+        if not updates:
+            return 0
+        self.received += len(updates)
+        room = self.max_pending - len(self._updates)
+        if room < len(updates):
+            self.dropped += len(updates) - max(room, 0)
+            updates = updates[:max(room, 0)]
+        self._updates.extend(updates)
+        if len(self._updates) >= self.batch_size:
+            self._wakeup.set()
+        return len(updates)
+
+    @property
+    def pending(self) -> int:
+        return len(self._updates)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Erro ao gravar confirmações de entrega: {str(e)}")
+
+    async def flush(self):
+        """Grava num lote os envios registrados e as atualizações recebidas desde o último"""
+        if not self._sent and not self._updates and not self._retry:
+            return
+        sent, self._sent = self._sent, []
+        updates, self._updates = self._updates, []
+        retry, self._retry = self._retry, []
+        totals, applied, missing = await self._run(self._apply, sent, retry + updates)
+        self.applied += applied
+        # Na segunda tentativa sem correspondência o evento é descartado
+        retried = {message_id for message_id, _ in retry}
+        self._retry = [update for update in missing if update[0] not in retried]
+        self.unmatched += len(missing) - len(self._retry)
+        if totals and self.on_totals is not None:
+            self.on_totals(totals)
+
+    def _apply(self, sent: List[Tuple[str, str, float]],
+               updates: Iterable[Tuple[str, int]]) -> Tuple[Dict[str, Tuple[int, int]], int, List[Tuple[str, int]]]:
+        # Várias atualizações da mesma mensagem no lote: vale o status mais avançado
+        latest: Dict[str, int] = {}
+        for message_id, level in updates:
+            if level > latest.get(message_id, -1):
+                latest[message_id] = level
+
+        deltas: Dict[str, List[int]] = {}
+        applied = 0
+        missing: List[Tuple[str, int]] = []
+        with self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO message_index (message_id, job_id, created_at) VALUES (?, ?, ?)", sent
+            )
+            for message_id, level in latest.items():
+                row = self._connection.execute(
+                    "SELECT job_id, status FROM message_index WHERE message_id = ?", (message_id,)
+                ).fetchone()
+                if row is None:
+                    missing.append((message_id, level))
+                    continue
+                job_id, current = row
+                if level <= current:
+                    continue
+                self._connection.execute(
+                    "UPDATE message_index SET status = ? WHERE message_id = ?", (level, message_id)
+                )
+                applied += 1
+                # Lida implica entregue, mesmo sem o evento de entrega
+                delta = deltas.setdefault(job_id, [0, 0])
+                if current < DELIVERED <= level:
+                    delta[0] += 1
+                if current < READ <= level:
+                    delta[1] += 1
+            self._connection.executemany(
+                UPSERT_COUNTS, [(job_id, delivered, read) for job_id, (delivered, read) in deltas.items()]
+            )
+            totals = self._counts(list(deltas))
+        return totals, applied, missing
+
+    def _counts(self, job_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+        if not job_ids:
+            return {}
+        rows = self._connection.execute(
+            f"SELECT job_id, delivered, read FROM job_receipts WHERE job_id IN ({','.join('?' for _ in job_ids)})",
+            job_ids
+        ).fetchall()
+        return {job_id: (delivered, read) for job_id, delivered, read in rows}
+
+    async def counts(self, job_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Entregues e lidas por job, como gravados no banco (inclui eventos recebidos por outros processos)"""
+        return await self._run(self._counts, job_ids)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "applied": self.applied,
+            "unmatched": self.unmatched,
+            "dropped": self.dropped,
+            "pending": self.pending + len(self._retry)
+        }
+
+def open_receipts(url: Optional[str] = DatabaseConfig.RECEIPTS_URL) -> Optional[ReceiptTracker]:
+    """Cria o rastreamento de confirmações configurado em RECEIPTS_URL (None quando desativado)"""
+    if not url:
+        return None
+    path = sqlite_path(url)
+    if path is None:
+        logger.warning("RECEIPTS_URL não é SQLite (sqlite:///caminho.db); confirmações de entrega desativadas")
+        return None
+    return ReceiptTracker(path)
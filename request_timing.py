@@ -0,0 +1,180 @@
+import functools
+import inspect
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+
+from config import ServerConfig
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+class RequestTimings:
+    """Tempo acumulado por fase de uma requisição (fase: [segundos, ocorrências])"""
+
+    __slots__ = ("started", "phases", "handler_mark")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, List[float]] = {}
+        # Início da rota / fim do endpoint, para medir validação e serialização
+        self.handler_mark = self.started
+
+    def add(self, phase: str, seconds: float):
+        entry = self.phases.get(phase)
+        if entry is None:
+            self.phases[phase] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def header(self) -> str:
+        """Valor do cabeçalho Server-Timing (durações em milissegundos)"""
+        metrics = []
+        for phase, (seconds, count) in self.phases.items():
+            desc = f';desc="{count}x"' if count > 1 else ""
+            metrics.append(f"{phase};dur={seconds * 1000:.1f}{desc}")
+        metrics.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{phase}={seconds * 1000:.1f}ms" + (f" ({count}x)" if count > 1 else "")
+            for phase, (seconds, count) in self.phases.items()
+        )
+
+# Tempos da requisição em andamento (None fora de requisições, ex: jobs em segundo plano)
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+def record_phase(phase: str, seconds: float):
+    """Soma `seconds` à fase da requisição atual (sem efeito fora de uma requisição)"""
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+class TimedRoute(APIRoute):
+    """
+    Rota que separa o tempo do endpoint do restante do processamento do FastAPI
+
+    `validate`: leitura do corpo e validação (Pydantic) antes do endpoint;
+    `handler`: execução do endpoint; `serialize`: conversão da resposta.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = self._timed_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _timed_endpoint(endpoint):
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            timings = current_timings.get()
+            if timings is not None:
+                timings.add("validate", time.perf_counter() - timings.handler_mark)
+            started = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                finished = time.perf_counter()
+                if timings is not None:
+                    timings.add("handler", finished - started)
+                    timings.handler_mark = finished
+        return timed
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timings = current_timings.get()
+            if timings is None:
+                return await handler(request)
+            timings.handler_mark = time.perf_counter()
+            response = await handler(request)
+            if "handler" in timings.phases:
+                timings.add("serialize", time.perf_counter() - timings.handler_mark)
+            return response
+        return timed_handler
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI que mede cada requisição HTTP
+
+    As fases registradas durante a requisição (validação, endpoint,
+    serialização, chamadas à Evolution API, formatação, logging) voltam no
+    cabeçalho `Server-Timing`; requisições acima de `slow_threshold_ms` são
+    registradas no log com o detalhamento das fases.
+    """
+
+    def __init__(self, app, enabled: bool = ServerConfig.SERVER_TIMING,
+                 slow_threshold_ms: float = ServerConfig.SLOW_REQUEST_MS):
+        self.app = app
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold_ms / 1000 if slow_threshold_ms > 0 else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.enabled or self.slow_threshold):
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        status: List[int] = []
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+                if self.enabled:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timings.header().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+            elapsed = timings.elapsed()
+            if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+                logger.warning(
+                    f"Requisição lenta: {scope['method']} {scope['path']} -> "
+                    f"{status[0] if status else '-'} em {elapsed * 1000:.0f} ms ({timings.summary()})"
+                )
+
+class TimedLogHandler(logging.Handler):
+    """Envolve um handler de log e registra o tempo gasto nele na fase `log`"""
+
+    def __init__(self, inner: logging.Handler):
+        super().__init__(inner.level)
+        self.inner = inner
+
+    def handle(self, record: logging.LogRecord):
+        started = time.perf_counter()
+        try:
+            return self.inner.handle(record)
+        finally:
+            record_phase("log", time.perf_counter() - started)
+
+    def setFormatter(self, fmt):
+        self.inner.setFormatter(fmt)
+
+    def flush(self):
+        self.inner.flush()
+
+    def close(self):
+        self.inner.close()
+        super().close()
+
+def instrument_logging(root: Optional[logging.Logger] = None):
+    """Passa a medir o tempo dos handlers do logger raiz (fase `log` do Server-Timing)"""
+    root = root or logging.getLogger()
+    root.handlers = [
+        handler if isinstance(handler, TimedLogHandler) else TimedLogHandler(handler)
+        for handler in root.handlers
+    ]
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from config import EvolutionAPIConfig
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Status HTTP que indicam falha temporária: a mensagem não foi aceita e pode ser repetida
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+# Erros em que a requisição não chegou a ser enviada (repetir não duplica a mensagem)
+SAFE_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Intervalo (segundos) de nova verificação para envios aguardando o teste do circuito meio-aberto
+HALF_OPEN_POLL_INTERVAL = 0.5
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code in RETRYABLE_STATUS
+
+def is_breaker_failure_status(status_code: int) -> bool:
+    """Respostas que indicam Evolution API indisponível (contam para o circuit breaker)"""
+    return status_code >= 500
+
+def is_retryable_error(error: Exception, retry_ambiguous: bool = EvolutionAPIConfig.RETRY_AMBIGUOUS_ERRORS) -> bool:
+    """
+    Indica se um erro de transporte pode ser repetido
+
+    Erros de conexão são sempre repetidos. Timeouts de leitura e conexões
+    encerradas no meio da resposta são ambíguos (a Evolution API pode ter
+    enviado a mensagem) e só são repetidos com RETRY_AMBIGUOUS_ERRORS.
+    """
+    if isinstance(error, SAFE_RETRY_ERRORS):
+        return True
+    return retry_ambiguous and isinstance(error, httpx.TransportError)
+
+class RetryPolicy:
+    """Tentativas com backoff exponencial e jitter completo"""
+
+    def __init__(self, max_attempts: int = EvolutionAPIConfig.RETRY_MAX_ATTEMPTS,
+                 base_delay: float = EvolutionAPIConfig.RETRY_BASE_DELAY,
+                 max_delay: float = EvolutionAPIConfig.RETRY_MAX_DELAY):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Espera antes da próxima tentativa
+
+        Args:
+            attempt: Tentativa que falhou (começando em 1)
+            retry_after: Espera pedida pela API (cabeçalho Retry-After), respeitada como mínimo
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            return min(self.max_delay, max(backoff, retry_after))
+        return backoff
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+class CircuitBreaker:
+    """
+    Circuit breaker de uma instância da Evolution API
+
+    - closed: envios normais; `failure_threshold` falhas seguidas abrem o circuito
+    - open: nenhum envio por `recovery_timeout` segundos
+    - half_open: um único envio de teste; sucesso fecha o circuito, falha reabre
+    """
+
+    def __init__(self, name: str, failure_threshold: int = EvolutionAPIConfig.CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = EvolutionAPIConfig.CIRCUIT_RECOVERY_TIMEOUT):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def _ready_at(self) -> float:
+        return self.opened_at + self.recovery_timeout
+
+    def is_open(self) -> bool:
+        """Circuito aberto e ainda sem permitir o envio de teste"""
+        return self.state == "open" and time.monotonic() < self._ready_at()
+
+    def try_acquire(self) -> bool:
+        """Permite o envio se o circuito estiver fechado ou se este for o envio de teste"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() < self._ready_at():
+                return False
+            self.state = "half_open"
+            logger.info(f"Circuito da instância {self.name} meio-aberto: enviando teste")
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def wait_time(self) -> float:
+        """Segundos até valer a pena tentar novamente"""
+        if self.state == "open":
+            return max(0.0, self._ready_at() - time.monotonic())
+        return HALF_OPEN_POLL_INTERVAL
+
+    async def acquire(self, wait: bool = True) -> bool:
+        """
+        Obtém permissão para enviar
+
+        Args:
+            wait: Aguardar (estacionar o envio) enquanto o circuito estiver aberto;
+                sem espera, retorna False imediatamente
+        """
+        while not self.try_acquire():
+            if not wait:
+                return False
+            await asyncio.sleep(self.wait_time())
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuito da instância {self.name} fechado: Evolution API respondeu")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning(
+                f"Circuito da instância {self.name} aberto após {self.failures} falha(s); "
+                f"envios estacionados por {self.recovery_timeout:g}s"
+            )
+
+    def release(self):
+        """Libera o envio de teste sem registrar sucesso nem falha"""
+        self._probe_in_flight = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": "open" if self.is_open() else ("half_open" if self.state != "closed" else "closed"),
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "retry_in_seconds": round(self.wait_time(), 1) if self.state == "open" else 0.0
+        }
+
+class CircuitBreakerRegistry:
+    """Um circuit breaker por instância da Evolution API"""
+
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, instance: str) -> CircuitBreaker:
+        breaker = self.breakers.get(instance)
+        if breaker is None:
+            breaker = self.breakers[instance] = CircuitBreaker(instance)
+        return breaker
+
+    def is_open(self, instance: str) -> bool:
+        breaker = self.breakers.get(instance)
+        return breaker is not None and breaker.is_open()
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.to_dict() for name, breaker in self.breakers.items()}
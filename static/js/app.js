@@ -3,6 +3,9 @@
 class WhatsAppMessageManager {
     constructor() {
         this.contacts = [];
+        this.maxBulkResultsShown = 500;
+        this.pendingBulkResults = [];
+        this.bulkRenderScheduled = false;
         this.init();
     }
 
@@ -113,7 +116,7 @@ class WhatsAppMessageManager {
     // Connection testing
     async testConnection() {
         try {
-            const response = await fetch('/api/test-connection');
+            const response = await fetch('/api/test-connection?refresh=true');
             const result = await response.json();
             
             const statusContainer = document.getElementById('connectionStatus');
@@ -157,14 +160,14 @@ class WhatsAppMessageManager {
         `;
 
         try {
-            const response = await fetch('/api/full-diagnosis');
+            const response = await fetch('/api/full-diagnosis?refresh=true');
             const diagnosis = await response.json();
             
             let diagnosticHtml = `
                 <div class="card">
                     <div class="card-header">
                         <h5><i class="fas fa-stethoscope me-2"></i>Diagnóstico Completo</h5>
-                        <small class="text-muted">Executado em: ${new Date(diagnosis.timestamp).toLocaleString('pt-BR')}</small>
+                        <small class="text-muted">Executado em: ${new Date(diagnosis.timestamp).toLocaleString('pt-BR')} (${Math.round(diagnosis.duration_ms)} ms)${diagnosis.partial ? ' - resultado parcial' : ''}</small>
                     </div>
                     <div class="card-body">
             `;
@@ -583,6 +586,7 @@ class WhatsAppMessageManager {
         try {
             this.showLoading(true);
             
+            // Enfileirar a campanha em segundo plano e acompanhar o progresso via SSE
             const response = await fetch('/api/send-bulk-messages', {
                 method: 'POST',
                 headers: {
@@ -591,7 +595,8 @@ class WhatsAppMessageManager {
                 body: JSON.stringify({
                     contacts: this.contacts,
                     message: message,
-                    delay: delay
+                    delay: delay,
+                    background: true
                 })
             });
 
@@ -600,10 +605,10 @@ class WhatsAppMessageManager {
             this.showLoading(false);
 
             if (response.ok && result.success) {
-                this.showAlert(`Envio em massa concluído! ${result.successful_sends} enviadas, ${result.failed_sends} falharam.`, 'success');
+                this.showAlert(`Envio em massa iniciado para ${result.total_contacts} contatos.`, 'info', 3000);
                 
-                // Show detailed results
-                this.showBulkResults(result.results);
+                // Show live results
+                this.followBulkJob(result.job_id, result.total_contacts);
                 
                 // Clear form
                 document.getElementById('bulkMessage').value = '';
@@ -618,59 +623,153 @@ class WhatsAppMessageManager {
         }
     }
 
-    showBulkResults(results) {
-        const resultsContainer = document.getElementById('resultsContainer');
+    followBulkJob(jobId, total) {
+        this.renderBulkSummary(total);
+        
+        // Resultados são acumulados e desenhados em lote a cada frame
+        this.pendingBulkResults = [];
+        this.bulkRenderScheduled = false;
+        
+        this.openBulkStream(jobId, true);
+    }
+
+    openBulkStream(jobId, replay) {
+        const source = new EventSource(`/api/jobs/${jobId}/events?replay=${replay}`);
+        let finished = false;
         
-        // Summary card
-        const successful = results.filter(r => r.success).length;
-        const failed = results.length - successful;
+        source.addEventListener('progress', (e) => {
+            this.updateBulkCounters(JSON.parse(e.data));
+        });
         
-        const summaryHtml = `
+        source.addEventListener('result', (e) => {
+            const data = JSON.parse(e.data);
+            this.queueBulkResult(data.result);
+            if (data.progress) {
+                this.updateBulkCounters(data.progress);
+            }
+        });
+        
+        source.addEventListener('done', (e) => {
+            const progress = JSON.parse(e.data);
+            finished = true;
+            source.close();
+            this.updateBulkCounters(progress);
+            
+            const type = progress.status === 'completed' ? 'success' : 'warning';
+            this.showAlert(`Envio em massa finalizado (${progress.status})! ${progress.successful_sends} enviadas, ${progress.failed_sends} falharam.`, type);
+        });
+        
+        source.onerror = () => {
+            if (finished) {
+                return;
+            }
+            // Reconectar sem replay para não duplicar os resultados já exibidos
+            source.close();
+            setTimeout(() => this.openBulkStream(jobId, false), 2000);
+        };
+    }
+
+    renderBulkSummary(total) {
+        const resultsContainer = document.getElementById('resultsContainer');
+        
+        resultsContainer.innerHTML = `
             <div class="card mb-3 fade-in">
                 <div class="card-header">
                     <h5 class="mb-0">
                         <i class="fas fa-chart-bar me-2"></i>
                         Resultado do Envio em Massa
+                        <span class="badge bg-secondary ms-2" id="bulkStatus">queued</span>
                     </h5>
                 </div>
                 <div class="card-body">
+                    <div class="progress mb-3">
+                        <div class="progress-bar bg-success" id="bulkProgressBar" role="progressbar" style="width: 0%"></div>
+                    </div>
                     <div class="row text-center">
-                        <div class="col-md-4">
+                        <div class="col-md-2">
                             <div class="border rounded p-3">
-                                <h3 class="text-primary mb-1">${results.length}</h3>
+                                <h3 class="text-primary mb-1" id="bulkTotal">${total}</h3>
                                 <small class="text-muted">Total</small>
                             </div>
                         </div>
-                        <div class="col-md-4">
+                        <div class="col-md-2">
                             <div class="border rounded p-3">
-                                <h3 class="text-success mb-1">${successful}</h3>
+                                <h3 class="text-success mb-1" id="bulkSuccessful">0</h3>
                                 <small class="text-muted">Sucessos</small>
                             </div>
                         </div>
-                        <div class="col-md-4">
+                        <div class="col-md-2">
                             <div class="border rounded p-3">
-                                <h3 class="text-danger mb-1">${failed}</h3>
+                                <h3 class="text-danger mb-1" id="bulkFailed">0</h3>
                                 <small class="text-muted">Falhas</small>
                             </div>
                         </div>
+                        <div class="col-md-2">
+                            <div class="border rounded p-3">
+                                <h3 class="text-secondary mb-1" id="bulkPending">${total}</h3>
+                                <small class="text-muted">Pendentes</small>
+                            </div>
+                        </div>
+                        <div class="col-md-2">
+                            <div class="border rounded p-3">
+                                <h3 class="text-info mb-1" id="bulkThroughput">0</h3>
+                                <small class="text-muted">Msgs/s</small>
+                            </div>
+                        </div>
+                        <div class="col-md-2">
+                            <div class="border rounded p-3">
+                                <h3 class="text-warning mb-1" id="bulkFailureRate">0%</h3>
+                                <small class="text-muted">Taxa de falha</small>
+                            </div>
+                        </div>
                     </div>
                 </div>
             </div>
+            <div id="bulkResultsList"></div>
         `;
+    }
+
+    updateBulkCounters(progress) {
+        document.getElementById('bulkStatus').textContent = progress.status;
+        document.getElementById('bulkTotal').textContent = progress.total_contacts;
+        document.getElementById('bulkSuccessful').textContent = progress.successful_sends;
+        document.getElementById('bulkFailed').textContent = progress.failed_sends;
+        document.getElementById('bulkPending').textContent = progress.pending;
+        document.getElementById('bulkThroughput').textContent = progress.throughput_per_second.toFixed(2);
+        document.getElementById('bulkFailureRate').textContent = (progress.failure_rate * 100).toFixed(1) + '%';
+        document.getElementById('bulkProgressBar').style.width = progress.progress + '%';
+    }
+
+    queueBulkResult(result) {
+        this.pendingBulkResults.push(result);
+        
+        if (!this.bulkRenderScheduled) {
+            this.bulkRenderScheduled = true;
+            requestAnimationFrame(() => this.flushBulkResults());
+        }
+    }
+
+    flushBulkResults() {
+        const resultsList = document.getElementById('bulkResultsList');
+        const results = this.pendingBulkResults;
+        this.pendingBulkResults = [];
+        this.bulkRenderScheduled = false;
         
-        // Detailed results
-        const detailedResultsHtml = results.map(result => {
+        if (!resultsList) {
+            return;
+        }
+        
+        const resultsHtml = results.map(result => {
             const isSuccess = result.success;
-            const contact = this.contacts.find(c => c.phone === result.sent_to);
             
             return `
-                <div class="card result-item ${isSuccess ? 'result-success' : 'result-error'} fade-in mb-2">
+                <div class="card result-item ${isSuccess ? 'result-success' : 'result-error'} mb-2">
                     <div class="card-body py-2">
                         <div class="d-flex align-items-center">
                             <i class="fas fa-${isSuccess ? 'check-circle text-success' : 'times-circle text-danger'} me-3"></i>
                             <div class="flex-grow-1">
-                                <strong>${contact ? contact.name : 'N/A'}</strong>
-                                <span class="text-muted"> - ${result.sent_to}</span>
+                                <strong>${result.name || 'N/A'}</strong>
+                                <span class="text-muted"> - ${result.phone}</span>
                                 ${!isSuccess ? `<br><small class="text-danger">${result.error}</small>` : ''}
                             </div>
                             <small class="text-muted">${new Date().toLocaleString('pt-BR')}</small>
@@ -680,7 +779,12 @@ class WhatsAppMessageManager {
             `;
         }).join('');
         
-        resultsContainer.innerHTML = summaryHtml + detailedResultsHtml;
+        resultsList.insertAdjacentHTML('afterbegin', resultsHtml);
+        
+        // Manter apenas os resultados mais recentes no DOM
+        while (resultsList.children.length > this.maxBulkResultsShown) {
+            resultsList.removeChild(resultsList.lastElementChild);
+        }
     }
 }
 
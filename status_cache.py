@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+class CacheEntry:
+    __slots__ = ("value", "error", "fetched_at")
+
+    def __init__(self, value: Any = None, error: Optional[BaseException] = None):
+        self.value = value
+        self.error = error
+        self.fetched_at = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+class StatusCache:
+    """
+    Cache das consultas de status à Evolution API
+
+    - Entradas mais novas que `refresh_interval` são servidas direto da memória
+    - Entradas mais velhas, mas dentro de `max_staleness`, são servidas e
+      disparam uma atualização em segundo plano (stale-while-revalidate)
+    - Acima de `max_staleness` a consulta espera o valor novo
+    - Consultas simultâneas à mesma chave compartilham uma única chamada
+      à API (single-flight)
+    - Um loop em segundo plano atualiza as chaves registradas a cada
+      `refresh_interval` segundos
+
+    Erros também ficam em cache, para que uma Evolution API fora do ar não
+    receba uma chamada por requisição.
+    """
+
+    def __init__(self, refresh_interval: float, max_staleness: float):
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max(max_staleness, refresh_interval)
+        self.loaders: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self.background_keys = set()
+        self.entries: Dict[str, CacheEntry] = {}
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "upstream_calls": 0, "upstream_errors": 0}
+        self._refresher: Optional[asyncio.Task] = None
+
+    def register(self, key: str, loader: Callable[[], Awaitable[Any]], background: bool = True):
+        """Registra a função que consulta a API para a chave; background=False não atualiza periodicamente"""
+        self.loaders[key] = loader
+        if background:
+            self.background_keys.add(key)
+
+    async def get(self, key: str, max_age: Optional[float] = None) -> Any:
+        """
+        Retorna o valor da chave
+
+        Args:
+            key: Chave registrada
+            max_age: Idade máxima aceita em segundos (0 força nova consulta);
+                sem valor, aplica a política de refresh/staleness do cache
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            age = entry.age
+            if max_age is not None:
+                if age <= max_age:
+                    self.stats["hits"] += 1
+                    return self._unwrap(entry)
+            elif age <= self.refresh_interval:
+                self.stats["hits"] += 1
+                return self._unwrap(entry)
+            elif age <= self.max_staleness:
+                self.stats["stale_hits"] += 1
+                self._load(key)
+                return self._unwrap(entry)
+
+        self.stats["misses"] += 1
+        return await asyncio.shield(self._load(key))
+
+    def _unwrap(self, entry: CacheEntry) -> Any:
+        if entry.error is not None:
+            raise entry.error
+        return entry.value
+
+    def _load(self, key: str) -> asyncio.Task:
+        """Inicia (ou reaproveita) a consulta em andamento da chave"""
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return task
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self.inflight.pop(key, None)
+        if not task.cancelled():
+            # Marca a exceção como observada em atualizações sem ninguém aguardando
+            task.exception()
+
+    async def _fetch(self, key: str) -> Any:
+        self.stats["upstream_calls"] += 1
+        try:
+            value = await self.loaders[key]()
+        except Exception as e:
+            self.stats["upstream_errors"] += 1
+            self.entries[key] = CacheEntry(error=e)
+            raise
+        self.entries[key] = CacheEntry(value=value)
+        return value
+
+    def invalidate(self, key: Optional[str] = None):
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+    async def refresh_all(self):
+        """Atualiza todas as chaves de atualização periódica"""
+        tasks = [self._load(key) for key in self.background_keys]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh_all()
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Inicia a atualização periódica em segundo plano"""
+        if self._refresher is None and self.refresh_interval > 0:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+        for task in list(self.inflight.values()):
+            task.cancel()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "refresh_interval": self.refresh_interval,
+            "max_staleness": self.max_staleness,
+            "entries": {
+                key: {"age_seconds": round(entry.age, 3), "error": str(entry.error) if entry.error else None}
+                for key, entry in self.entries.items()
+            },
+            **self.stats
+        }
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+# Antes de importar config: sem bancos em data/ e sem esperas longas entre tentativas
+os.environ.setdefault("CONTACT_LISTS_URL", "")
+os.environ.setdefault("RECEIPTS_URL", "")
+os.environ.setdefault("EVOLUTION_RETRY_BASE_DELAY", "0.01")
+os.environ.setdefault("MEDIA_DIR", os.path.join(tempfile.mkdtemp(prefix="tests-media-"), "media"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import pytest
+
+from config import EvolutionAPIConfig
+from mock_evolution import MockSettings, create_app
+from whatsapp_service import WhatsAppService
+
+class MockEvolution:
+    """WhatsAppService ligado ao simulador da Evolution API (mock_evolution.py) sem rede"""
+
+    def __init__(self, **settings):
+        settings.setdefault("api_key", "")
+        settings.setdefault("instances", {EvolutionAPIConfig.INSTANCE_ID: "open"})
+        settings.setdefault("latency_ms", 1)
+        settings.setdefault("latency_dist", "fixed")
+        self.app = create_app(MockSettings(**settings))
+        self.settings = self.app.state.settings
+        self.stats = self.app.state.stats
+        self.service = WhatsAppService()
+        self.service._create_client = lambda: httpx.AsyncClient(
+            base_url=self.service.config.BASE_URL, transport=httpx.ASGITransport(app=self.app)
+        )
+
+@pytest.fixture
+def evolution():
+    return MockEvolution()
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import bulk_sender
+from bulk_sender import BulkSender
+from config import BulkConfig, EvolutionAPIConfig
+from models import BulkMessageRequest
+
+INSTANCE = EvolutionAPIConfig.INSTANCE_ID
+
+def request(count):
+    return BulkMessageRequest(
+        contacts=[{"name": f"C{i}", "phone": f"+55119{i:08d}"} for i in range(count)], message="oi",
+        rate_per_second=50
+    )
+
+async def collect(sender):
+    return [result async for result in sender.run()]
+
+def test_campaign_sends_to_all_contacts(evolution):
+    results = asyncio.run(collect(BulkSender(evolution.service, request(5))))
+    assert all(result["success"] for result in results)
+    assert evolution.stats.to_dict()["distinct_recipients"] == 5
+
+def test_waits_for_instance_to_reconnect(evolution, monkeypatch):
+    """Instância ainda conectando no início da campanha: os envios aguardam em vez de falhar"""
+    monkeypatch.setattr(bulk_sender, "FAILURE_REFRESH_INTERVAL", 0.1)
+    evolution.settings.instances[INSTANCE] = "connecting"
+
+    async def scenario():
+        async def reconnect():
+            await asyncio.sleep(0.5)
+            evolution.settings.instances[INSTANCE] = "open"
+        task = asyncio.create_task(reconnect())
+        results = await collect(BulkSender(evolution.service, request(3)))
+        await task
+        return results
+
+    results = asyncio.run(scenario())
+    assert [result["success"] for result in results] == [True, True, True]
+
+def test_fails_after_instance_wait_timeout(evolution, monkeypatch):
+    monkeypatch.setattr(bulk_sender, "FAILURE_REFRESH_INTERVAL", 0.1)
+    monkeypatch.setattr(BulkConfig, "INSTANCE_WAIT_TIMEOUT", 0.5)
+    evolution.settings.instances[INSTANCE] = "close"
+
+    started = time.monotonic()
+    results = asyncio.run(collect(BulkSender(evolution.service, request(4))))
+    elapsed = time.monotonic() - started
+
+    assert [result["error"] for result in results] == ["Nenhuma instância conectada disponível"] * 4
+    # Espera uma vez pela campanha, não por contato
+    assert 0.5 <= elapsed < 1.5
+    assert evolution.stats.to_dict()["messages_accepted"] == 0
+
+def test_source_error_fails_the_campaign_instead_of_hanging(evolution):
+    async def contacts():
+        for contact in request(2).contacts:
+            yield contact
+        raise OSError("upload interrompido")
+
+    async def scenario():
+        results = []
+        try:
+            async for result in BulkSender(evolution.service, request(0), contacts=contacts()).run():
+                results.append(result)
+        except OSError as e:
+            return results, e
+        return results, None
+
+    results, error = asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert [result["success"] for result in results] == [True, True]
+    assert str(error) == "upload interrompido"
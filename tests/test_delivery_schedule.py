@@ -0,0 +1,100 @@
+import asyncio
+import time
+from datetime import datetime, time as dtime
+
+import delivery_schedule
+from delivery_schedule import DeliveryWindow, JobScheduler, ReleaseGate
+from job_manager import BulkJob, JobManager
+from models import BulkMessageRequest
+from work_queue import MemoryWorkQueue
+
+def local_time(timestamp):
+    return datetime.fromtimestamp(timestamp, delivery_schedule.TIMEZONE).time()
+
+def window_closing_in(seconds):
+    """Janela aberta há uma hora que fecha em até `seconds` segundos (os horários são truncados no segundo)"""
+    now = time.time()
+    return DeliveryWindow(local_time(now - 3600), local_time(now + seconds))
+
+def test_window_contains_and_next_open():
+    window = DeliveryWindow.parse("09:00-18:00")
+    day = datetime(2026, 3, 10, tzinfo=delivery_schedule.TIMEZONE)
+    inside = day.replace(hour=10).timestamp()
+    after = day.replace(hour=19).timestamp()
+    assert window.contains(inside)
+    assert window.next_open(inside) == inside
+    assert window.next_open(after) == datetime(2026, 3, 11, 9, tzinfo=delivery_schedule.TIMEZONE).timestamp()
+    assert window.closes_at(inside) == day.replace(hour=18).timestamp()
+
+def test_window_across_midnight():
+    window = DeliveryWindow.parse("22:00-06:00")
+    day = datetime(2026, 3, 10, tzinfo=delivery_schedule.TIMEZONE)
+    assert window.contains(day.replace(hour=23).timestamp())
+    assert window.contains(day.replace(hour=5).timestamp())
+    assert not window.contains(day.replace(hour=12).timestamp())
+    assert window.closes_at(day.replace(hour=23).timestamp()) == datetime(
+        2026, 3, 11, 6, tzinfo=delivery_schedule.TIMEZONE
+    ).timestamp()
+
+def test_invalid_window():
+    for value in ("9h-18h", "09:00-09:00"):
+        try:
+            DeliveryWindow.parse(value)
+        except ValueError:
+            continue
+        raise AssertionError(f"{value} deveria ser rejeitada")
+
+def test_release_gate_spreads_until_window_closes():
+    async def scenario():
+        gate = ReleaseGate(list(range(3)), window_closing_in(2.5), spread=True, remaining=lambda released: 3 - released)
+        started = time.monotonic()
+        return [(item, time.monotonic() - started) async for item in gate]
+
+    released = asyncio.run(scenario())
+    assert [item for item, _ in released] == [0, 1, 2]
+    # Três fatias até o fechamento (1,5s a 2,5s): o primeiro sai na hora e o último na terceira fatia
+    assert released[0][1] < 0.2
+    assert 0.8 < released[2][1] < 2.0
+
+class ScheduledJob:
+    def __init__(self, name):
+        self.name = name
+        self.status = "scheduled"
+
+def test_job_scheduler_releases_in_order_and_skips_cancelled():
+    async def scenario():
+        released = []
+        scheduler = JobScheduler(lambda job: released.append(job.name))
+        scheduler.start()
+        now = time.time()
+        cancelled = ScheduledJob("c")
+        cancelled.status = "cancelled"
+        scheduler.schedule(ScheduledJob("b"), now + 0.2)
+        scheduler.schedule(ScheduledJob("a"), now + 0.1)
+        scheduler.schedule(cancelled, now + 0.15)
+        await asyncio.sleep(0.4)
+        await scheduler.stop()
+        return released
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+
+def test_spread_campaign_is_pushed_to_queue_as_released(evolution):
+    """Com spread em modo fila, cada contato liberado vai para a fila na hora (sem esperar um lote)"""
+
+    async def scenario():
+        queue = MemoryWorkQueue()
+        manager = JobManager(evolution.service, work_queue=queue)
+        contacts = [{"name": f"C{i}", "phone": f"+55119{i:08d}"} for i in range(4)]
+        job = BulkJob("job", BulkMessageRequest(contacts=contacts, message="oi"))
+        await queue.put_job("job", {})
+        gate = ReleaseGate(job.request.contacts, window_closing_in(4), spread=True,
+                           remaining=lambda released: 4 - released)
+        feeder = asyncio.create_task(manager._feed_queue(job, gate))
+        await asyncio.sleep(0.3)
+        early = await queue.pending_count("job")
+        await asyncio.wait_for(feeder, 6)
+        return early, await queue.pending_count("job")
+
+    early, total = asyncio.run(scenario())
+    assert early == 1
+    assert total == 4
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import job_manager
+from job_manager import BulkJob
+from models import BulkMessageRequest
+
+def make_job(count=5):
+    contacts = [{"name": f"C{i}", "phone": f"+55119{i:08d}"} for i in range(count)]
+    return BulkJob("job", BulkMessageRequest(contacts=contacts, message="oi"))
+
+def result(index):
+    return {"name": f"C{index}", "phone": f"+55119{index:08d}", "success": True, "message_id": f"m{index}",
+            "error": None, "instance": "rodolfo"}
+
+def parse(chunk):
+    """(evento, dados) de um chunk SSE; comentários de keep-alive viram (None, None)"""
+    if chunk.startswith(":"):
+        return None, None
+    lines = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+async def drain(stream):
+    return [parse(chunk) async for chunk in stream]
+
+def test_replay_and_live_results_are_not_duplicated():
+    async def scenario():
+        job = make_job()
+        job.mark_started()
+        job.record(result(0))
+        job.record(result(1))
+        stream = job.events()
+        first = parse(await stream.__anext__())
+        # Registrado depois da inscrição, durante o replay: deve chegar uma única vez
+        job.record(result(2))
+        rest = asyncio.create_task(drain(stream))
+        await asyncio.sleep(0.05)
+        job.mark_finished("completed")
+        return [first] + await rest
+
+    events = asyncio.run(scenario())
+    assert events[0][0] == "progress"
+    phones = [data["result"]["phone"] for event, data in events if event == "result"]
+    assert phones == [result(i)["phone"] for i in range(3)]
+    assert events[-1][0] == "done"
+
+def test_done_is_delivered_to_slow_subscriber(monkeypatch):
+    monkeypatch.setattr(job_manager, "SUBSCRIBER_QUEUE_SIZE", 2)
+
+    async def scenario():
+        job = make_job()
+        stream = job.events(replay=False)
+        await stream.__anext__()
+        for index in range(5):
+            job.record(result(index))
+        job.mark_finished("completed")
+        return await drain(stream)
+
+    events = asyncio.run(scenario())
+    assert len(events) == 2
+    assert events[-1][0] == "done"
+    assert events[-1][1]["processed"] == 5
+
+def test_stream_closes_when_job_finishes_without_done_event(monkeypatch):
+    monkeypatch.setattr(job_manager, "SSE_HEARTBEAT_INTERVAL", 0.05)
+
+    async def scenario():
+        job = make_job()
+        stream = job.events()
+        await stream.__anext__()
+        events = asyncio.create_task(drain(stream))
+        await asyncio.sleep(0.1)
+        job.status = "cancelled"
+        return await asyncio.wait_for(events, 1)
+
+    events = asyncio.run(scenario())
+    assert events[-1] == ("done", events[-1][1])
+    assert events[-1][1]["status"] == "cancelled"
@@ -0,0 +1,33 @@
+import asyncio
+
+import httpx
+
+import main
+from config import MediaConfig
+from work_queue import RedisWorkQueue
+
+async def upload_and_send(path, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        upload = await client.post("/api/media", content=b"\x89PNG imagem", headers={"Content-Type": "image/png"})
+        media_id = upload.json()["media_id"]
+        if "json" in kwargs:
+            kwargs["json"] = {**kwargs["json"], "media_id": media_id}
+        return await client.post(path.format(media_id=media_id), **kwargs)
+
+def test_media_is_rejected_in_distributed_queue_jobs(monkeypatch):
+    """Sem MEDIA_DIR compartilhado, consumidores de outros hosts não encontrariam a mídia"""
+    monkeypatch.setattr(main.job_manager, "work_queue", RedisWorkQueue("redis://localhost"))
+    monkeypatch.setattr(MediaConfig, "SHARED", False)
+
+    background = asyncio.run(upload_and_send("/api/send-bulk-messages", json={
+        "contacts": [{"name": "Ana", "phone": "+5511999990000"}], "message": "oi",
+        "background": True
+    }))
+    stream = asyncio.run(upload_and_send(
+        "/api/send-bulk-stream?message=oi&media_id={media_id}", content=b"",
+        headers={"Content-Type": "application/x-ndjson"}
+    ))
+
+    assert background.status_code == 422
+    assert "MEDIA_SHARED" in background.json()["detail"]
+    assert stream.status_code == 422
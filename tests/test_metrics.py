@@ -0,0 +1,18 @@
+from prometheus_client.parser import text_string_to_metric_families
+
+import metrics
+
+def collected():
+    return {family.name: family for family in text_string_to_metric_families(metrics.render().decode())}
+
+def test_monotonic_totals_are_counters():
+    class Receipts:
+        received, pending, unmatched, dropped = 7, 1, 2, 0
+
+    metrics.bind_receipts(Receipts())
+    families = collected()
+    for name in ("webhook_receipts_received", "webhook_receipts_unmatched", "webhook_receipts_dropped",
+                 "whatsapp_messages_sent", "evolution_send_retries"):
+        assert families[name].type == "counter", name
+    assert families["webhook_receipts_pending"].type == "gauge"
+    assert families["webhook_receipts_received"].samples[0].value == 7
@@ -0,0 +1,118 @@
+import asyncio
+
+from job_manager import JobManager
+from models import BulkMessageRequest, ContactInfo
+from outbox import UNCERTAIN_ERROR, SQLiteOutbox
+
+CONTACTS = [ContactInfo(name=f"C{i}", phone=f"+55119{i:08d}") for i in range(3)]
+
+async def interrupted_job(path):
+    """Job de um processo que parou: C0 no meio do envio, C1 enviado e C2 pendente"""
+    outbox = SQLiteOutbox(path)
+    await outbox.start()
+    request = BulkMessageRequest(contacts=CONTACTS, message="oi", rate_per_second=50)
+    await outbox.create_job("job", request)
+    await outbox.add_contacts("job", CONTACTS)
+    await outbox.mark_contacts_complete("job")
+    await outbox.update_job("job", "running")
+    journal = outbox.journal("job")
+    await journal.sending(0, "rodolfo")
+    await journal.sending(1, "rodolfo")
+    await journal.finished(1, {"success": True, "instance": "rodolfo", "message_id": "m1"})
+    await outbox.stop()
+
+def test_recover_marks_interrupted_sends_uncertain(tmp_path):
+    path = str(tmp_path / "outbox.db")
+
+    async def scenario():
+        await interrupted_job(path)
+        # Posse vencida na hora: o dono parou sem liberar os jobs
+        outbox = SQLiteOutbox(path, lease_timeout=0)
+        await outbox.start()
+        try:
+            jobs = await outbox.recover()
+            pending = [seq async for seq, _ in outbox.pending("job", complete=True)]
+            error = await outbox._run(
+                lambda: outbox._connection.execute("SELECT error FROM messages WHERE seq = 0").fetchone()[0]
+            )
+            return jobs, pending, error
+        finally:
+            await outbox.stop()
+
+    jobs, pending, error = asyncio.run(scenario())
+    assert [job["job_id"] for job in jobs] == ["job"]
+    assert jobs[0]["counts"] == {"uncertain": 1, "sent": 1, "pending": 1}
+    assert pending == [2]
+    assert error == UNCERTAIN_ERROR
+
+def test_resumed_job_sends_only_pending_contacts(tmp_path, evolution):
+    path = str(tmp_path / "outbox.db")
+
+    async def scenario():
+        await interrupted_job(path)
+        manager = JobManager(evolution.service, outbox=SQLiteOutbox(path, lease_timeout=0))
+        await manager.start()
+        try:
+            job = manager.jobs["job"]
+            for _ in range(100):
+                if job.is_finished:
+                    break
+                await asyncio.sleep(0.05)
+            return job
+        finally:
+            await manager.stop()
+
+    job = asyncio.run(scenario())
+    assert job.resumed
+    assert job.status == "completed"
+    assert (job.processed, job.successful, job.failed) == (3, 2, 1)
+    assert set(evolution.stats.recipients) == {CONTACTS[2].phone.lstrip("+")}
+
+def test_jobs_of_a_live_process_are_not_taken_over(tmp_path):
+    path = str(tmp_path / "outbox.db")
+
+    async def scenario():
+        owner = SQLiteOutbox(path)
+        other = SQLiteOutbox(path, lease_timeout=0.2)
+        await owner.start()
+        await other.start()
+        try:
+            request = BulkMessageRequest(contacts=CONTACTS, message="oi")
+            await owner.create_job("job", request)
+            await owner.add_contacts("job", CONTACTS)
+            await owner.update_job("job", "running")
+            live = await other.recover()
+            await asyncio.sleep(0.3)
+            # Posse vencida (dono sem renovar): assumida por outro processo uma única vez
+            expired = await other.recover()
+            again = await owner.recover()
+            await owner.heartbeat()
+            await owner.release()
+            return live, expired, again
+        finally:
+            await owner.stop()
+            await other.stop()
+
+    live, expired, again = asyncio.run(scenario())
+    assert live == []
+    assert [job["job_id"] for job in expired] == ["job"]
+    assert again == []
+
+def test_released_jobs_are_resumed_immediately(tmp_path):
+    path = str(tmp_path / "outbox.db")
+
+    async def scenario():
+        owner = SQLiteOutbox(path)
+        await owner.start()
+        await owner.create_job("job", BulkMessageRequest(contacts=CONTACTS, message="oi"))
+        await owner.add_contacts("job", CONTACTS)
+        await owner.release()
+        await owner.stop()
+        successor = SQLiteOutbox(path)
+        await successor.start()
+        try:
+            return await successor.recover()
+        finally:
+            await successor.stop()
+
+    assert [job["job_id"] for job in asyncio.run(scenario())] == ["job"]
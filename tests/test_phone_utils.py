@@ -0,0 +1,38 @@
+import pytest
+
+from models import ContactInfo
+from phone_utils import PhoneNormalizer, dedupe_contacts
+
+@pytest.fixture
+def normalizer():
+    return PhoneNormalizer(default_country_code="55")
+
+@pytest.mark.parametrize("raw, expected", [
+    ("(11) 98765-4321", "+5511987654321"),
+    ("011 98765-4321", "+5511987654321"),
+    ("5511987654321", "+5511987654321"),
+    ("+1 415 555 2671", "+14155552671"),
+    ("0044 20 7946 0958", "+442079460958"),
+])
+def test_normalize(normalizer, raw, expected):
+    assert normalizer.normalize(raw) == expected
+
+@pytest.mark.parametrize("raw", ["+52 1 55 1234 5678", "+52 55 1234 5678", "0052 1 55 1234 5678"])
+def test_mexico_legacy_mobile_prefix(normalizer, raw):
+    assert normalizer.normalize(raw) == "+525512345678"
+
+def test_mexico_default_country():
+    normalizer = PhoneNormalizer(default_country_code="52")
+    assert normalizer.normalize("5215512345678") == "+525512345678"
+    assert normalizer.normalize("55 1234 5678") == "+525512345678"
+
+@pytest.mark.parametrize("raw", ["", "+55 11 1234", "+52 2 55 1234 5678"])
+def test_invalid(normalizer, raw):
+    with pytest.raises(ValueError):
+        normalizer.normalize(raw)
+
+def test_legacy_and_current_mexico_formats_are_deduplicated():
+    contacts = [ContactInfo(name="A", phone="+5215512345678"), ContactInfo(name="B", phone="+525512345678")]
+    unique, removed = dedupe_contacts(contacts)
+    assert [contact.name for contact in unique] == ["A"]
+    assert removed == 1
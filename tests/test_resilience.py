@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+from resilience import CircuitBreaker, RetryPolicy
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker("rodolfo", failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.try_acquire()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert not breaker.try_acquire()
+
+    time.sleep(0.06)
+    # Meio-aberto: só um envio de teste por vez
+    assert breaker.try_acquire()
+    assert not breaker.try_acquire()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.try_acquire()
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker("rodolfo", failure_threshold=1, recovery_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.try_acquire()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert breaker.times_opened == 2
+
+def test_retry_delay_honours_retry_after():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=10)
+    assert policy.delay(1, retry_after=4) == 4
+    assert 0 <= policy.delay(3) <= 10
+
+def test_transient_errors_are_retried(evolution):
+    evolution.settings.error_rate = 1.0
+    evolution.settings.error_status = 503
+
+    response = asyncio.run(evolution.service.send_message("+5511900000000", "oi"))
+    assert not response.success
+    assert evolution.stats.requests["sendText 503"] == evolution.service.retry_policy.max_attempts
+
+def test_open_circuit_fails_fast(evolution):
+    evolution.settings.error_rate = 1.0
+    breaker = evolution.service.breakers.get(evolution.service.config.INSTANCE_ID)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    response = asyncio.run(evolution.service.send_message("+5511900000000", "oi"))
+    assert not response.success
+    assert "Circuito aberto" in response.error
+    assert sum(evolution.stats.requests.values()) == 0
+
+def test_cancelled_probe_releases_half_open_circuit(evolution):
+    evolution.settings.latency_ms = 500
+    breaker = evolution.service.breakers.get(evolution.service.config.INSTANCE_ID)
+    breaker.recovery_timeout = 0.01
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(0.02)
+
+    async def scenario():
+        probe = asyncio.create_task(evolution.service.send_message("+5511900000000", "oi"))
+        await asyncio.sleep(0.1)
+        assert breaker.state == "half_open"
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        evolution.settings.latency_ms = 1
+        return await evolution.service.send_message("+5511900000001", "oi")
+
+    response = asyncio.run(scenario())
+    assert response.success
+    assert breaker.state == "closed"
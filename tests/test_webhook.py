@@ -0,0 +1,23 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from config import WebhookConfig
+
+async def post(path, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        return await client.post(path, json={"event": "messages.update", "data": {}}, **kwargs)
+
+@pytest.mark.parametrize("provided", ["errado", "çãé", ""])
+def test_wrong_token_is_rejected(monkeypatch, provided):
+    monkeypatch.setattr(WebhookConfig, "TOKEN", "segredo-ção")
+    response = asyncio.run(post("/api/webhooks/evolution", headers={"X-Webhook-Token": provided.encode()}))
+    assert response.status_code == 403
+
+def test_valid_non_ascii_token_is_accepted(monkeypatch):
+    monkeypatch.setattr(WebhookConfig, "TOKEN", "segredo-ção")
+    response = asyncio.run(post("/api/webhooks/evolution", params={"token": "segredo-ção"}))
+    # Token aceito; sem RECEIPTS_URL (conftest) as confirmações estão desativadas
+    assert response.status_code == 503
@@ -0,0 +1,115 @@
+import asyncio
+import functools
+
+import job_manager as job_manager_module
+from job_manager import JobManager
+from models import BulkMessageRequest
+import work_queue as work_queue_module
+from work_queue import MemoryWorkQueue, QueueConsumer
+
+def contacts(count):
+    return [{"name": f"C{i}", "phone": f"+55119{i:08d}"} for i in range(count)]
+
+async def wait_finished(job, timeout):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not job.is_finished and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+
+def test_slow_rate_does_not_resend_expired_claims(evolution, monkeypatch):
+    """Mensagens aguardando o limite de taxa além do prazo de visibilidade não são enviadas duas vezes"""
+    monkeypatch.setattr(job_manager_module, "QueueConsumer", functools.partial(
+        QueueConsumer, poll_interval=0.05, visibility_timeout=1.0
+    ))
+
+    async def scenario():
+        manager = JobManager(evolution.service, work_queue=MemoryWorkQueue())
+        await manager.start()
+        try:
+            job = await manager.submit(BulkMessageRequest(
+                contacts=contacts(12), message="oi", rate_per_second=4, concurrency=1
+            ))
+            await wait_finished(job, timeout=15)
+            return job
+        finally:
+            await manager.stop()
+
+    job = asyncio.run(scenario())
+    assert job.status == "completed"
+    assert evolution.stats.to_dict()["distinct_recipients"] == 12
+    assert evolution.stats.to_dict()["duplicate_sends"] == 0
+    assert job.successful == 12
+    assert sorted(row["phone"] for row in job.results.iter_rows()) == [c["phone"] for c in contacts(12)]
+
+def test_duplicate_results_are_counted_once(evolution):
+    """Um resultado repetido para o mesmo seq (mensagem reenviada por outro processo) não conta no total"""
+
+    async def scenario():
+        queue = MemoryWorkQueue()
+        manager = JobManager(evolution.service, work_queue=queue)
+        job = job_manager_module.BulkJob("job", BulkMessageRequest(contacts=contacts(2), message="oi"))
+        await queue.put_job("job", {})
+        await queue.mark_complete("job")
+        for seq in (0, 0, 1):
+            await queue.publish_result("job", job_manager_module.json.dumps({
+                "seq": seq, "result": {"name": "C", "phone": contacts(2)[seq]["phone"], "success": True}
+            }))
+        manager.work_queue = queue
+        await asyncio.wait_for(manager._run_distributed(job, [], None), 5)
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.processed == 2
+    assert sorted(row["phone"] for row in job.results.iter_rows()) == [c["phone"] for c in contacts(2)]
+
+def test_claim_ack_and_reclaim():
+    async def scenario():
+        queue = MemoryWorkQueue()
+        await queue.put_job("job", {})
+        await queue.push("job", ["a", "b", "c"])
+        first = await queue.claim("job", 2, visibility_timeout=0.05)
+        await queue.ack("job", first[0])
+        await asyncio.sleep(0.1)
+        reclaimed = await queue.reclaim_expired("job")
+        return first, reclaimed, await queue.claim("job", 5, 10)
+
+    first, reclaimed, second = asyncio.run(scenario())
+    assert first == ["a", "b"]
+    assert reclaimed == 1
+    # A mensagem vencida volta para o início da fila
+    assert second == ["b", "c"]
+
+def test_extend_keeps_claim_invisible():
+    async def scenario():
+        queue = MemoryWorkQueue()
+        await queue.put_job("job", {})
+        await queue.push("job", ["a"])
+        await queue.claim("job", 1, visibility_timeout=0.05)
+        await queue.extend("job", ["a"], visibility_timeout=10)
+        await asyncio.sleep(0.1)
+        return await queue.reclaim_expired("job")
+
+    assert asyncio.run(scenario()) == 0
+
+def test_adaptive_rate_is_published_by_consumers(evolution, monkeypatch):
+    """Com a fila compartilhada, o status do job mostra a taxa adaptativa dos processos consumidores"""
+    monkeypatch.setattr(job_manager_module, "QueueConsumer", functools.partial(QueueConsumer, poll_interval=0.05))
+
+    async def scenario():
+        manager = JobManager(evolution.service, work_queue=MemoryWorkQueue())
+        await manager.start()
+        try:
+            job = await manager.submit(BulkMessageRequest(
+                contacts=contacts(20), message="oi", rate_per_second=20, adaptive_rate=True
+            ))
+            await wait_finished(job, timeout=15)
+            return job
+        finally:
+            await manager.stop()
+
+    job = asyncio.run(scenario())
+    assert job.status == "completed"
+    adaptive = job.to_dict(include_results=False)["adaptive_rate"]
+    assert adaptive["instances"]
+    assert adaptive["effective_rate"] > 0
+    assert all(i["latency_ms"] is not None for i in adaptive["instances"].values())
+    assert list(adaptive["consumers"]) == [work_queue_module.CONSUMER_ID]
@@ -1,194 +1,467 @@
-import requests
+import asyncio
+import httpx
 import json
 import logging
-from datetime import datetime
-from typing import Dict, Any, List
-from config import EvolutionAPIConfig
-from models import MessageResponse, BulkMessageRequest
+import time
+from typing import Dict, Any, Callable, List, Optional, AsyncIterator, NamedTuple
+from config import EvolutionAPIConfig, ServerConfig
+from models import MessageResponse, BulkMessageRequest, ContactInfo
+from bulk_sender import BulkSender
+from bulk_results import ResultStore
+from message_templates import MessageTemplate, compile_template
+from media_store import MediaAsset, MediaStore
+from status_cache import StatusCache
+from metrics import record_retry, record_send, track_request
+from request_timing import record_phase
+from log_pipeline import PER_MESSAGE
+from resilience import (
+    CircuitBreaker, CircuitBreakerRegistry, RetryPolicy,
+    is_breaker_failure_status, is_retryable_error, is_retryable_status, parse_retry_after
+)
 
 # Configurar logger
 logger = logging.getLogger(__name__)
 
+# Chaves do cache de status
+INSTANCES_KEY = "fetchInstances"
+CONNECTION_STATE_KEY = "connectionState"
+CONNECT_KEY = "connect"
+
+# Observador das tentativas de envio: (latência em segundos, resultado, status HTTP)
+AttemptObserver = Callable[[float, str, Optional[int]], None]
+
+class SendAttempt(NamedTuple):
+    """Resultado de uma tentativa de envio à Evolution API"""
+    response: MessageResponse
+    retryable: bool
+    retry_after: Optional[float]
+    outcome: str
+    http_status: Optional[int]
+
+class UpstreamResult(NamedTuple):
+    """Resposta de um endpoint de status da Evolution API mantida em cache"""
+    status_code: int
+    data: Any
+    text: str
+
 class WhatsAppService:
     """Serviço para integração com Evolution API"""
     
     def __init__(self):
         self.config = EvolutionAPIConfig()
+        self.client: Optional[httpx.AsyncClient] = None
+        
+        # Novas tentativas e circuit breaker por instância dos envios
+        self.retry_policy = RetryPolicy()
+        self.breakers = CircuitBreakerRegistry()
+        
+        # Mídias das mensagens (deduplicadas pelo hash do conteúdo)
+        self.media = MediaStore()
+        
+        # Cache das consultas de status, atualizado em segundo plano
+        self.status_cache = StatusCache(
+            refresh_interval=ServerConfig.HEALTH_CHECK_INTERVAL,
+            max_staleness=ServerConfig.STATUS_CACHE_MAX_STALENESS
+        )
+        self._register_status_loaders()
+    
+    def _create_client(self) -> httpx.AsyncClient:
+        """Cria o cliente HTTP assíncrono com pool de conexões keep-alive"""
+        limits = httpx.Limits(
+            max_connections=self.config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=self.config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=self.config.HTTP_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(
+            self.config.HTTP_TIMEOUT,
+            connect=self.config.HTTP_CONNECT_TIMEOUT
+        )
+        return httpx.AsyncClient(
+            base_url=self.config.BASE_URL,
+            headers=self.config.HEADERS,
+            limits=limits,
+            timeout=timeout
+        )
     
-    def format_message(self, name: str, message: str) -> str:
+    async def start(self):
+        """Inicializa o cliente HTTP compartilhado e o cache de status (chamado no lifespan da aplicação)"""
+        if self.client is None:
+            self.client = self._create_client()
+            logger.info(f"Cliente HTTP criado para {self.config.BASE_URL}")
+        self.status_cache.start()
+    
+    async def close(self):
+        """Fecha o cliente HTTP e libera as conexões do pool"""
+        await self.status_cache.stop()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Retorna o cliente compartilhado, criando-o se o serviço for usado fora do lifespan"""
+        if self.client is None:
+            self.client = self._create_client()
+        return self.client
+    
+    def format_message(self, name: str, message: str, phone: str = "",
+                       variables: Optional[Dict[str, Any]] = None, use_default_layout: bool = True) -> str:
         """
         Formata a mensagem com nome e data/hora atual
         Formato: Olá [Nome]
                 [Mensagem]
                 
                 [Data e hora atual]
-        """
-        current_datetime = datetime.now().strftime("%d/%m/%Y às %H:%M")
         
-        formatted_message = f"""Olá {name}!
-
-{message}
-
-{current_datetime}"""
-        
-        return formatted_message
+        A mensagem pode conter placeholders {{campo}} preenchidos com name,
+        phone, datetime ou as variáveis do contato (ver message_templates).
+        """
+        started = time.perf_counter()
+        template = compile_template(message, use_default_layout)
+        formatted = template.render(name, phone, variables)
+        record_phase("format", time.perf_counter() - started)
+        return formatted
     
-    def send_message(self, phone: str, text: str) -> MessageResponse:
+    def send_text_url(self, instance: Optional[str] = None) -> str:
+        """URL do endpoint sendText para a instância (padrão: instância configurada)"""
+        if instance is None or instance == self.config.INSTANCE_ID:
+            return self.config.SEND_TEXT_URL
+        return f"{self.config.BASE_URL}/message/sendText/{instance}"
+    
+    def send_media_url(self, instance: Optional[str] = None, audio: bool = False) -> str:
+        """URL do endpoint de mídia (sendMedia, ou sendWhatsAppAudio para áudio) da instância"""
+        endpoint = "sendWhatsAppAudio" if audio else "sendMedia"
+        return f"{self.config.BASE_URL}/message/{endpoint}/{instance or self.config.INSTANCE_ID}"
+    
+    async def send_message(self, phone: str, text: str, instance: Optional[str] = None,
+                           park: bool = False, on_attempt: Optional[AttemptObserver] = None) -> MessageResponse:
         """
         Envia mensagem individual via Evolution API
         
+        Falhas temporárias (erros de conexão, 429, 502/503/504) são repetidas
+        com backoff exponencial e jitter. Cada instância tem um circuit breaker:
+        com o circuito aberto o envio falha imediatamente ou, com `park`,
+        aguarda a Evolution API voltar.
+        
         Args:
             phone: Número do telefone (formato: +5511999999999)
             text: Texto da mensagem formatada
+            instance: Instância usada no envio (padrão: instância configurada)
+            park: Aguardar enquanto o circuito da instância estiver aberto (envios em massa)
+            on_attempt: Chamado após cada tentativa com (latência, resultado, status HTTP)
             
         Returns:
             MessageResponse: Resposta do envio
         """
-        try:
-            # Remove o + do número para a API
-            clean_phone = phone.replace('+', '')
+        # Remove o + do número para a API
+        clean_phone = phone.replace('+', '')
+        
+        # Payload conforme documentação da Evolution API
+        payload = {
+            "number": clean_phone,
+            "text": text,
+            "delay": 1000,
+            "linkPreview": False,
+            "mentionsEveryOne": False
+        }
+        
+        logger.info("Enviando mensagem para %s", phone, extra=PER_MESSAGE)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Payload: %s", json.dumps(payload), extra=PER_MESSAGE)
+        
+        url = self.send_text_url(instance)
+        return await self._deliver(phone, "sendText", lambda: {"url": url, "json": payload}, instance, park, on_attempt)
+    
+    async def send_media(self, phone: str, media: MediaAsset, caption: str = "", instance: Optional[str] = None,
+                         park: bool = False, on_attempt: Optional[AttemptObserver] = None) -> MessageResponse:
+        """
+        Envia uma mídia (imagem, vídeo, documento ou áudio) via Evolution API
+        
+        A mídia vai em base64 no corpo JSON, montado em streaming a partir da
+        versão já codificada no MediaStore (sem codificar de novo por contato).
+        Áudios são enviados como mensagem de voz, sem legenda. Novas tentativas
+        e circuit breaker funcionam como em send_message.
+        
+        Args:
+            phone: Número do telefone (formato: +5511999999999)
+            media: Mídia gravada com MediaStore.save
+            caption: Legenda (imagem, vídeo e documento)
+            instance: Instância usada no envio (padrão: instância configurada)
+            park: Aguardar enquanto o circuito da instância estiver aberto (envios em massa)
+            on_attempt: Chamado após cada tentativa com (latência, resultado, status HTTP)
             
-            # Payload conforme documentação da Evolution API
-            payload = {
+        Returns:
+            MessageResponse: Resposta do envio
+        """
+        clean_phone = phone.replace('+', '')
+        if media.is_audio:
+            endpoint, media_field = "sendWhatsAppAudio", "audio"
+            fields = {"number": clean_phone, "delay": 1000}
+        else:
+            endpoint, media_field = "sendMedia", "media"
+            fields = {
                 "number": clean_phone,
-                "text": text,
-                "delay": 1000,
-                "linkPreview": False,
-                "mentionsEveryOne": False
+                "mediatype": media.mediatype,
+                "mimetype": media.mimetype,
+                "caption": caption,
+                "fileName": media.filename,
+                "delay": 1000
             }
+        
+        logger.info("Enviando %s para %s", media.mediatype, phone, extra=PER_MESSAGE)
+        url = self.send_media_url(instance, audio=media.is_audio)
+        
+        def build_request() -> Dict[str, Any]:
+            # Um corpo novo a cada tentativa: o anterior já foi consumido
+            length, content = self.media.body(media, fields, media_field)
+            return {"url": url, "content": content, "headers": {"Content-Length": str(length)}}
+        
+        return await self._deliver(phone, endpoint, build_request, instance, park, on_attempt)
+    
+    async def _deliver(self, phone: str, endpoint: str, build_request: Callable[[], Dict[str, Any]],
+                       instance: Optional[str], park: bool, on_attempt: Optional[AttemptObserver]) -> MessageResponse:
+        """Envia com novas tentativas e circuit breaker; `build_request` monta os argumentos do POST"""
+        breaker = self.breakers.get(instance or self.config.INSTANCE_ID)
+        attempt = 0
+        while True:
+            if not await breaker.acquire(wait=park):
+                record_send("circuit_open")
+                error_msg = f"Circuito aberto para a instância {breaker.name}: Evolution API indisponível"
+                logger.error(error_msg)
+                return MessageResponse(success=False, error=error_msg, sent_to=phone)
             
-            logger.info(f"Enviando mensagem para {phone}")
-            logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
+            attempt += 1
+            try:
+                request = build_request()
+            except BaseException:
+                breaker.release()
+                raise
+            started = time.monotonic()
+            result = await self._attempt_send(phone, endpoint, request, breaker)
+            if on_attempt is not None:
+                on_attempt(time.monotonic() - started, result.outcome, result.http_status)
+            if result.response.success or not result.retryable or attempt >= self.retry_policy.max_attempts:
+                record_send(result.outcome, result.http_status)
+                if not result.response.success:
+                    logger.error(result.response.error)
+                return result.response
             
+            record_retry(result.outcome)
+            delay = self.retry_policy.delay(attempt, result.retry_after)
+            logger.warning(
+                f"Tentativa {attempt} de envio para {phone} falhou ({result.response.error}); "
+                f"repetindo em {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+    
+    async def _attempt_send(self, phone: str, endpoint: str, request: Dict[str, Any],
+                            breaker: CircuitBreaker) -> SendAttempt:
+        """Uma tentativa de envio: classifica o resultado e atualiza o circuit breaker"""
+        try:
             # Fazer requisição para Evolution API
-            response = requests.post(
-                url=self.config.SEND_TEXT_URL,
-                json=payload,
-                headers=self.config.HEADERS,
-                timeout=30
+            with track_request(endpoint):
+                response = await self._get_client().post(timeout=self.config.HTTP_TIMEOUT, **request)
+        except asyncio.CancelledError:
+            # Envio cancelado (job cancelado, cliente desconectado, desligamento): libera o envio de teste
+            breaker.release()
+            raise
+        except httpx.TimeoutException as e:
+            breaker.record_failure()
+            return SendAttempt(
+                MessageResponse(success=False, error="Timeout na requisição para Evolution API", sent_to=phone),
+                is_retryable_error(e), None, "timeout", None
+            )
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            return SendAttempt(
+                MessageResponse(success=False, error="Erro de conexão com Evolution API", sent_to=phone),
+                is_retryable_error(e), None, "transport_error", None
+            )
+        except Exception as e:
+            breaker.release()
+            return SendAttempt(
+                MessageResponse(success=False, error=f"Erro inesperado: {str(e)}", sent_to=phone),
+                False, None, "error", None
             )
+        
+        logger.info("Status da resposta: %s", response.status_code, extra=PER_MESSAGE)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Resposta: %s", response.text, extra=PER_MESSAGE)
+        
+        if is_breaker_failure_status(response.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        
+        if response.status_code == 200 or response.status_code == 201:
+            try:
+                response_data = response.json()
+            except ValueError as e:
+                return SendAttempt(
+                    MessageResponse(success=False, error=f"Erro inesperado: {str(e)}", sent_to=phone),
+                    False, None, "error", response.status_code
+                )
+            return SendAttempt(
+                MessageResponse(success=True, message_id=response_data.get('key', {}).get('id'), sent_to=phone),
+                False, None, "success", response.status_code
+            )
+        
+        return SendAttempt(
+            MessageResponse(success=False, error=f"Erro HTTP {response.status_code}: {response.text}", sent_to=phone),
+            is_retryable_status(response.status_code),
+            parse_retry_after(response),
+            "http_error",
+            response.status_code
+        )
+    
+    async def send_to_contact(self, contact: ContactInfo, template: MessageTemplate, instance: Optional[str] = None,
+                              park: bool = False, on_attempt: Optional[AttemptObserver] = None,
+                              media: Optional[MediaAsset] = None) -> Dict[str, Any]:
+        """
+        Renderiza e envia a mensagem de uma campanha para um contato
+        
+        Args:
+            contact: Contato de destino
+            template: Template da campanha, compilado uma única vez
+            instance: Instância usada no envio (padrão: instância configurada)
+            park: Aguardar enquanto o circuito da instância estiver aberto
+            on_attempt: Chamado após cada tentativa de envio (controle adaptativo da taxa)
+            media: Mídia da campanha; a mensagem renderizada vira a legenda
             
-            logger.info(f"Status da resposta: {response.status_code}")
-            logger.debug(f"Resposta: {response.text}")
+        Returns:
+            Dict: Resultado do envio para o contato
+        """
+        try:
+            # Formatar mensagem para o contato
+            started = time.perf_counter()
+            formatted_message = template.render(contact.name, contact.phone, contact.variables)
+            record_phase("format", time.perf_counter() - started)
             
-            if response.status_code == 200 or response.status_code == 201:
-                response_data = response.json()
-                return MessageResponse(
-                    success=True,
-                    message_id=response_data.get('key', {}).get('id'),
-                    sent_to=phone
+            # Enviar mensagem
+            if media is not None:
+                result = await self.send_media(
+                    contact.phone, media, formatted_message, instance=instance, park=park, on_attempt=on_attempt
                 )
             else:
-                error_msg = f"Erro HTTP {response.status_code}: {response.text}"
-                logger.error(error_msg)
-                return MessageResponse(
-                    success=False,
-                    error=error_msg,
-                    sent_to=phone
-                )
-                
-        except requests.exceptions.Timeout:
-            error_msg = "Timeout na requisição para Evolution API"
-            logger.error(error_msg)
-            return MessageResponse(
-                success=False,
-                error=error_msg,
-                sent_to=phone
-            )
-        except requests.exceptions.ConnectionError:
-            error_msg = "Erro de conexão com Evolution API"
-            logger.error(error_msg)
-            return MessageResponse(
-                success=False,
-                error=error_msg,
-                sent_to=phone
-            )
+                result = await self.send_message(contact.phone, formatted_message, instance=instance, park=park, on_attempt=on_attempt)
+            
+            return {
+                "name": contact.name,
+                "phone": contact.phone,
+                "success": result.success,
+                "message_id": result.message_id,
+                "error": result.error,
+                "instance": instance or self.config.INSTANCE_ID
+            }
+            
         except Exception as e:
-            error_msg = f"Erro inesperado: {str(e)}"
-            logger.error(error_msg)
-            return MessageResponse(
-                success=False,
-                error=error_msg,
-                sent_to=phone
-            )
+            return {
+                "name": contact.name,
+                "phone": contact.phone,
+                "success": False,
+                "error": str(e),
+                "instance": instance or self.config.INSTANCE_ID
+            }
+    
+    async def iter_bulk_messages(self, request: BulkMessageRequest, contacts=None, journal=None,
+                                 shared_rate_limits=None, adaptive=None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Envia mensagens em massa produzindo o resultado de cada contato assim que ele é processado
+        
+        Os envios são feitos com concorrência limitada e ritmo controlado por
+        token bucket (ver BulkSender).
+        
+        Args:
+            request: Dados da requisição em massa
+            contacts: Fonte alternativa de contatos (ex: upload em streaming)
+            journal: Registro das transições de estado de cada envio (outbox)
+            shared_rate_limits: Fila de trabalho que mantém os limites de taxa compartilhados
+            adaptive: Controle adaptativo da taxa (AIMD) a usar, para acompanhar a taxa efetiva
+            
+        Yields:
+            Dict: Resultado do envio para um contato
+        """
+        async for result in BulkSender(
+            self, request, contacts=contacts, journal=journal, shared_rate_limits=shared_rate_limits,
+            adaptive=adaptive
+        ).run():
+            yield result
     
-    def send_bulk_messages(self, request: BulkMessageRequest) -> Dict[str, Any]:
+    async def send_bulk_messages(self, request: BulkMessageRequest, contacts=None) -> Dict[str, Any]:
         """
-        Envia mensagens em massa com delay configurável
+        Envia mensagens em massa com ritmo e concorrência configuráveis
         
         Args:
             request: Dados da requisição em massa
+            contacts: Fonte alternativa de contatos (ex: lista guardada no servidor)
             
         Returns:
-            Dict: Resultado do envio em massa
+            Dict: Resultado do envio em massa (`results` é um ResultStore compacto)
         """
-        results = []
+        results = ResultStore()
         successful = 0
         failed = 0
         
-        for contact in request.contacts:
-            try:
-                # Formatar mensagem para cada contato
-                formatted_message = self.format_message(contact.name, request.message)
-                
-                # Enviar mensagem
-                result = self.send_message(contact.phone, formatted_message)
-                
-                if result.success:
-                    successful += 1
-                else:
-                    failed += 1
-                
-                results.append({
-                    "name": contact.name,
-                    "phone": contact.phone,
-                    "success": result.success,
-                    "message_id": result.message_id,
-                    "error": result.error
-                })
-                
-                # Delay entre mensagens se não for a última
-                if contact != request.contacts[-1] and request.delay > 0:
-                    import time
-                    time.sleep(request.delay / 1000)  # Converter para segundos
-                    
-            except Exception as e:
+        async for result in self.iter_bulk_messages(request, contacts=contacts):
+            if result["success"]:
+                successful += 1
+            else:
                 failed += 1
-                results.append({
-                    "name": contact.name,
-                    "phone": contact.phone,
-                    "success": False,
-                    "error": str(e)
-                })
+            results.append(result)
         
         return {
-            "total_contacts": len(request.contacts),
+            "total_contacts": len(results) if contacts is not None else len(request.contacts),
             "successful": successful,
             "failed": failed,
             "results": results
         }
     
-    def test_connection(self) -> Dict[str, Any]:
+    async def _fetch_upstream(self, endpoint: str, url: str, timeout: float) -> UpstreamResult:
+        """Consulta um endpoint de status da Evolution API (usado pelo cache de status)"""
+        with track_request(endpoint):
+            response = await self._get_client().get(url, timeout=timeout)
+        logger.debug(f"Consulta {url}: {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        return UpstreamResult(response.status_code, data, response.text)
+    
+    def _register_status_loaders(self):
+        base_url = self.config.BASE_URL
+        instance = self.config.INSTANCE_ID
+        self.status_cache.register(
+            INSTANCES_KEY,
+            lambda: self._fetch_upstream(INSTANCES_KEY, f"{base_url}/instance/fetchInstances", 15)
+        )
+        self.status_cache.register(
+            CONNECTION_STATE_KEY,
+            lambda: self._fetch_upstream(CONNECTION_STATE_KEY, f"{base_url}/instance/connectionState/{instance}", 10)
+        )
+        # /instance/connect pode iniciar uma tentativa de conexão: só consultado sob demanda
+        self.status_cache.register(
+            CONNECT_KEY,
+            lambda: self._fetch_upstream(CONNECT_KEY, f"{base_url}/instance/connect/{instance}", 10),
+            background=False
+        )
+    
+    async def test_connection(self, refresh: bool = False) -> Dict[str, Any]:
         """
         Testa a conexão com a Evolution API
         
+        Args:
+            refresh: Ignorar o cache e consultar a API
+            
         Returns:
             Dict: Status da conexão
         """
         try:
-            # URL para testar conexão (usando endpoint de informações da instância)
-            test_url = f"{self.config.BASE_URL}/instance/connect/{self.config.INSTANCE_ID}"
-            
-            response = requests.get(
-                url=test_url,
-                headers=self.config.HEADERS,
-                timeout=10
-            )
+            # Usando endpoint de conexão da instância
+            result = await self.status_cache.get(CONNECT_KEY, max_age=0 if refresh else None)
             
             return {
-                "success": response.status_code in [200, 201],
-                "status_code": response.status_code,
-                "response": response.text[:200] if response.text else None
+                "success": result.status_code in [200, 201],
+                "status_code": result.status_code,
+                "response": result.text[:200] if result.text else None
             }
             
         except Exception as e:
@@ -197,28 +470,54 @@ class WhatsAppService:
                 "error": str(e)
             }
     
-    def get_instance_status(self) -> Dict[str, Any]:
+    async def fetch_connection_statuses(self, max_age: Optional[float] = None) -> Optional[Dict[str, str]]:
         """
-        Obtém o status detalhado da instância WhatsApp
+        Obtém o connectionStatus de todas as instâncias do servidor
         
+        Args:
+            max_age: Idade máxima aceita para o fetchInstances em cache (segundos)
+            
         Returns:
-            Dict: Status detalhado da instância
+            Dict: connectionStatus por nome de instância, ou None se a consulta falhar
         """
         try:
-            # URL para obter status da instância
-            status_url = f"{self.config.BASE_URL}/instance/fetchInstances"
+            result = await self.status_cache.get(INSTANCES_KEY, max_age=max_age)
             
-            response = requests.get(
-                url=status_url,
-                headers=self.config.HEADERS,
-                timeout=10
-            )
+            if result.status_code not in [200, 201]:
+                logger.warning(f"Falha ao consultar status das instâncias: HTTP {result.status_code}")
+                return None
             
-            logger.info(f"Status da consulta: {response.status_code}")
-            logger.debug(f"Resposta status: {response.text}")
+            instances_data = result.data
+            if isinstance(instances_data, dict):
+                instances_data = [instances_data]
+            
+            statuses = {}
+            for instance_raw in instances_data or []:
+                instance_data = instance_raw.get('instance', {})
+                if instance_data.get('instanceName'):
+                    statuses[instance_data['instanceName']] = instance_data.get('connectionStatus', 'unknown')
+            return statuses
+            
+        except Exception as e:
+            logger.warning(f"Falha ao consultar status das instâncias: {str(e)}")
+            return None
+    
+    async def get_instance_status(self, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Obtém o status detalhado da instância WhatsApp
+        
+        Args:
+            refresh: Ignorar o cache e consultar a API
+            
+        Returns:
+            Dict: Status detalhado da instância
+        """
+        try:
+            # Lista de instâncias (fetchInstances) compartilhada via cache
+            response = await self.status_cache.get(INSTANCES_KEY, max_age=0 if refresh else None)
             
             if response.status_code in [200, 201]:
-                instances_data = response.json()
+                instances_data = response.data
                 
                 # Procurar pela instância específica
                 instance_info = None
@@ -264,28 +563,22 @@ class WhatsAppService:
                 "error": str(e)
             }
     
-    def get_whatsapp_connection_status(self) -> Dict[str, Any]:
+    async def get_whatsapp_connection_status(self, refresh: bool = False) -> Dict[str, Any]:
         """
         Verifica especificamente o status da conexão WhatsApp
         
+        Args:
+            refresh: Ignorar o cache e consultar a API
+            
         Returns:
             Dict: Status da conexão WhatsApp
         """
         try:
-            # URL para verificar conexão WhatsApp
-            connection_url = f"{self.config.BASE_URL}/instance/connectionState/{self.config.INSTANCE_ID}"
-            
-            response = requests.get(
-                url=connection_url,
-                headers=self.config.HEADERS,
-                timeout=10
-            )
-            
-            logger.info(f"Status da conexão WhatsApp: {response.status_code}")
-            logger.debug(f"Resposta conexão: {response.text}")
+            # Estado da conexão (connectionState) via cache
+            response = await self.status_cache.get(CONNECTION_STATE_KEY, max_age=0 if refresh else None)
             
             if response.status_code in [200, 201]:
-                connection_data = response.json()
+                connection_data = response.data
                 return {
                     "success": True,
                     "connection_data": connection_data,
@@ -304,28 +597,22 @@ class WhatsAppService:
                 "error": str(e)
             }
     
-    def list_all_instances(self) -> Dict[str, Any]:
+    async def list_all_instances(self, refresh: bool = False) -> Dict[str, Any]:
         """
         Lista todas as instâncias disponíveis no Evolution API
         
+        Args:
+            refresh: Ignorar o cache e consultar a API
+            
         Returns:
             Dict: Lista de todas as instâncias com seus status
         """
         try:
-            # URL para listar todas as instâncias
-            instances_url = f"{self.config.BASE_URL}/instance/fetchInstances"
-            
-            response = requests.get(
-                url=instances_url,
-                headers=self.config.HEADERS,
-                timeout=15
-            )
-            
-            logger.info(f"Status da consulta de instâncias: {response.status_code}")
-            logger.debug(f"Resposta instâncias: {response.text}")
+            # Lista de instâncias (fetchInstances) compartilhada via cache
+            response = await self.status_cache.get(INSTANCES_KEY, max_age=0 if refresh else None)
             
             if response.status_code in [200, 201]:
-                instances_data = response.json()
+                instances_data = response.data
                 
                 # Processar dados das instâncias
                 processed_instances = []
@@ -0,0 +1,473 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from adaptive_rate import AdaptiveRate
+from config import BulkConfig, DatabaseConfig
+from models import BulkMessageRequest, ContactInfo
+from rate_limiter import TokenBucket
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Mensagens reivindicadas por consulta à fila
+CLAIM_BATCH_SIZE = 10
+
+# Mensagens enviadas à fila por comando
+PUSH_BATCH_SIZE = 500
+
+# Tempo (segundos) que os resultados de um job finalizado ficam disponíveis no Redis
+RESULTS_TTL = 86400
+
+# Identificação deste processo nos resultados publicados
+CONSUMER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+def encode_item(seq: int, contact: ContactInfo) -> str:
+    return json.dumps(
+        {"seq": seq, "name": contact.name, "phone": contact.phone, "variables": contact.variables},
+        ensure_ascii=False
+    )
+
+def decode_item(item: str) -> Tuple[int, ContactInfo]:
+    data = json.loads(item)
+    return data["seq"], ContactInfo.model_construct(
+        name=data["name"], phone=data["phone"], variables=data.get("variables")
+    )
+
+class _MemoryJob:
+    __slots__ = ("request", "complete", "ready", "claimed", "results", "results_available")
+
+    def __init__(self, request: Dict[str, Any]):
+        self.request = request
+        self.complete = False
+        self.ready = deque()
+        self.claimed: Dict[str, float] = {}
+        self.results = deque()
+        self.results_available = asyncio.Event()
+
+class MemoryWorkQueue:
+    """
+    Fila de trabalho em memória (um único processo)
+
+    Mesma interface e semântica da RedisWorkQueue: mensagens reivindicadas
+    (claim) ficam invisíveis até serem confirmadas (ack) ou até o fim do
+    prazo de visibilidade, quando voltam para o início da fila.
+    """
+
+    # Os consumidores são sempre o próprio processo
+    distributed = False
+
+    def __init__(self):
+        self.jobs: Dict[str, _MemoryJob] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def put_job(self, job_id: str, request: Dict[str, Any]):
+        self.jobs[job_id] = _MemoryJob(request)
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return {"request": job.request, "complete": job.complete}
+
+    async def mark_complete(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.complete = True
+
+    async def active_jobs(self) -> List[str]:
+        return list(self.jobs)
+
+    async def finish_job(self, job_id: str):
+        self.jobs.pop(job_id, None)
+
+    async def push(self, job_id: str, items: List[str]):
+        self.jobs[job_id].ready.extend(items)
+
+    async def claim(self, job_id: str, count: int, visibility_timeout: float) -> List[str]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return []
+        deadline = time.time() + visibility_timeout
+        claimed = []
+        while job.ready and len(claimed) < count:
+            item = job.ready.popleft()
+            job.claimed[item] = deadline
+            claimed.append(item)
+        return claimed
+
+    async def extend(self, job_id: str, items: List[str], visibility_timeout: float):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        deadline = time.time() + visibility_timeout
+        for item in items:
+            # Só renova as que ainda estão reivindicadas (não confirmadas nem devolvidas à fila)
+            if item in job.claimed:
+                job.claimed[item] = deadline
+
+    async def ack(self, job_id: str, item: str):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.claimed.pop(item, None)
+
+    async def reclaim_expired(self, job_id: str) -> int:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return 0
+        now = time.time()
+        expired = [item for item, deadline in job.claimed.items() if deadline <= now]
+        for item in reversed(expired):
+            del job.claimed[item]
+            job.ready.appendleft(item)
+        return len(expired)
+
+    async def pending_count(self, job_id: str) -> int:
+        job = self.jobs.get(job_id)
+        return len(job.ready) + len(job.claimed) if job is not None else 0
+
+    async def publish_result(self, job_id: str, payload: str):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.results.append(payload)
+            job.results_available.set()
+
+    async def pop_results(self, job_id: str, count: int, timeout: float) -> List[str]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return []
+        if not job.results:
+            job.results_available.clear()
+            try:
+                await asyncio.wait_for(job.results_available.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        popped = []
+        while job.results and len(popped) < count:
+            popped.append(job.results.popleft())
+        return popped
+
+    async def acquire_token(self, key: str, rate: float, burst: int) -> float:
+        """Consome um token do bucket `key`; retorna 0 ou os segundos até haver um token"""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate, burst)
+        elif bucket.rate != rate:
+            bucket.set_rate(rate)
+        if bucket.try_acquire():
+            return 0.0
+        return bucket.time_until_available()
+
+# Reivindica até ARGV[1] mensagens, registrando o prazo de visibilidade ARGV[2]
+CLAIM_SCRIPT = """
+local claimed = {}
+for i = 1, tonumber(ARGV[1]) do
+    local item = redis.call('LPOP', KEYS[1])
+    if not item then break end
+    redis.call('ZADD', KEYS[2], ARGV[2], item)
+    claimed[#claimed + 1] = item
+end
+return claimed
+"""
+
+# Devolve ao início da fila as mensagens com prazo de visibilidade vencido
+RECLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for i = #expired, 1, -1 do
+    redis.call('ZREM', KEYS[1], expired[i])
+    redis.call('LPUSH', KEYS[2], expired[i])
+end
+return #expired
+"""
+
+# Token bucket compartilhado, usando o relógio do Redis
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+class RedisWorkQueue:
+    """
+    Fila de trabalho compartilhada no Redis
+
+    Chaves (prefixo `wq:`): `jobs` (jobs ativos), `job:<id>` (requisição e
+    fim da ingestão), `ready:<id>` (mensagens aguardando), `claimed:<id>`
+    (mensagens reivindicadas, com o prazo de visibilidade como score),
+    `results:<id>` (resultados para o processo dono do job) e `rate:<instância>`
+    (token bucket compartilhado).
+    """
+
+    # Mensagens podem ser enviadas por processos de outros hosts
+    distributed = True
+
+    def __init__(self, redis_url: str, prefix: str = "wq"):
+        self.redis_url = redis_url
+        self.prefix = prefix
+        self.client = None
+        self._claim = None
+        self._reclaim = None
+        self._token_bucket = None
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+
+    async def start(self):
+        self.client = redis_asyncio.from_url(self.redis_url, decode_responses=True)
+        await self.client.ping()
+        self._claim = self.client.register_script(CLAIM_SCRIPT)
+        self._reclaim = self.client.register_script(RECLAIM_SCRIPT)
+        self._token_bucket = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        logger.info(f"Fila de trabalho compartilhada no Redis: {self.redis_url.rsplit('@', 1)[-1]}")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def put_job(self, job_id: str, request: Dict[str, Any]):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key("job", job_id), mapping={"request": json.dumps(request), "complete": "0"})
+            pipe.sadd(self._key("jobs"), job_id)
+            await pipe.execute()
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = await self.client.hgetall(self._key("job", job_id))
+        if not data:
+            return None
+        return {"request": json.loads(data["request"]), "complete": data.get("complete") == "1"}
+
+    async def mark_complete(self, job_id: str):
+        await self.client.hset(self._key("job", job_id), "complete", "1")
+
+    async def active_jobs(self) -> List[str]:
+        return list(await self.client.smembers(self._key("jobs")))
+
+    async def finish_job(self, job_id: str):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.srem(self._key("jobs"), job_id)
+            pipe.delete(self._key("job", job_id), self._key("ready", job_id), self._key("claimed", job_id))
+            pipe.expire(self._key("results", job_id), RESULTS_TTL)
+            await pipe.execute()
+
+    async def push(self, job_id: str, items: List[str]):
+        if items:
+            await self.client.rpush(self._key("ready", job_id), *items)
+
+    async def claim(self, job_id: str, count: int, visibility_timeout: float) -> List[str]:
+        return await self._claim(
+            keys=[self._key("ready", job_id), self._key("claimed", job_id)],
+            args=[count, time.time() + visibility_timeout]
+        )
+
+    async def extend(self, job_id: str, items: List[str], visibility_timeout: float):
+        if items:
+            # XX: só renova as que ainda estão reivindicadas (não confirmadas nem devolvidas à fila)
+            deadline = time.time() + visibility_timeout
+            await self.client.zadd(self._key("claimed", job_id), {item: deadline for item in items}, xx=True)
+
+    async def ack(self, job_id: str, item: str):
+        await self.client.zrem(self._key("claimed", job_id), item)
+
+    async def reclaim_expired(self, job_id: str) -> int:
+        return await self._reclaim(
+            keys=[self._key("claimed", job_id), self._key("ready", job_id)],
+            args=[time.time()]
+        )
+
+    async def pending_count(self, job_id: str) -> int:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.llen(self._key("ready", job_id))
+            pipe.zcard(self._key("claimed", job_id))
+            ready, claimed = await pipe.execute()
+        return ready + claimed
+
+    async def publish_result(self, job_id: str, payload: str):
+        await self.client.rpush(self._key("results", job_id), payload)
+
+    async def pop_results(self, job_id: str, count: int, timeout: float) -> List[str]:
+        key = self._key("results", job_id)
+        first = await self.client.blpop([key], timeout=timeout)
+        if first is None:
+            return []
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, count - 2)
+            pipe.ltrim(key, count - 1, -1)
+            rest, _ = await pipe.execute()
+        return [first[1], *rest]
+
+    async def acquire_token(self, key: str, rate: float, burst: int) -> float:
+        """Consome um token do bucket `key`; retorna 0 ou os segundos até haver um token"""
+        return float(await self._token_bucket(keys=[self._key(key)], args=[rate, burst]))
+
+def open_work_queue(backend: str = BulkConfig.WORK_QUEUE, redis_url: Optional[str] = DatabaseConfig.REDIS_URL):
+    """Cria a fila de trabalho configurada (None para execução local dos jobs)"""
+    if backend == "memory":
+        return MemoryWorkQueue()
+    if backend != "redis":
+        return None
+    if not redis_url:
+        logger.warning("BULK_WORK_QUEUE=redis sem REDIS_URL; usando fila em memória")
+        return MemoryWorkQueue()
+    if redis_asyncio is None:
+        logger.warning("Pacote redis não instalado; usando fila em memória (apenas este processo)")
+        return MemoryWorkQueue()
+    return RedisWorkQueue(redis_url)
+
+class ClaimedWork:
+    """
+    Mensagens de um job reivindicadas da fila por este processo
+
+    É ao mesmo tempo a fonte de contatos (pares seq/contato) e o registro de
+    resultados do BulkSender: cada resultado é publicado para o processo dono
+    do job e a mensagem é confirmada (ack) na fila. Enquanto aguardam o limite
+    de taxa ou o envio, as mensagens reivindicadas têm o prazo de visibilidade
+    renovado periodicamente (a cada terço do prazo), para não serem devolvidas
+    à fila e enviadas de novo por outro consumidor; só as de um processo que
+    parou voltam à fila.
+
+    Com taxa adaptativa, cada resultado leva também o estado dos controladores
+    deste processo, exibido pelo processo dono no status do job.
+    """
+
+    numbered = True
+
+    def __init__(self, queue, job_id: str, visibility_timeout: float = BulkConfig.VISIBILITY_TIMEOUT,
+                 poll_interval: float = BulkConfig.QUEUE_POLL_INTERVAL, adaptive: Optional[AdaptiveRate] = None):
+        self.queue = queue
+        self.job_id = job_id
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.adaptive = adaptive
+        self.claimed: Dict[int, str] = {}
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[int, ContactInfo]]:
+        heartbeat = asyncio.create_task(self._renew_leases())
+        try:
+            while True:
+                await self.queue.reclaim_expired(self.job_id)
+                items = await self.queue.claim(self.job_id, CLAIM_BATCH_SIZE, self.visibility_timeout)
+                for item in items:
+                    seq, contact = decode_item(item)
+                    self.claimed[seq] = item
+                    yield seq, contact
+                if items:
+                    continue
+
+                job = await self.queue.get_job(self.job_id)
+                if job is None:
+                    # Job finalizado ou cancelado pelo processo dono
+                    return
+                if job["complete"] and await self.queue.pending_count(self.job_id) == 0:
+                    return
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            heartbeat.cancel()
+
+    async def _renew_leases(self):
+        """Renova o prazo de visibilidade das mensagens reivindicadas ainda não concluídas"""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await self.queue.extend(self.job_id, list(self.claimed.values()), self.visibility_timeout)
+            except Exception as e:
+                logger.error(f"Erro ao renovar mensagens reivindicadas do job {self.job_id}: {str(e)}")
+
+    async def sending(self, seq: int, instance: Optional[str]):
+        # O envio (com as tentativas) tem o prazo inteiro, contado a partir de agora
+        item = self.claimed.get(seq)
+        if item is not None:
+            await self.queue.extend(self.job_id, [item], self.visibility_timeout)
+
+    async def finished(self, seq: int, result: Dict[str, Any]):
+        payload = {"seq": seq, "result": result}
+        if self.adaptive is not None:
+            payload["consumer"] = CONSUMER_ID
+            payload["adaptive"] = self.adaptive.instances_dict()
+        await self.queue.publish_result(self.job_id, json.dumps(payload, ensure_ascii=False))
+        item = self.claimed.pop(seq, None)
+        if item is not None:
+            await self.queue.ack(self.job_id, item)
+
+class QueueConsumer:
+    """
+    Consumidor da fila compartilhada executado em cada processo
+
+    Procura periodicamente os jobs ativos e, para cada um, executa um
+    BulkSender alimentado pelas mensagens que este processo reivindica. Os
+    limites de taxa por instância ficam na fila, valendo para todos os
+    processos ao mesmo tempo.
+    """
+
+    def __init__(self, whatsapp_service, queue, poll_interval: float = BulkConfig.QUEUE_POLL_INTERVAL,
+                 visibility_timeout: float = BulkConfig.VISIBILITY_TIMEOUT):
+        self.whatsapp_service = whatsapp_service
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.running: Dict[str, asyncio.Task] = {}
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    for job_id in await self.queue.active_jobs():
+                        if job_id not in self.running:
+                            self.running[job_id] = asyncio.create_task(self._consume(job_id))
+                except Exception as e:
+                    logger.error(f"Erro ao consultar a fila de trabalho: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            tasks = list(self.running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _consume(self, job_id: str):
+        try:
+            job = await self.queue.get_job(job_id)
+            if job is None:
+                return
+            request = BulkMessageRequest.model_construct(**{**job["request"], "contacts": []})
+            adaptive = AdaptiveRate() if request.adaptive_rate else None
+            work = ClaimedWork(self.queue, job_id, self.visibility_timeout, self.poll_interval, adaptive)
+            async for _ in self.whatsapp_service.iter_bulk_messages(
+                request, contacts=work, journal=work, shared_rate_limits=self.queue, adaptive=adaptive
+            ):
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao consumir mensagens do job {job_id}: {str(e)}")
+        finally:
+            self.running.pop(job_id, None)